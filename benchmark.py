@@ -0,0 +1,487 @@
+"""Benchmarks for Nobu's hot paths.
+
+Generates synthetic Python, JavaScript, CSS, HTML and JSON files of the
+requested sizes, times the editor's real code paths on them and reports
+percentiles as JSON. The Tk benchmarks need a display; without one an Xvfb
+server is started if it is installed. --headless runs only the benchmarks
+that do not need Tk.
+
+    python benchmark.py --sizes 1K,64K,1M --output results.json
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.2
+
+With --baseline the exit status is 1 if any p50 got slower than the
+baseline by more than the threshold.
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+LANGUAGES = {'python': '.py', 'javascript': '.js', 'css': '.css', 'html': '.html', 'json': '.json'}
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'value', 'result', 'index', 'item', 'count', 'name', 'data', 'foo']
+
+def parse_size(text):
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def size_label(size):
+    for unit, scale in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return str(size)
+
+def python_block(rng):
+    name, arg = rng.choice(WORDS), rng.choice(WORDS)
+    return (
+        f"def {name}_{rng.randint(0, 9999)}({arg}, count=10):\n"
+        f"    \"\"\"Return the {name} of {arg}.\"\"\"\n"
+        f"    total = 0  # running total\n"
+        f"    for index in range(count):\n"
+        f"        if {arg} is not None and index % {rng.randint(2, 9)} == 0:\n"
+        f"            total += len(str({arg})) * {rng.random():.4f}\n"
+        f"    print(f'{name}: {{total}}', 'done')\n"
+        f"    return total\n\n"
+    )
+
+def javascript_block(rng):
+    name = rng.choice(WORDS)
+    return (
+        f"/* {name} helper */\n"
+        f"function {name}{rng.randint(0, 9999)}(items) {{\n"
+        f"    const result = [];\n"
+        f"    for (let i = 0; i < items.length; i++) {{\n"
+        f"        if (items[i] !== null) result.push(`${{items[i]}}-{name}`);\n"
+        f"    }}\n"
+        f"    return result.length > {rng.randint(0, 99)} ? true : false; // check\n"
+        f"}}\n\n"
+    )
+
+def css_block(rng):
+    name = rng.choice(WORDS)
+    return (
+        f".{name}-{rng.randint(0, 9999)} > a:hover {{\n"
+        f"    color: #{rng.randint(0, 0xFFFFFF):06x};\n"
+        f"    margin: {rng.randint(0, 40)}px {rng.randint(0, 40)}px;\n"
+        f"    font-family: \"Consolas\", monospace; /* code */\n"
+        f"}}\n\n"
+    )
+
+def html_block(rng):
+    name = rng.choice(WORDS)
+    return (
+        f"<!-- {name} section -->\n"
+        f"<div class=\"{name}\" id=\"{name}-{rng.randint(0, 9999)}\">\n"
+        f"    <p>Some <b>{name}</b> text with a <a href=\"#{name}\">link</a>.</p>\n"
+        f"</div>\n"
+    )
+
+def json_block(rng):
+    name = rng.choice(WORDS)
+    return (
+        f"  {{\"name\": \"{name}\", \"id\": {rng.randint(0, 99999)}, \"score\": {rng.random():.5f}, "
+        f"\"active\": {rng.choice(['true', 'false', 'null'])}, \"tags\": [\"{rng.choice(WORDS)}\"]}},\n"
+    )
+
+GENERATORS = {
+    'python': python_block,
+    'javascript': javascript_block,
+    'css': css_block,
+    'html': html_block,
+    'json': json_block,
+}
+
+def generate(language, size, seed=0):
+    # Deterministic synthetic source of roughly size characters
+    rng = random.Random(f"{language}-{size}-{seed}")
+    block = GENERATORS[language]
+    parts = ['[\n'] if language == 'json' else []
+    total = sum(len(part) for part in parts)
+    while total < size:
+        part = block(rng)
+        parts.append(part)
+        total += len(part)
+    text = ''.join(parts)[:size]
+    if language == 'json':
+        text = text[:text.rfind('},\n') + 1] + '\n]\n' if '},\n' in text else '[]\n'
+    return text
+
+def write_files(directory, languages, sizes):
+    files = {}
+    for language in languages:
+        for size in sizes:
+            path = os.path.join(directory, f"{language}_{size_label(size)}{LANGUAGES[language]}")
+            with open(path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(generate(language, size))
+            files[language, size] = path
+    return files
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))]
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'min': min(samples),
+        'p50': percentile(samples, 0.50),
+        'p90': percentile(samples, 0.90),
+        'p99': percentile(samples, 0.99),
+        'max': max(samples),
+        'mean': sum(samples) / len(samples),
+    }
+
+class Runner:
+    """Collects timings under names like 'lexer/python/1M'."""
+
+    def __init__(self, repeat, verbose=True):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = {}
+
+    def repeats_for(self, size):
+        # Fewer rounds for the big files; a 100 MB round takes a while
+        if size >= 50 * 1024 ** 2:
+            return 1
+        if size >= 5 * 1024 ** 2:
+            return min(self.repeat, 3)
+        return self.repeat
+
+    def record(self, name, samples):
+        self.results[name] = summarize(samples)
+        if self.verbose:
+            stats = self.results[name]
+            print(f"{name:45} p50 {stats['p50'] * 1000:10.2f} ms   p99 {stats['p99'] * 1000:10.2f} ms",
+                  file=sys.stderr)
+
+    def time(self, name, function, repeat, setup=None):
+        samples = []
+        for _ in range(repeat):
+            state = setup() if setup else None
+            start = time.perf_counter()
+            function(state)
+            samples.append(time.perf_counter() - start)
+        self.record(name, samples)
+
+def run_headless(runner, nobu, files, work_dir):
+    # Benchmarks of the Tk-free parts: lexing, the Document and saving
+    from types import SimpleNamespace
+    app = SimpleNamespace(language_keywords=nobu.default_language_keywords())
+    for (language, size), path in files.items():
+        label = f"{language}/{size_label(size)}"
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        repeat = runner.repeats_for(size)
+        lexer = nobu.Lexer(app.language_keywords[language])
+
+        runner.time(f"lex/{label}", lambda _: lexer.slices(text, None, 1, 500), repeat)
+        runner.time(f"document_build/{label}", lambda _: nobu.Document(text), repeat)
+
+        document = nobu.Document(text)
+        rng = random.Random(size)
+        def insert_keys(_):
+            for _ in range(1000):
+                document.insert(rng.randint(0, len(document)), 'x')
+        runner.time(f"document_1000_inserts/{label}", insert_keys, repeat)
+
+        target = os.path.join(work_dir, f"save_{language}")
+        runner.time(f"write_atomically/{label}",
+                    lambda _: nobu.write_atomically(target, document.chunks()), repeat)
+
+        colors = {token_type: '#808080' for token_type in lexer.token_types}
+        colors.update(bg='#000000', fg='#ffffff')
+        export_target = os.path.join(work_dir, f"export_{language}.html")
+        runner.time(f"export_html/{label}", lambda _: nobu.write_atomically(
+            export_target, nobu.export_highlighted(document.chunks(), lexer, colors, 'html')), repeat)
+
+        states, types, counts, runs = nobu.TokenCache.encode(lexer, text)
+        runner.time(f"token_cache_decode/{label}",
+                    lambda _: nobu.TokenCache.decode(runs, types, counts, 500), repeat)
+
+        lines = text.split('\n')
+        def build_completions(_):
+            index = nobu.CompletionIndex()
+            index.replace_lines(1, 0, lines, touched=False)
+            return index
+        runner.time(f"completion_index_build/{label}", build_completions, repeat)
+        completions = build_completions(None)
+        vocabulary = nobu.language_vocabulary(app.language_keywords[language])
+        def complete(_):
+            for prefix in ('s', 're', 'ti'):
+                nobu.rank_completions(prefix, [completions], vocabulary)
+        runner.time(f"completion_query/{label}", complete, runner.repeat)
+
+        spec = app.language_keywords[language]
+        structure_lexer = nobu.Lexer({
+            'patterns': {t: p for t, p in spec['patterns'].items() if t in nobu.Lexer.PRECEDENCE},
+            'multiline': spec.get('multiline', []),
+        })
+        records = nobu.scan_structure(structure_lexer, text, None, language)
+        runner.time(f"structure_scan/{label}",
+                    lambda _: nobu.scan_structure(structure_lexer, text, None, language), repeat)
+        blocks = nobu.BlockIndex()
+        blocks.replace(1, 0, records)
+        def fold_queries(_):
+            for _ in range(1000):
+                blocks.fold_range(rng.randint(1, len(records)))
+        runner.time(f"structure_1000_fold_queries/{label}", fold_queries, runner.repeat)
+
+    # The batch mode end to end, a process per run as scripts use it
+    core = os.path.join(os.path.dirname(os.path.abspath(nobu.__file__)), 'nobu_core.py')
+    smallest = min(files.items(), key=lambda item: item[0][1])[1]
+    def batch(*args):
+        subprocess.run([sys.executable, core, *args], stdout=subprocess.DEVNULL, check=True)
+    runner.time("batch_startup", lambda _: batch('--jobs', '1', smallest), runner.repeat)
+    runner.time("batch_count_all", lambda _: batch(*files.values()), 1)
+
+    # The symbol index over all the generated files, then fuzzy queries on it
+    from concurrent.futures import ThreadPoolExecutor
+    index = nobu.SymbolIndex(os.path.join(work_dir, 'symbols.db'))
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        runner.time("symbol_index_build", lambda _: index.update(pool, paths=files.values()).result(), 1)
+    index.query('').result()  # loads the names
+    for query in ('alpha_1', 'dlt9', 'xyz'):
+        runner.time(f"symbol_query/{query}", lambda _: index.query(query).result(), runner.repeat)
+
+def start_xvfb():
+    # Start a virtual X server for the Tk benchmarks; returns False if there is none
+    xvfb = shutil.which('Xvfb')
+    if not xvfb:
+        return False
+    for display in range(99, 120):
+        if os.path.exists(f"/tmp/.X11-unix/X{display}"):
+            continue
+        process = subprocess.Popen(
+            [xvfb, f":{display}", '-screen', '0', '1600x1200x24', '-nolisten', 'tcp'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        atexit.register(process.terminate)
+        os.environ['DISPLAY'] = f":{display}"
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(f"/tmp/.X11-unix/X{display}"):
+                return True
+            time.sleep(0.05)
+        process.terminate()
+    return False
+
+def run_tk(runner, nobu, files, tabs_for_theme, keystrokes):
+    import tkinter as tk
+
+    # Dialogs would block the loop
+    nobu.messagebox.showinfo = lambda *args, **kwargs: None
+    nobu.messagebox.showwarning = lambda *args, **kwargs: None
+
+    root = tk.Tk()
+    root.geometry('1200x800')
+    app = nobu.Nobu(root)
+    app.pack(fill=tk.BOTH, expand=True)
+    app.config['large_file_threshold'] = 8 * 1024 * 1024
+    app.token_cache.max_size = 0  # measure real work, not cache hits
+    app.config['hibernate_after'] = 10 ** 9  # keep every tab live while measuring
+    app.config['tab_memory_budget'] = 1 << 62
+    app.auto_saver.delay_ms = lambda: 10 ** 9
+    root.update()
+
+    def current_tab():
+        return app.notebook.nametowidget(app.notebook.select()).winfo_children()[0]
+
+    def busy(tab):
+        scheduler = tab.highlight_scheduler
+        return (tab.loader is not None or scheduler.pending is not None or scheduler.future is not None
+                or scheduler.slices or scheduler.cached is not None or scheduler.cached_runs
+                or tab.highlighter.dirty_first is not None)
+
+    def wait_idle(tabs, timeout=900):
+        # Run the Tk loop until the tabs have nothing left to load or highlight
+        deadline = time.monotonic() + timeout
+        while any(busy(tab) for tab in tabs):
+            if time.monotonic() > deadline:
+                raise RuntimeError('timed out waiting for the editor to go idle')
+            root.update()
+            time.sleep(0.0005)
+        root.update_idletasks()
+
+    def close_all():
+        # Close every tab but the untitled one the editor starts with
+        while len(app.notebook.tabs()) > 1:
+            container = app.notebook.tabs()[-1]
+            app.notebook.select(container)
+            tab = current_tab()
+            tab.text_area.edit_modified(False)
+            tab.is_modified = False
+            app.close_current_tab()
+            app.notebook.nametowidget(container).destroy()
+        root.update()
+
+    for (language, size), path in files.items():
+        label = f"{language}/{size_label(size)}"
+        repeat = runner.repeats_for(size)
+
+        def open_to_idle(_):
+            wait_idle([app.open_path(path)])
+        runner.time(f"open_file/{label}", open_to_idle, repeat, setup=close_all)
+
+        close_all()
+        tab = app.open_path(path)
+        wait_idle([tab])
+
+        def highlight(_):
+            tab.syntax_highlight()
+            wait_idle([tab])
+        runner.time(f"syntax_highlight/{label}", highlight, repeat)
+
+        def line_numbers(_):
+            tab.text_area.yview_moveto(random.random())
+            tab.line_numbers.redraw(force=True)
+            root.update_idletasks()
+        runner.time(f"update_line_numbers/{label}", line_numbers, max(repeat, 20))
+
+        def modify(_):
+            tab.text_area.insert('1.0', '\n')
+            tab.text_area.delete('1.0')
+            wait_idle([tab])
+        runner.time(f"save_file/{label}", lambda _: app.save_file(tab), repeat, setup=modify)
+
+        dialog = nobu.FindReplaceDialog(root, tab)
+        dialog.regex_var.set(False)
+        dialog.find_entry.insert(0, 'a')
+        dialog.replace_entry.insert(0, 'A')
+        def undo_replace():
+            if tab.text_area.edit_modified():
+                tab.undo_history.undo()
+            wait_idle([tab])
+        runner.time(f"replace_all/{label}", lambda _: dialog.replace_all(), repeat, setup=undo_replace)
+        dialog.destroy()
+        undo_replace()
+
+        samples = []
+        tab.text_area.mark_set('insert', f"{tab.highlighter.line_count() // 2}.0")
+        for _ in range(keystrokes):
+            start = time.perf_counter()
+            tab.text_area.insert('insert', 'x')
+            wait_idle([tab])
+            samples.append(time.perf_counter() - start)
+        runner.record(f"keystroke_to_idle/{label}", samples)
+
+        def undo_redo(_):
+            tab.undo_history.undo()
+            tab.undo_history.redo()
+            wait_idle([tab])
+        runner.time(f"undo_redo/{label}", undo_redo, repeat)
+
+        if size <= 1024 ** 2:
+            close_all()
+            theme_tabs = []
+            for _ in range(tabs_for_theme):
+                theme_tabs.append(app.open_path(path))
+            wait_idle(theme_tabs)
+            themes = list(app.themes)
+            def switch_theme(_):
+                app.change_theme(themes[(themes.index(app.config['theme']) + 1) % len(themes)])
+                wait_idle(theme_tabs)
+            runner.time(f"change_theme_{tabs_for_theme}_tabs/{label}", switch_theme, repeat)
+        close_all()
+
+    root.destroy()
+
+def compare(results, baseline, threshold):
+    # Lines describing each result against the baseline, and whether any regressed
+    lines = []
+    regressed = False
+    for name, stats in sorted(results.items()):
+        old = baseline.get(name)
+        if not old or not old.get('p50'):
+            continue
+        ratio = stats['p50'] / old['p50']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  REGRESSION'
+            regressed = True
+        elif ratio < 1 - threshold:
+            mark = '  faster'
+        lines.append(f"{name:45} {old['p50'] * 1000:10.2f} -> {stats['p50'] * 1000:10.2f} ms  x{ratio:.2f}{mark}")
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Nobu's hot paths.")
+    parser.add_argument('--sizes', default='1K,64K,1M,10M,100M',
+                        help='comma separated file sizes, e.g. 1K,64K,1M (default: %(default)s)')
+    parser.add_argument('--languages', default=','.join(LANGUAGES),
+                        help='comma separated languages (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='rounds per benchmark (default: %(default)s)')
+    parser.add_argument('--keystrokes', type=int, default=50, help='keystrokes per file (default: %(default)s)')
+    parser.add_argument('--theme-tabs', type=int, default=20, help='tabs open while switching themes')
+    parser.add_argument('--headless', action='store_true', help='skip the benchmarks that need Tk')
+    parser.add_argument('--output', help='write results JSON here instead of stdout')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p50 slowdown that counts as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size]
+    languages = [language for language in args.languages.split(',') if language]
+    for language in languages:
+        if language not in LANGUAGES:
+            parser.error(f"unknown language: {language}")
+
+    # Keep the editor's config and caches out of the real home directory
+    work_dir = tempfile.mkdtemp(prefix='nobu-bench-')
+    atexit.register(shutil.rmtree, work_dir, True)
+    os.environ['HOME'] = work_dir
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import nobu
+
+    files = write_files(work_dir, languages, sizes)
+    runner = Runner(args.repeat)
+    run_headless(runner, nobu, files, work_dir)
+    if not args.headless:
+        if not os.environ.get('DISPLAY') and not start_xvfb():
+            print('No display and no Xvfb; run under xvfb-run or pass --headless', file=sys.stderr)
+            return 2
+        run_tk(runner, nobu, files, args.theme_tabs, args.keystrokes)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': [size_label(size) for size in sizes],
+            'headless': args.headless,
+        },
+        'results': runner.results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        lines, regressed = compare(runner.results, baseline, args.threshold)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressed:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
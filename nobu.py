@@ -1,714 +1,5671 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, simpledialog
-from tkinter.scrolledtext import ScrolledText
-import re
-import os
-import json
-import threading
-import time
-from pathlib import Path
-import keyword
-import importlib
-import ast
-
-class Nobu(tk.Frame):
-    def __init__(self, root):
-        super().__init__(root)
-        self.root = root
-        self.root.title("Nobu - Code Editor")
-        self.root.geometry("1200x800")
-        
-        self.config_path = Path.home() / '.nobu_editor_config.json'
-        self.config = self.load_config()
-        
-        self.themes = {
-            "default": {
-                "bg": "white",
-                "fg": "black",
-                "keyword": "blue",
-                "builtin": "purple",
-                "string": "green",
-                "comment": "gray",
-                "number": "orange",
-                "tag": "#0000FF",
-                "attribute": "#FF00FF",
-                "selector": "#A0A000",
-                "property": "#00A0A0",
-                "value": "#0000A0",
-                "punctuation": "#808080"
-            },
-            "dark": {
-                "bg": "#282c34",
-                "fg": "#abb2bf",
-                "keyword": "#c678dd",
-                "builtin": "#61afef",
-                "string": "#98c379",
-                "comment": "#5c6370",
-                "number": "#d19a66",
-                "tag": "#61afef",
-                "attribute": "#c678dd",
-                "selector": "#98c379",
-                "property": "#56b6c2",
-                "value": "#61afef",
-                "punctuation": "#abb2bf"
-            },
-            "light": {
-                "bg": "#f5f5f5",
-                "fg": "#333333",
-                "keyword": "#0000ff",
-                "builtin": "#800080",
-                "string": "#008000",
-                "comment": "#808080",
-                "number": "#ff8c00",
-                "tag": "#0000FF",
-                "attribute": "#FF00FF",
-                "selector": "#A0A000",
-                "property": "#00A0A0",
-                "value": "#0000A0",
-                "punctuation": "#808080"
-            }
-        }
-        
-        self.language_keywords = {
-            'python': {
-                'keywords': set(keyword.kwlist),
-                'builtins': set(dir(__builtins__)),
-                'patterns': {
-                    'keywords': r'\b(def|class|if|else|elif|for|while|try|except|import|from|as|return|break|continue)\b',
-                    'builtin': r'\b(print|len|str|int|float|list|dict|set|tuple|range|enumerate|zip)\b',
-                    'string': r'(\".*?\"|\'.*?\')',
-                    'comment': r'(#.*$)',
-                    'numbers': r'\b(\d+)\b'
-                }
-            },
-            'html': {
-                'patterns': {
-                    'tag': r'(<[^>]*>)',
-                    'attribute': r'\s([a-zA-Z-]+)=',
-                    'string': r'(\".*?\"|\'.*?\')',
-                    'comment': r'(<!--[\s\S]*?-->)'
-                }
-            },
-            'css': {
-                'patterns': {
-                    'selector': r'([^\{\}]+)\{',
-                    'property': r'([\w-]+)\s*:',
-                    'value': r':\s*([^;]+);',
-                    'comment': r'(/\*[\s\S]*?\*/)',
-                    'numbers': r'\b(\d+\.?\d*)\b'
-                }
-            },
-            'javascript': {
-                'patterns': {
-                    'keywords': r'\b(function|var|let|const|if|else|for|while|do|switch|case|break|return|try|catch|finally|class|extends|new|this)\b',
-                    'builtin': r'\b(console|document|window|Array|Object|String|Number|Boolean|Function|Symbol|RegExp)\b',
-                    'string': r'(\".*?\"|\'.*?\'|`[\s\S]*?`)',
-                    'comment': r'(/\*[\s\S]*?\*/|//.*$)',
-                    'numbers': r'\b(\d+\.?\d*)\b'
-                }
-            },
-            'json': {
-                'patterns': {
-                    'string': r'(\".*?\")',
-                    'numbers': r'\b(\d+\.?\d*)\b',
-                    'keywords': r'\b(true|false|null)\b',
-                    'punctuation': r'([\{\}\[\],:])'
-                }
-            }
-        }
-
-        # Initialize zoom level
-        self.current_zoom = 100  # percentage
-        
-        self.setup_ui()
-        self.setup_menus()
-        self.setup_shortcuts()
-        self.setup_auto_save()
-        
-        # Bind mouse wheel for zooming
-        self.root.bind("<Control-MouseWheel>", self.mouse_wheel_zoom)
-
-    def mouse_wheel_zoom(self, event):
-        if event.delta > 0:
-            self.zoom_in()
-        else:
-            self.zoom_out()
-
-    def load_config(self):
-        default_config = {
-            'theme': 'dark',
-            'font': ('Consolas', 12),
-            'auto_save_interval': 300,  # 5 minutes
-            'recent_files': [],
-            'code_snippets': {}
-        }
-        
-        try:
-            if self.config_path.exists():
-                with open(self.config_path, 'r') as f:
-                    config = json.load(f)
-                    return {**default_config, **config}
-            return default_config
-        except Exception as e:
-            print(f"Config load error: {e}")
-            return default_config
-
-    def save_config(self):
-        try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f)
-        except Exception as e:
-            print(f"Config save error: {e}")
-
-    def setup_ui(self):
-        # Main container
-        self.main_container = ttk.Frame(self)
-        self.main_container.pack(fill=tk.BOTH, expand=True)
-
-        # Create notebook for tabs
-        self.notebook = ttk.Notebook(self.main_container)
-        self.notebook.pack(fill=tk.BOTH, expand=True)
-
-        # Status bar at the bottom
-        self.status_bar = ttk.Label(self.root, text="Nobu - Ready", anchor=tk.W, relief=tk.SUNKEN)
-        self.status_bar.pack(fill=tk.X, side=tk.BOTTOM)
-
-        # Initial tab
-        self.new_file()
-
-    def setup_menus(self):
-        # Create a menu bar
-        menubar = tk.Menu(self.root)
-        self.root.config(menu=menubar)
-
-        # File menu
-        file_menu = tk.Menu(menubar, tearoff=0)
-        file_menu.add_command(label="New", command=self.new_file, accelerator="Ctrl+N")
-        file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
-        file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
-        file_menu.add_command(label="Save As", command=self.save_as_file, accelerator="Ctrl+Shift+S")
-        file_menu.add_separator()
-        file_menu.add_command(label="Print to File", command=self.print_to_file)
-        file_menu.add_separator()
-        file_menu.add_command(label="Close Tab", command=self.close_current_tab, accelerator="Ctrl+W")
-        file_menu.add_command(label="Exit", command=self.root.quit)
-        menubar.add_cascade(label="File", menu=file_menu)
-
-        # Edit menu
-        edit_menu = tk.Menu(menubar, tearoff=0)
-        edit_menu.add_command(label="Find", command=self.show_find_replace_dialog, accelerator="Ctrl+F")
-        edit_menu.add_command(label="Go To Line", command=self.go_to_line)
-        menubar.add_cascade(label="Edit", menu=edit_menu)
-
-        # View menu
-        view_menu = tk.Menu(menubar, tearoff=0)
-        view_menu.add_command(label="Zoom In", command=self.zoom_in, accelerator="Ctrl++")
-        view_menu.add_command(label="Zoom Out", command=self.zoom_out, accelerator="Ctrl+-")
-        view_menu.add_command(label="Reset Zoom", command=self.zoom_reset, accelerator="Ctrl+0")
-        menubar.add_cascade(label="View", menu=view_menu)
-
-        # Language menu
-        language_menu = tk.Menu(menubar, tearoff=0)
-        for lang in self.language_keywords.keys():
-            language_menu.add_command(
-                label=lang.capitalize(),
-                command=lambda l=lang: self.change_language(l)
-            )
-        menubar.add_cascade(label="Language", menu=language_menu)
-
-    def print_to_file(self):
-        current = self.notebook.select()
-        if current:
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-            content = tab.text_area.get('1.0', tk.END)
-            
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Text Files", "*.txt"), ("All Files", "*.*")]
-            )
-            
-            if filename:
-                try:
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    self.status_bar.config(text=f"Content printed to: {filename}")
-                except Exception as e:
-                    messagebox.showerror("Print Error", str(e))
-
-    def new_file(self):
-        # Create a new tab container
-        tab_container = ttk.Frame(self.notebook)
-        
-        # Create the CodeTab instance
-        code_tab = CodeTab(tab_container, self)
-        code_tab.pack(fill=tk.BOTH, expand=True)
-        
-        # Add the tab to notebook
-        tab_name = f"Untitled-{len(self.notebook.tabs())+1}"
-        self.notebook.add(tab_container, text=tab_name)
-        
-        # Select the new tab
-        self.notebook.select(tab_container)
-        self.status_bar.config(text="New file created")
-
-    def open_file(self):
-        filename = filedialog.askopenfilename(
-            filetypes=[
-                ("Python Files", "*.py"),
-                ("HTML Files", "*.html"),
-                ("CSS Files", "*.css"),
-                ("JavaScript Files", "*.js"),
-                ("JSON Files", "*.json"),
-                ("Text Files", "*.txt"),
-                ("All Files", "*.*")
-            ]
-        )
-        
-        if filename:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Create new tab container
-                tab_container = ttk.Frame(self.notebook)
-                
-                # Create the CodeTab instance
-                code_tab = CodeTab(tab_container, self, filename, content)
-                code_tab.pack(fill=tk.BOTH, expand=True)
-                
-                # Add the tab to notebook with the filename as title
-                self.notebook.add(tab_container, text=os.path.basename(filename))
-                self.notebook.select(tab_container)
-                
-                # Update recent files
-                if filename not in self.config['recent_files']:
-                    self.config['recent_files'].append(filename)
-                    self.save_config()
-                
-                self.status_bar.config(text=f"Opened: {filename}")
-            except Exception as e:
-                messagebox.showerror("Open Error", str(e))
-
-    def save_file(self, tab=None):
-        if not tab:
-            current = self.notebook.select()
-            if not current:
-                return False
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-        
-        if not hasattr(tab, 'filename') or not tab.filename:
-            return self.save_as_file(tab)
-        
-        try:
-            with open(tab.filename, 'w', encoding='utf-8') as f:
-                f.write(tab.text_area.get('1.0', tk.END))
-            tab.is_modified = False
-            self.status_bar.config(text=f"Saved: {tab.filename}")
-            return True
-        except Exception as e:
-            messagebox.showerror("Save Error", str(e))
-            return False
-
-    def save_as_file(self, tab=None):
-        if not tab:
-            current = self.notebook.select()
-            if not current:
-                return False
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-        
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".py",
-            filetypes=[
-                ("Python Files", "*.py"),
-                ("HTML Files", "*.html"),
-                ("CSS Files", "*.css"),
-                ("JavaScript Files", "*.js"),
-                ("JSON Files", "*.json"),
-                ("Text Files", "*.txt"),
-                ("All Files", "*.*")
-            ]
-        )
-        
-        if filename:
-            try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(tab.text_area.get('1.0', tk.END))
-                
-                tab.filename = filename
-                tab.is_modified = False
-                
-                # Update tab title
-                current = self.notebook.select()
-                self.notebook.tab(current, text=os.path.basename(filename))
-                
-                self.status_bar.config(text=f"Saved: {filename}")
-                return True
-            except Exception as e:
-                messagebox.showerror("Save Error", str(e))
-                return False
-
-    def close_current_tab(self):
-        if len(self.notebook.tabs()) > 1:
-            current = self.notebook.select()
-            self.notebook.forget(current)
-            self.status_bar.config(text="Tab closed")
-        else:
-            messagebox.showinfo("Info", "Cannot close the last tab")
-
-    def go_to_line(self):
-        current = self.notebook.select()
-        if current:
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-            line_number = simpledialog.askinteger("Go To Line", "Enter line number:")
-            if line_number:
-                try:
-                    tab.text_area.mark_set(tk.INSERT, f"{line_number}.0")
-                    tab.text_area.see(tk.INSERT)
-                    # Highlight the line
-                    tab.text_area.tag_remove('highlight_line', '1.0', tk.END)
-                    tab.text_area.tag_add('highlight_line', f"{line_number}.0", f"{line_number}.end+1c")
-                    tab.text_area.tag_config('highlight_line', background='yellow')
-                except tk.TclError:
-                    messagebox.showwarning("Warning", "Line number out of range")
-
-    def show_find_replace_dialog(self):
-        current = self.notebook.select()
-        if current:
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-            FindReplaceDialog(self.root, tab.text_area)
-
-    def change_theme(self, theme_name):
-        self.config['theme'] = theme_name
-        theme = self.themes[theme_name]
-        
-        for tab_id in self.notebook.tabs():
-            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
-            tab.text_area.configure(
-                bg=theme['bg'], 
-                fg=theme['fg']
-            )
-            tab.syntax_highlight()
-        
-        self.save_config()
-
-    def zoom_in(self, event=None):
-        if self.current_zoom < 200:  # Maximum 200%
-            self.current_zoom += 10
-            self.apply_zoom()
-
-    def zoom_out(self, event=None):
-        if self.current_zoom > 50:  # Minimum 50%
-            self.current_zoom -= 10
-            self.apply_zoom()
-
-    def zoom_reset(self, event=None):
-        self.current_zoom = 100
-        self.apply_zoom()
-
-    def apply_zoom(self):
-        current = self.notebook.select()
-        if current:
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-            font = list(self.config['font'])
-            font_size = int(12 * self.current_zoom / 100)
-            font[1] = font_size
-            
-            # Update both text area and line numbers font
-            tab.text_area.configure(font=tuple(font))
-            tab.line_numbers.configure(font=tuple(font))
-            
-            # Update line numbers width based on total lines
-            total_lines = tab.text_area.get('1.0', tk.END).count('\n')
-            width = len(str(total_lines)) + 1
-            tab.line_numbers.configure(width=width)
-            
-            self.status_bar.config(text=f"Zoom: {self.current_zoom}%")
-
-    def change_language(self, language):
-        current = self.notebook.select()
-        if current:
-            tab = self.notebook.nametowidget(current).winfo_children()[0]
-            tab.current_language = language
-            tab.syntax_highlight()
-            self.status_bar.config(text=f"Language changed to {language}")
-
-    def auto_save(self):
-        while True:
-            for tab_id in self.notebook.tabs():
-                tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
-                if hasattr(tab, 'is_modified') and tab.is_modified:
-                    if hasattr(tab, 'filename') and tab.filename:
-                        self.save_file(tab)
-            time.sleep(self.config['auto_save_interval'])
-
-    def setup_auto_save(self):
-        auto_save_thread = threading.Thread(target=self.auto_save, daemon=True)
-        auto_save_thread.start()
-
-    def setup_shortcuts(self):
-        shortcuts = [
-            ('<Control-n>', self.new_file),
-            ('<Control-o>', self.open_file),
-            ('<Control-s>', lambda event: self.save_file()),
-            ('<Control-Shift-S>', lambda event: self.save_as_file()),
-            ('<Control-f>', self.show_find_replace_dialog),
-            ('<Control-w>', self.close_current_tab),
-            ('<Control-plus>', self.zoom_in),
-            ('<Control-minus>', self.zoom_out),
-            ('<Control-0>', self.zoom_reset)
-        ]
-        
-        for shortcut, command in shortcuts:
-            self.root.bind(shortcut, lambda event, cmd=command: cmd())
-
-class CodeTab(ttk.Frame):
-    def __init__(self, parent, master, filename=None, content=None):
-        super().__init__(parent)
-        
-        self.master = master
-        self.filename = filename
-        self.is_modified = False
-        
-        # Determine language based on file extension
-        self.current_language = 'python'  # default
-        if filename:
-            ext = os.path.splitext(filename)[1].lower()
-            lang_map = {
-                '.py': 'python',
-                '.html': 'html',
-                '.css': 'css',
-                '.js': 'javascript',
-                '.json': 'json'
-            }
-            self.current_language = lang_map.get(ext, 'python')
-
-        # Line numbers
-        self.line_numbers = tk.Text(self, width=4, padx=4, takefocus=0, border=0, background='lightgray')
-        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-
-        # Text area setup
-        self.text_area = ScrolledText(self, wrap=tk.WORD, undo=True)
-        self.text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Synchronize line numbers scrolling with text area
-        self.text_area.vbar = self.text_area.vbar  # Get scrollbar reference
-        self.text_area.vbar.config(command=self.on_scroll)
-        self.text_area.config(yscrollcommand=self.on_text_scroll)
-        
-        # Configure text area
-        self.text_area.configure(
-            font=master.config['font'], 
-            bg=master.themes[master.config['theme']]['bg'],
-            fg=master.themes[master.config['theme']]['fg']
-        )
-
-        # Event bindings
-        self.text_area.bind('<<Modified>>', self.on_modify)
-        self.text_area.bind('<KeyRelease>', self.on_key_release)
-        self.text_area.bind('<Configure>', self.update_line_numbers)
-
-        # Add content if provided
-        if content:
-            self.text_area.insert(tk.END, content)
-            self.text_area.edit_reset()  # Clear undo/redo stack
-            self.text_area.edit_modified(False)
-
-        # Initialize line numbers
-        self.update_line_numbers()
-
-    def on_scroll(self, *args):
-        # Synchronize text and line numbers scrolling
-        self.text_area.yview(*args)
-        self.line_numbers.yview(*args)
-
-    def on_text_scroll(self, *args):
-        # Update line numbers when text is scrolled
-        self.text_area.vbar.set(*args)
-        self.line_numbers.yview_moveto(args[0])
-
-    def on_key_release(self, event):
-        self.syntax_highlight()
-        self.update_line_numbers()
-
-    def on_modify(self, event=None):
-        self.is_modified = self.text_area.edit_modified()
-        if self.is_modified:
-            current_text = self.text_area.get('1.0', tk.END)
-            
-            # Update tab name with asterisk if modified
-            current_tab = self.master.notebook.select()
-            current_text = self.master.notebook.tab(current_tab, "text")
-            if not current_text.startswith("*"):
-                self.master.notebook.tab(current_tab, text=f"*{current_text}")
-            
-            self.master.status_bar.config(text="File modified")
-
-    def syntax_highlight(self, event=None):
-        text_area = self.text_area
-        content = text_area.get('1.0', tk.END)
-        lang_patterns = self.master.language_keywords[self.current_language]['patterns']
-        theme = self.master.themes[self.master.config['theme']]
-
-        # Remove existing tags
-        for tag in text_area.tag_names():
-            text_area.tag_remove(tag, '1.0', tk.END)
-
-        # Apply syntax highlighting based on language
-        for token_type, pattern in lang_patterns.items():
-            for match in re.finditer(pattern, content, re.MULTILINE):
-                start = f"1.0+{match.start()}c"
-                end = f"1.0+{match.end()}c"
-                
-                # Get color from theme, fallback to foreground color
-                color = theme.get(token_type, theme['fg'])
-                text_area.tag_add(token_type, start, end)
-                text_area.tag_config(token_type, foreground=color)
-
-    def update_line_numbers(self, event=None):
-        # Get the total number of lines
-        final_index = self.text_area.index('end-1c')
-        num_of_lines = int(final_index.split('.')[0])
-
-        # Update line numbers width based on the number of digits
-        width = len(str(num_of_lines)) + 1
-        self.line_numbers.configure(width=width)
-
-        # Generate line numbers text
-        line_numbers_text = '\n'.join(str(i) for i in range(1, num_of_lines + 1))
-        
-        # Update line numbers
-        self.line_numbers.config(state=tk.NORMAL)
-        self.line_numbers.delete('1.0', tk.END)
-        self.line_numbers.insert('1.0', line_numbers_text)
-        self.line_numbers.config(state=tk.DISABLED)
-
-class FindReplaceDialog(tk.Toplevel):
-    def __init__(self, parent, text_widget):
-        super().__init__(parent)
-        self.text_widget = text_widget
-        self.search_start_index = '1.0'
-        
-        self.title("Find and Replace")
-        self.geometry("400x250")
-        
-        # Find section
-        tk.Label(self, text="Find:").pack(pady=5)
-        self.find_entry = tk.Entry(self, width=40)
-        self.find_entry.pack()
-        
-        # Replace section
-        tk.Label(self, text="Replace:").pack(pady=5)
-        self.replace_entry = tk.Entry(self, width=40)
-        self.replace_entry.pack()
-        
-        # Word count label
-        self.word_count_label = tk.Label(self, text="")
-        self.word_count_label.pack(pady=5)
-        
-        # Buttons
-        buttons_frame = tk.Frame(self)
-        buttons_frame.pack(pady=10)
-        
-        tk.Button(buttons_frame, text="Find", command=self.find_text).pack(side=tk.LEFT, padx=5)
-        tk.Button(buttons_frame, text="Replace", command=self.replace_text).pack(side=tk.LEFT, padx=5)
-        tk.Button(buttons_frame, text="Replace All", command=self.replace_all).pack(side=tk.LEFT, padx=5)
-        tk.Button(buttons_frame, text="Count", command=self.count_occurrences).pack(side=tk.LEFT, padx=5)
-
-        # Bind Enter key to find_text
-        self.find_entry.bind('<Return>', lambda e: self.find_text())
-
-    def find_text(self):
-        text = self.find_entry.get()
-        if not text:
-            return
-            
-        # Remove previous highlights
-        self.text_widget.tag_remove('highlight', '1.0', tk.END)
-        
-        # Start search from current position
-        start_pos = self.text_widget.search(text, self.search_start_index, tk.END)
-        
-        if not start_pos:  # If not found, start from beginning
-            self.search_start_index = '1.0'
-            start_pos = self.text_widget.search(text, self.search_start_index, tk.END)
-            if not start_pos:  # If still not found
-                messagebox.showinfo("Find", "Text not found")
-                return
-        
-        line, char = start_pos.split('.')
-        end_pos = f"{line}.{int(char) + len(text)}"
-        
-        # Highlight the found text
-        self.text_widget.tag_add('highlight', start_pos, end_pos)
-        self.text_widget.tag_config('highlight', background='yellow')
-        self.text_widget.see(start_pos)
-        self.text_widget.mark_set(tk.INSERT, end_pos)
-        
-        # Update search start index for next search
-        self.search_start_index = end_pos
-
-    def replace_text(self):
-        # First remove the current highlight if exists
-        ranges = self.text_widget.tag_ranges('highlight')
-        if ranges:
-            start, end = ranges[0], ranges[1]
-            self.text_widget.delete(start, end)
-            self.text_widget.insert(start, self.replace_entry.get())
-            self.find_text()  # Find next occurrence
-
-    def replace_all(self):
-        find_text = self.find_entry.get()
-        replace_text = self.replace_entry.get()
-        
-        content = self.text_widget.get('1.0', tk.END)
-        new_content = content.replace(find_text, replace_text)
-        
-        self.text_widget.delete('1.0', tk.END)
-        self.text_widget.insert('1.0', new_content)
-        
-        # Show how many replacements were made
-        occurrences = content.count(find_text)
-        messagebox.showinfo("Replace All", f"Replaced {occurrences} occurrence(s)")
-
-    def count_occurrences(self):
-        find_text = self.find_entry.get()
-        content = self.text_widget.get('1.0', tk.END)
-        count = content.count(find_text)
-        self.word_count_label.config(text=f"Occurrences: {count}")
-
-def main():
-    root = tk.Tk()
-    
-    try:
-        root.iconbitmap('nobu_icon.ico')  
-    except Exception:
-        pass  # Fallback if icon loading fails
-    
-    app = Nobu(root)
-    app.pack(fill=tk.BOTH, expand=True)
-    
-    # Custom window management
-    def on_closing():
-        # Check for unsaved changes in all tabs
-        for tab_id in app.notebook.tabs():
-            tab = app.notebook.nametowidget(tab_id).winfo_children()[0]
-            if tab.is_modified:
-                response = messagebox.askyesnocancel(
-                    "Unsaved Changes", 
-                    "You have unsaved changes. Do you want to save before exiting?"
-                )
-                
-                if response is None:  # Cancel
-                    return
-                elif response:  # Yes
-                    app.save_file(tab)
-        
-        # Save configuration before closing
-        app.save_config()
-        root.destroy()
-    
-    root.protocol("WM_DELETE_WINDOW", on_closing)
-    root.mainloop()
-
-if __name__ == "__main__":
+import time
+STARTED = time.perf_counter()  # for --profile-startup
+import sys
+
+if __name__ == '__main__' and '--batch' in sys.argv[1:]:
+    # Headless: run nobu_core as the main module so neither this process
+    # nor its workers ever import Tk. Compiling this file still costs about
+    # 0.1 s; "python nobu_core.py" starts without it
+    import runpy
+    runpy.run_module('nobu_core', run_name='__main__', alter_sys=True)
+    sys.exit()
+
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog, simpledialog
+from tkinter import font as tkfont
+from tkinter.scrolledtext import ScrolledText
+import re
+import bisect
+import random
+import os
+import json
+import threading
+import queue
+import codecs
+import hashlib
+import tempfile
+import mmap
+import argparse
+import zlib
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import ast
+import functools
+import heapq
+from collections import deque
+from nobu_core import (
+    PYTHON_BUILTINS, LANGUAGE_EXTENSIONS, language_for, default_language_keywords,
+    SEMANTIC_TAGS, resolve_style, THEMES, Lexer,
+    detect_encoding, detect_newline, content_hash, write_atomically,
+    EXPORT_FORMATS, export_highlighted, SEARCH_IGNORE,
+    search_source, search_flags, compile_search, load_ignore_patterns, iter_search_files,
+)
+
+class Instrumentation:
+    """Timings of the editor's event handlers, collected only while enabled.
+
+    Handlers decorated with @instrumented cost one attribute check while
+    this is disabled. When enabled, each call's duration goes into a rolling
+    window of the last WINDOW samples per handler, and into a bounded list
+    of trace events that can be saved in Chrome trace format (viewable in
+    chrome://tracing or Perfetto). Event loop lag is sampled separately by
+    Nobu's overlay. Safe to record from worker threads.
+    """
+
+    WINDOW = 1000
+    TRACE_EVENTS = 200000
+
+    def __init__(self):
+        self.enabled = False
+        self.samples = {}
+        self.trace = deque(maxlen=self.TRACE_EVENTS)
+        self.origin = time.perf_counter()
+
+    def record(self, name, start, end):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples.setdefault(name, deque(maxlen=self.WINDOW))
+        samples.append(end - start)
+        self.trace.append((name, start, end, threading.get_ident()))
+
+    def percentiles(self, name, fractions=(0.5, 0.99)):
+        samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+        return [samples[min(len(samples) - 1, int(fraction * len(samples)))] for fraction in fractions]
+
+    def reset(self):
+        self.samples = {}
+        self.trace.clear()
+
+    def save_trace(self, filename):
+        origin = self.origin
+        events = [
+            {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': os.getpid(), 'tid': thread,
+             'ts': (start - origin) * 1e6, 'dur': (end - start) * 1e6}
+            for name, start, end, thread in list(self.trace)
+        ]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+instrumentation = Instrumentation()
+
+def instrumented(function):
+    # Time calls of function under its qualified name while instrumentation is on
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not instrumentation.enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            instrumentation.record(name, start, time.perf_counter())
+    return wrapper
+
+class Nobu(tk.Frame):
+    def __init__(self, root):
+        super().__init__(root)
+        self.root = root
+        self.root.title("Nobu - Code Editor")
+        self.root.geometry("1200x800")
+        
+        self.config_path = Path.home() / '.nobu_editor_config.json'
+        self.config = self.load_config()
+        
+        self.themes = {name: dict(theme) for name, theme in THEMES.items()}
+        
+        self.language_keywords = default_language_keywords()
+
+        # Themes resolved into per-tag styles, built on first use per theme
+        self.styles = {}
+        self.load_user_themes()
+        if self.config['theme'] not in self.themes:
+            self.config['theme'] = 'dark'
+
+        # Compiled lexers, built on first use per language, and the worker
+        # thread that lexes large regions for every tab
+        self.lexers = {}
+        self.vocabularies = {}  # language -> sorted keywords and builtins to complete
+        self.structure_lexers = {}
+        self.highlight_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='nobu-highlight')
+        self.export_worker = SerialWorker('nobu-export')
+        self.search_pool = None
+        self.semantic_pool = None
+        self.symbol_index = SymbolIndex(self.config_path.with_name('.nobu_symbols.db'))
+        self.token_cache = TokenCache(
+            self.config_path.with_name('.nobu_token_cache'),
+            self.config['token_cache_size'],
+            self.config['token_cache_min_size']
+        )
+
+        # Initialize zoom level
+        self.current_zoom = 100  # percentage
+        
+        # Tabs register with the auto-saver as they are created. Only the
+        # window and the visible tab are built up front; menus and shortcuts
+        # follow once the window is on screen
+        self.setup_auto_save()
+        self.setup_ui()
+        self.restore_session()
+        self.startup_done = False
+        self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        self.setup_menus()
+        self.setup_shortcuts()
+        
+        # Bind mouse wheel for zooming
+        self.root.bind("<Control-MouseWheel>", self.mouse_wheel_zoom)
+        self.file_watcher = FileWatcher(self)
+        self.startup_done = True
+
+    MAX_RECENT_FILES = 20
+
+    def restore_session(self):
+        # Reopen the last session's files as placeholders; each one is only
+        # read when its tab is first selected (see CodeTab.wake)
+        session = self.config.get('session') or {}
+        containers = []
+        for entry in session.get('files', []):
+            path = entry.get('path')
+            if not path or not os.path.isfile(path):
+                continue
+            tab_container = ttk.Frame(self.notebook)
+            code_tab = CodeTab(tab_container, self, path, restore={
+                'content': None,
+                'modified': False,
+                'cursor': entry.get('cursor', '1.0'),
+                'top': entry.get('top', '1.0'),
+            })
+            code_tab.pack(fill=tk.BOTH, expand=True)
+            self.notebook.add(tab_container, text=os.path.basename(path))
+            containers.append(tab_container)
+
+        if not containers:
+            self.new_file()
+            return
+        selected = min(max(session.get('selected', 0), 0), len(containers) - 1)
+        self.notebook.select(containers[selected])
+
+    def save_session(self):
+        files = []
+        selected = 0
+        current = self.notebook.select()
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
+            if not tab.filename:
+                continue
+            if str(tab_id) == str(current):
+                selected = len(files)
+            if tab.hibernated:
+                cursor, top = tab.hibernated['cursor'], tab.hibernated['top']
+            else:
+                cursor, top = tab.text_area.index(tk.INSERT), tab.text_area.index('@0,0')
+            files.append({'path': tab.filename, 'cursor': cursor, 'top': top})
+        self.config['session'] = {'files': files, 'selected': selected}
+
+    def add_recent_file(self, filename):
+        # Most recent first, without duplicates
+        recent = [f for f in self.config['recent_files'] if f != filename]
+        recent.insert(0, filename)
+        self.config['recent_files'] = recent[:self.MAX_RECENT_FILES]
+        self.save_config()
+
+    def mouse_wheel_zoom(self, event):
+        if event.delta > 0:
+            self.zoom_in()
+        else:
+            self.zoom_out()
+
+    def load_config(self):
+        default_config = {
+            'theme': 'dark',
+            'font': ('Consolas', 12),
+            'auto_save_interval': 300,  # 5 minutes
+            'large_file_threshold': 8 * 1024 * 1024,  # bytes; larger files load progressively
+            'hibernate_after': 900,  # seconds before a background tab is hibernated
+            'tab_memory_budget': 512 * 1024 * 1024,  # estimated bytes for live tabs
+            'undo_tab_memory': 32 * 1024 * 1024,  # bytes of undo history per tab before it spills to disk
+            'undo_memory': 128 * 1024 * 1024,  # the same for all tabs together
+            'token_cache_size': 64 * 1024 * 1024,  # bytes on disk for cached tokens
+            'token_cache_min_size': 256 * 1024,  # smaller files are not worth caching
+            'search_ignore': list(SEARCH_IGNORE),
+            'symbol_folders': [],  # project folders in the symbol index
+            'minimap': True,
+            'recent_files': [],
+            'session': {},  # files open at the last exit, see save_session
+            'code_snippets': {}
+        }
+        
+        try:
+            if self.config_path.exists():
+                with open(self.config_path, 'r') as f:
+                    config = json.load(f)
+                    return {**default_config, **config}
+            return default_config
+        except Exception as e:
+            print(f"Config load error: {e}")
+            return default_config
+
+    def save_config(self):
+        try:
+            with open(self.config_path, 'w') as f:
+                json.dump(self.config, f)
+        except Exception as e:
+            print(f"Config save error: {e}")
+
+    def setup_ui(self):
+        # Main container
+        self.main_container = ttk.Frame(self)
+        self.main_container.pack(fill=tk.BOTH, expand=True)
+
+        # Create notebook for tabs
+        self.notebook = ttk.Notebook(self.main_container)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.hibernator = TabHibernator(self)
+        self.notebook.bind('<<NotebookTabChanged>>', self.hibernator.on_tab_changed)
+
+        # Status bar at the bottom
+        self.status_bar = ttk.Label(self.root, text="Nobu - Ready", anchor=tk.W, relief=tk.SUNKEN)
+        self.status_bar.pack(fill=tk.X, side=tk.BOTTOM)
+
+        # Live handler latencies, shown at the right of the status bar on demand
+        self.perf_label = ttk.Label(self.status_bar, anchor=tk.E)
+        self.perf_overlay_var = tk.BooleanVar(value=False)
+        self.theme_var = tk.StringVar(value=self.config['theme'])
+        self.minimap_var = tk.BooleanVar(value=self.config['minimap'])
+        self.perf_jobs = []
+        self.lag_due = None
+        self.cpu_profile = None
+
+    def setup_menus(self):
+        # Create a menu bar
+        menubar = tk.Menu(self.root)
+        self.root.config(menu=menubar)
+
+        # File menu
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="New", command=self.new_file, accelerator="Ctrl+N")
+        file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
+        file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
+        file_menu.add_command(label="Save As", command=self.save_as_file, accelerator="Ctrl+Shift+S")
+        file_menu.add_separator()
+        for fmt, (label, _) in EXPORT_FORMATS.items():
+            file_menu.add_command(label=f"Export as {label}...", command=lambda f=fmt: self.export_file(f))
+        file_menu.add_separator()
+        file_menu.add_command(label="Close Tab", command=self.close_current_tab, accelerator="Ctrl+W")
+        file_menu.add_command(label="Exit", command=self.root.quit)
+        menubar.add_cascade(label="File", menu=file_menu)
+
+        # Edit menu
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        edit_menu.add_command(label="Undo", command=self.undo, accelerator="Ctrl+Z")
+        edit_menu.add_command(label="Redo", command=self.redo, accelerator="Ctrl+Y")
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Find", command=self.show_find_replace_dialog, accelerator="Ctrl+F")
+        edit_menu.add_command(label="Find in Files", command=self.show_find_in_files_dialog, accelerator="Ctrl+Shift+F")
+        edit_menu.add_command(label="Go To Line", command=self.go_to_line)
+        edit_menu.add_command(label="Go to Symbol", command=self.show_go_to_symbol_dialog, accelerator="Ctrl+T")
+        edit_menu.add_command(label="Complete Word", command=self.complete_word, accelerator="Ctrl+Space")
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+
+        # View menu
+        view_menu = tk.Menu(menubar, tearoff=0)
+        view_menu.add_command(label="Zoom In", command=self.zoom_in, accelerator="Ctrl++")
+        view_menu.add_command(label="Zoom Out", command=self.zoom_out, accelerator="Ctrl+-")
+        view_menu.add_command(label="Reset Zoom", command=self.zoom_reset, accelerator="Ctrl+0")
+        view_menu.add_checkbutton(label="Minimap", variable=self.minimap_var, command=self.toggle_minimap)
+        view_menu.add_command(label="Toggle Fold", command=self.toggle_fold, accelerator="Ctrl+[")
+        view_menu.add_command(label="Unfold All", command=self.unfold_all)
+        view_menu.add_separator()
+        view_menu.add_checkbutton(label="Performance Overlay", variable=self.perf_overlay_var,
+                                  command=self.toggle_perf_overlay)
+        view_menu.add_command(label="Save Performance Trace...", command=self.save_perf_trace)
+        view_menu.add_command(label="Start CPU Profile", command=self.toggle_cpu_profile)
+        self.cpu_profile_entry = view_menu.index(tk.END)
+        self.view_menu = view_menu
+        menubar.add_cascade(label="View", menu=view_menu)
+
+        # Themes menu
+        themes_menu = tk.Menu(menubar, tearoff=0)
+        for theme_name in self.themes:
+            themes_menu.add_radiobutton(
+                label=theme_name.capitalize(),
+                variable=self.theme_var,
+                value=theme_name,
+                command=lambda t=theme_name: self.change_theme(t)
+            )
+        view_menu.add_cascade(label="Themes", menu=themes_menu)
+
+        # Language menu
+        language_menu = tk.Menu(menubar, tearoff=0)
+        for lang in self.language_keywords.keys():
+            language_menu.add_command(
+                label=lang.capitalize(),
+                command=lambda l=lang: self.change_language(l)
+            )
+        menubar.add_cascade(label="Language", menu=language_menu)
+
+    EXPORT_POLL_MS = 100
+
+    def export_colors(self):
+        # The current theme as '#rrggbb' for export_highlighted
+        style = self.get_style()
+        hex_color = lambda color: '#%02x%02x%02x' % tuple(value >> 8 for value in self.winfo_rgb(color))
+        colors = {token_type: hex_color(options['foreground'])
+                  for token_type, options in style['tags'].items() if 'foreground' in options}
+        colors['bg'] = hex_color(style['bg'])
+        colors['fg'] = hex_color(style['fg'])
+        return colors
+
+    def export_file(self, fmt):
+        """Export the current tab with its highlighting as HTML or ANSI text.
+
+        A snapshot of the Document is rendered and written on a worker
+        thread a block of lines at a time, so exporting a huge file neither
+        holds it all in memory twice nor blocks the editor.
+        """
+        current = self.notebook.select()
+        if not current:
+            return
+        tab = self.notebook.nametowidget(current).winfo_children()[0]
+        if tab.loader is not None:
+            self.status_bar.config(text="Wait for the file to finish loading before exporting it")
+            return
+        label, extension = EXPORT_FORMATS[fmt]
+        filename = filedialog.asksaveasfilename(
+            defaultextension=extension,
+            filetypes=[(f"{label} Files", f"*{extension}"), ("All Files", "*.*")]
+        )
+        if not filename:
+            return
+
+        snapshot = tab.document.snapshot()
+        total = len(snapshot)
+        title = os.path.basename(tab.filename) if tab.filename else self.notebook.tab(current, 'text').lstrip('*')
+        done = [0]
+        def chunks():
+            for chunk in snapshot.chunks():
+                done[0] += len(chunk)
+                yield chunk
+        output = export_highlighted(chunks(), self.get_lexer(tab.current_language), self.export_colors(), fmt, title)
+        future = self.export_worker.submit(write_atomically, filename, output, 'utf-8', '\n')
+
+        def poll():
+            if not future.done():
+                self.status_bar.config(text=f"Exporting {title}: {done[0] * 100 // max(total, 1)}%")
+                self.after(self.EXPORT_POLL_MS, poll)
+                return
+            try:
+                future.result()
+                self.status_bar.config(text=f"Exported to: {filename}")
+            except Exception as e:
+                messagebox.showerror("Export Error", str(e))
+        poll()
+
+    def new_file(self):
+        # Create a new tab container
+        tab_container = ttk.Frame(self.notebook)
+        
+        # Create the CodeTab instance
+        code_tab = CodeTab(tab_container, self)
+        code_tab.pack(fill=tk.BOTH, expand=True)
+        
+        # Add the tab to notebook
+        tab_name = f"Untitled-{len(self.notebook.tabs())+1}"
+        self.notebook.add(tab_container, text=tab_name)
+        
+        # Select the new tab
+        self.notebook.select(tab_container)
+        self.status_bar.config(text="New file created")
+
+    def open_file(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[
+                ("Python Files", "*.py"),
+                ("HTML Files", "*.html"),
+                ("CSS Files", "*.css"),
+                ("JavaScript Files", "*.js"),
+                ("JSON Files", "*.json"),
+                ("Text Files", "*.txt"),
+                ("All Files", "*.*")
+            ]
+        )
+        
+        if filename:
+            self.open_path(filename)
+
+    @instrumented
+    def open_path(self, filename):
+        try:
+            # Large files are streamed in after the tab is shown
+            large = os.path.getsize(filename) >= self.config['large_file_threshold']
+            content = None
+            if not large:
+                stat = file_stat(filename)
+                with open(filename, 'rb') as f:
+                    data = f.read()
+                encoding = detect_encoding(data)
+                content = data.decode(encoding)
+                newline = detect_newline(content)
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
+            
+            # Create new tab container
+            tab_container = ttk.Frame(self.notebook)
+            
+            # Create the CodeTab instance; saves write back the same bytes
+            # this file was read as
+            if large:
+                code_tab = CodeTab(tab_container, self, filename)
+            else:
+                code_tab = CodeTab(tab_container, self, filename, content, encoding=encoding,
+                                   newline=newline, saved_hash=content_hash(data), disk_stat=stat)
+            code_tab.pack(fill=tk.BOTH, expand=True)
+            
+            # Add the tab to notebook with the filename as title
+            self.notebook.add(tab_container, text=os.path.basename(filename))
+            self.notebook.select(tab_container)
+            
+            # Update recent files
+            self.add_recent_file(filename)
+            
+            if large:
+                FileLoader(code_tab, filename).start()
+                self.status_bar.config(text=f"Loading: {filename}")
+            else:
+                self.status_bar.config(text=f"Opened: {filename}")
+            return code_tab
+        except Exception as e:
+            messagebox.showerror("Open Error", str(e))
+
+    @instrumented
+    def save_file(self, tab=None):
+        if not tab:
+            current = self.notebook.select()
+            if not current:
+                return False
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+        
+        if not hasattr(tab, 'filename') or not tab.filename:
+            return self.save_as_file(tab)
+        
+        try:
+            if self.write_tab(tab, tab.filename):
+                self.status_bar.config(text=f"Saved: {tab.filename}")
+            else:
+                self.status_bar.config(text=f"No changes to save: {tab.filename}")
+            return True
+        except Exception as e:
+            messagebox.showerror("Save Error", str(e))
+            return False
+
+    @instrumented
+    def save_as_file(self, tab=None):
+        if not tab:
+            current = self.notebook.select()
+            if not current:
+                return False
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".py",
+            filetypes=[
+                ("Python Files", "*.py"),
+                ("HTML Files", "*.html"),
+                ("CSS Files", "*.css"),
+                ("JavaScript Files", "*.js"),
+                ("JSON Files", "*.json"),
+                ("Text Files", "*.txt"),
+                ("All Files", "*.*")
+            ]
+        )
+        
+        if filename:
+            try:
+                self.write_tab(tab, filename)
+                self.status_bar.config(text=f"Saved: {filename}")
+                return True
+            except Exception as e:
+                messagebox.showerror("Save Error", str(e))
+                return False
+
+    @instrumented
+    def write_tab(self, tab, filename):
+        tab.wake()
+        # Returns False when the file already holds the buffer's contents
+        same_file = filename == tab.filename and os.path.exists(filename)
+        if same_file and tab.saved_hash and not tab.text_area.edit_modified():
+            return False
+
+        # Serialised with the auto-saver, whose older snapshot is then dropped
+        with tab.write_lock:
+            written = write_atomically(
+                filename,
+                tab.document.chunks(),
+                tab.encoding,
+                tab.newline,
+                skip_hash=tab.saved_hash if same_file else None
+            )
+            tab.save_serial += 1
+            tab.disk_stat = file_stat(filename)
+        if written:
+            tab.saved_hash = written
+        tab.disk_conflict = None  # saving by hand settles it
+        tab.filename = filename
+        self.mark_saved(tab)
+        return written is not None
+
+    def mark_saved(self, tab):
+        tab.text_area.edit_modified(False)
+        tab.is_modified = False
+
+        # Update tab title
+        self.notebook.tab(tab.winfo_parent(), text=os.path.basename(tab.filename))
+
+    def close_current_tab(self):
+        if len(self.notebook.tabs()) > 1:
+            current = self.notebook.select()
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            self.notebook.forget(current)
+            if tab.loader:
+                tab.loader.cancel()
+            if tab.undo_history is not None:
+                tab.undo_history.close()
+            self.status_bar.config(text="Tab closed")
+        else:
+            messagebox.showinfo("Info", "Cannot close the last tab")
+
+    def go_to_line(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            line_number = simpledialog.askinteger("Go To Line", "Enter line number:")
+            if line_number:
+                try:
+                    tab.text_area.mark_set(tk.INSERT, f"{line_number}.0")
+                    tab.text_area.see(tk.INSERT)
+                    # Highlight the line
+                    tab.text_area.tag_remove('highlight_line', '1.0', tk.END)
+                    tab.text_area.tag_add('highlight_line', f"{line_number}.0", f"{line_number}.end+1c")
+                    tab.text_area.tag_config('highlight_line', background='yellow')
+                except tk.TclError:
+                    messagebox.showwarning("Warning", "Line number out of range")
+
+    def show_find_replace_dialog(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            FindReplaceDialog(self.root, tab)
+
+    def show_find_in_files_dialog(self):
+        FindInFilesDialog(self.root, self)
+
+    def show_go_to_symbol_dialog(self):
+        GoToSymbolDialog(self.root, self)
+
+    def undo(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            if tab.undo_history is not None:
+                tab.undo_history.undo()
+
+    def redo(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            if tab.undo_history is not None:
+                tab.undo_history.redo()
+
+    def toggle_fold(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            if tab.structure is not None:
+                tab.toggle_fold()
+
+    def unfold_all(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            if tab.structure is not None:
+                tab.unfold_all()
+
+    def complete_word(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            if tab.completer is not None:
+                tab.text_area.focus_set()
+                tab.completer.complete()
+
+    def update_symbol_index(self, folder=None):
+        # Check the open files and the project folders against the symbol
+        # index; folder is added to the project folders first
+        if folder:
+            folder = os.path.abspath(folder)
+            if folder not in self.config['symbol_folders']:
+                self.config['symbol_folders'].append(folder)
+                self.save_config()
+        paths, buffers = [], []
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
+            if not tab.filename:
+                continue
+            if tab.hibernated is None and tab.is_modified and tab.loader is None:
+                buffers.append((os.path.abspath(tab.filename), tab.document.get()))
+            else:
+                paths.append(os.path.abspath(tab.filename))
+        folders = [(root, load_ignore_patterns(root, self.config['search_ignore']))
+                   for root in self.config['symbol_folders'] if os.path.isdir(root)]
+        return self.symbol_index.update(self.get_search_pool(), paths, buffers, folders)
+
+    def get_search_pool(self):
+        # Worker processes are started on the first project search. They are
+        # spawned rather than forked so they never inherit the Tk interpreter
+        if self.search_pool is None:
+            # Imported here; multiprocessing is not needed to start the editor
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self.search_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.search_pool
+
+    def get_semantic_pool(self):
+        # One worker process parses Python buffers for SemanticHighlighter
+        if self.semantic_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self.semantic_pool = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.semantic_pool
+
+    def open_at(self, filename, line, column=0):
+        # Select the tab already showing filename, or open it, and go to line.column
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab.filename and os.path.abspath(tab.filename) == os.path.abspath(filename):
+                self.notebook.select(tab_id)
+                break
+        else:
+            tab = self.open_path(filename)
+        if tab is None:
+            return
+        tab.wake()
+        if tab.loader:
+            tab.loader.goto = (line, column)
+        else:
+            tab.goto(line, column)
+
+    def toggle_minimap(self):
+        self.config['minimap'] = self.minimap_var.get()
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab.hibernated:
+                continue
+            if self.config['minimap']:
+                tab.minimap.pack(side=tk.RIGHT, fill=tk.Y, before=tab.text_area.frame)
+                tab.minimap.refresh()
+            else:
+                tab.minimap.pack_forget()
+        self.save_config()
+
+    def load_user_themes(self):
+        # Every *.json in ~/.nobu_themes is a theme: the keys of the built-in
+        # themes, plus an optional "name" and "extends" (a theme to start from)
+        theme_dir = self.config_path.with_name('.nobu_themes')
+        if not theme_dir.is_dir():
+            return
+        for path in sorted(theme_dir.glob('*.json')):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                name = data.pop('name', path.stem)
+                theme = {**self.themes[data.pop('extends', 'default')], **data}
+                for color in theme.values():
+                    self.root.winfo_rgb(color)  # rejects unknown colors
+                self.themes[name] = theme
+            except Exception as e:
+                print(f"Theme load error in {path}: {e}")
+
+    def get_style(self, theme_name=None):
+        theme_name = theme_name or self.config['theme']
+        if theme_name not in self.styles:
+            self.styles[theme_name] = resolve_style(self.themes[theme_name], self.language_keywords)
+        return self.styles[theme_name]
+
+    def change_theme(self, theme_name):
+        # Only colors change: tags keep their names, so nothing is re-lexed
+        self.config['theme'] = theme_name
+        self.theme_var.set(theme_name)
+        style = self.get_style(theme_name)
+        
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab.hibernated:
+                continue  # picks up the theme when it wakes
+            tab.apply_style(style)
+        
+        self.save_config()
+
+    def zoom_in(self, event=None):
+        if self.current_zoom < 200:  # Maximum 200%
+            self.current_zoom += 10
+            self.apply_zoom()
+
+    def zoom_out(self, event=None):
+        if self.current_zoom > 50:  # Minimum 50%
+            self.current_zoom -= 10
+            self.apply_zoom()
+
+    def zoom_reset(self, event=None):
+        self.current_zoom = 100
+        self.apply_zoom()
+
+    @instrumented
+    def apply_zoom(self):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            font = list(self.config['font'])
+            font_size = int(12 * self.current_zoom / 100)
+            font[1] = font_size
+            
+            # The line number gutter follows the text font and line count
+            tab.text_area.configure(font=tuple(font))
+            tab.update_line_numbers()
+            
+            self.status_bar.config(text=f"Zoom: {self.current_zoom}%")
+
+    def get_lexer(self, language):
+        lexer = self.lexers.get(language)
+        if lexer is None:
+            lexer = Lexer(self.language_keywords[language])
+            self.lexers[language] = lexer
+        return lexer
+
+    def get_structure_lexer(self, language):
+        # Lexes only what brackets inside do not count in: strings and comments
+        lexer = self.structure_lexers.get(language)
+        if lexer is None:
+            spec = self.language_keywords[language]
+            patterns = {token_type: pattern for token_type, pattern in spec['patterns'].items()
+                        if token_type in Lexer.PRECEDENCE}
+            lexer = Lexer({'patterns': patterns, 'multiline': spec.get('multiline', [])})
+            self.structure_lexers[language] = lexer
+        return lexer
+
+    def get_vocabulary(self, language):
+        vocabulary = self.vocabularies.get(language)
+        if vocabulary is None:
+            vocabulary = language_vocabulary(self.language_keywords[language])
+            self.vocabularies[language] = vocabulary
+        return vocabulary
+
+    PERF_REFRESH_MS = 500
+    LAG_MS = 100
+    PERF_OVERLAY = [
+        ('key', 'CodeTab.on_key_release'),
+        ('modify', 'CodeTab.on_modify'),
+        ('highlight', 'HighlightScheduler.apply_slices'),
+        ('gutter', 'LineNumberGutter.redraw'),
+        ('save', 'AutoSaver.write'),
+        ('lag', 'event_loop.lag'),
+    ]
+
+    def toggle_perf_overlay(self):
+        for job in self.perf_jobs:
+            self.after_cancel(job)
+        self.perf_jobs = []
+        if self.perf_overlay_var.get():
+            instrumentation.reset()
+            instrumentation.enabled = True
+            self.perf_label.place(relx=1.0, rely=0.5, anchor=tk.E)
+            self.lag_due = time.perf_counter() + self.LAG_MS / 1000
+            self.perf_jobs = [self.after(self.LAG_MS, self.check_lag),
+                              self.after(self.PERF_REFRESH_MS, self.refresh_perf_overlay)]
+        else:
+            instrumentation.enabled = False
+            self.perf_label.place_forget()
+
+    def check_lag(self):
+        # How late this timer fired is how long the event loop was busy
+        now = time.perf_counter()
+        instrumentation.record('event_loop.lag', self.lag_due, max(now, self.lag_due))
+        self.lag_due = now + self.LAG_MS / 1000
+        self.perf_jobs[0] = self.after(self.LAG_MS, self.check_lag)
+
+    def refresh_perf_overlay(self):
+        parts = []
+        for label, name in self.PERF_OVERLAY:
+            figures = instrumentation.percentiles(name)
+            if figures:
+                p50, p99 = figures
+                parts.append(f"{label} {p50 * 1000:.1f}/{p99 * 1000:.1f}")
+        self.perf_label.config(text="p50/p99 ms: " + "  ".join(parts) if parts else "No samples yet")
+        self.perf_jobs[1] = self.after(self.PERF_REFRESH_MS, self.refresh_perf_overlay)
+
+    def save_perf_trace(self):
+        if not instrumentation.trace:
+            messagebox.showinfo("Performance Trace", "Nothing recorded; turn on the performance overlay first")
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Chrome Trace", "*.json"), ("All Files", "*.*")]
+        )
+        if filename:
+            try:
+                count = instrumentation.save_trace(filename)
+                self.status_bar.config(text=f"Saved {count} trace events to: {filename}")
+            except Exception as e:
+                messagebox.showerror("Save Error", str(e))
+
+    def toggle_cpu_profile(self):
+        # cProfile the Tk thread from now until the second click
+        if self.cpu_profile is None:
+            import cProfile
+            self.cpu_profile = cProfile.Profile()
+            self.cpu_profile.enable()
+            self.view_menu.entryconfig(self.cpu_profile_entry, label="Stop CPU Profile")
+            self.status_bar.config(text="CPU profile running")
+            return
+        profile, self.cpu_profile = self.cpu_profile, None
+        profile.disable()
+        self.view_menu.entryconfig(self.cpu_profile_entry, label="Start CPU Profile")
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".prof",
+            filetypes=[("Profile Data", "*.prof"), ("All Files", "*.*")]
+        )
+        if filename:
+            try:
+                profile.dump_stats(filename)
+                self.status_bar.config(text=f"CPU profile saved to: {filename}")
+            except Exception as e:
+                messagebox.showerror("Save Error", str(e))
+
+    def change_language(self, language):
+        current = self.notebook.select()
+        if current:
+            tab = self.notebook.nametowidget(current).winfo_children()[0]
+            tab.current_language = language
+            tab.syntax_highlight()
+            self.status_bar.config(text=f"Language changed to {language}")
+
+    def setup_auto_save(self):
+        self.auto_saver = AutoSaver(self)
+        self.undo_budget = UndoBudget(self)
+
+    def setup_shortcuts(self):
+        shortcuts = [
+            ('<Control-n>', self.new_file),
+            ('<Control-o>', self.open_file),
+            ('<Control-s>', lambda event: self.save_file()),
+            ('<Control-Shift-S>', lambda event: self.save_as_file()),
+            ('<Control-f>', self.show_find_replace_dialog),
+            ('<Control-Shift-F>', self.show_find_in_files_dialog),
+            ('<Control-t>', self.show_go_to_symbol_dialog),
+            ('<Control-bracketleft>', self.toggle_fold),
+            ('<Control-w>', self.close_current_tab),
+            ('<Control-plus>', self.zoom_in),
+            ('<Control-minus>', self.zoom_out),
+            ('<Control-0>', self.zoom_reset)
+        ]
+        
+        for shortcut, command in shortcuts:
+            self.root.bind(shortcut, lambda event, cmd=command: cmd())
+
+class CodeTab(ttk.Frame):
+    def __init__(self, parent, master, filename=None, content=None, restore=None,
+                 encoding='utf-8', newline=None, saved_hash=None, disk_stat=None):
+        super().__init__(parent)
+        
+        self.master = master
+        self.filename = filename
+        self.is_modified = False
+        self.loader = None
+
+        # How the file is written back; saved_hash is the hash of its bytes
+        # on disk as of the last open or save
+        self.encoding = encoding
+        self.newline = newline
+        self.saved_hash = saved_hash
+        # file_stat() as of the last read or write, and the hash of a version
+        # changed on disk whose reload was declined (see FileWatcher)
+        self.disk_stat = disk_stat
+        self.disk_conflict = None
+
+        # Counts edits and saves so background saves can tell whether their
+        # snapshot is still current
+        self.edit_count = 0
+        self.save_serial = 0
+        self.write_lock = threading.Lock()
+        self.cache_header = None  # token cache entry to write once highlighted
+        
+        # Determine language based on file extension
+        self.current_language = 'python'  # default
+        if filename:
+            self.current_language = language_for(filename)
+
+        # Set while the widgets are torn down, see hibernate(); a tab
+        # restored from the last session starts out that way
+        self.hibernated = restore
+        self.last_active = time.monotonic()
+        if restore is None:
+            self.build_editor(content)
+        else:
+            self.text_area = self.line_numbers = self.minimap = self.document = None
+            self.highlighter = self.highlight_scheduler = self.semantic_highlighter = None
+            self.completer = self.structure = self.undo_history = None
+            self.edit_listeners = []
+            self.highlight_listeners = []
+            self.scroll_listeners = []
+
+    def build_editor(self, content=None):
+        master = self.master
+
+        # Text area setup
+        self.text_area = ScrolledText(self, wrap=tk.WORD)
+        self.text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Line numbers, drawn only for the lines on screen
+        self.line_numbers = LineNumberGutter(self, self.text_area)
+        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y, before=self.text_area.frame)
+
+        # Overview of the whole document to the right of the scrollbar
+        self.minimap = Minimap(self, self)
+        if master.config['minimap']:
+            self.minimap.pack(side=tk.RIGHT, fill=tk.Y, before=self.text_area.frame)
+
+        # Redraw line numbers when the text is scrolled
+        self.text_area.config(yscrollcommand=self.on_text_scroll)
+        
+        # Configure text area
+        self.text_area.configure(font=master.config['font'])
+        self.apply_style(master.get_style())
+
+        # Event bindings
+        self.text_area.bind('<<Modified>>', self.on_modify)
+        self.text_area.bind('<KeyRelease>', self.on_key_release)
+        # The completion popup takes these keys while it is open
+        for sequence in ('<Up>', '<Down>', '<Return>', '<Tab>', '<Escape>'):
+            self.text_area.bind(sequence, lambda event: self.completer.on_key(event))
+        self.text_area.bind('<Control-space>', lambda event: self.completer.complete() or 'break')
+        # Undo is UndoHistory's, not the widget's
+        self.text_area.bind('<<Undo>>', lambda event: self.undo_history.undo() or 'break')
+        for sequence in ('<<Redo>>', '<Control-y>'):
+            self.text_area.bind(sequence, lambda event: self.undo_history.redo() or 'break')
+        self.text_area.bind('<Button-1>', lambda event: self.completer.close(), add='+')
+        self.text_area.bind('<ButtonRelease-1>', lambda event: self.show_matching_bracket(), add='+')
+        self.text_area.tag_configure('folded', elide=True)
+        self.line_numbers.bind('<Button-1>', self.on_gutter_click)
+        # A resize can rewrap lines without moving the first visible one
+        self.text_area.bind('<Configure>', lambda event: self.line_numbers.redraw(force=True))
+
+        # Report every edit to the subsystems that track buffer state
+        self.document = Document()
+        self.undo_history = UndoHistory(self)
+        self.highlight_listeners = [self.minimap.on_highlight]
+        self.edit_listeners = [self.undo_history.on_edit, self.document.on_edit]
+        self.track_edits()
+        self.highlighter = SyntaxHighlighter(self)
+        self.highlight_scheduler = HighlightScheduler(self)
+        self.edit_listeners.append(self.highlighter.on_edit)
+        self.edit_listeners.append(self.highlight_scheduler.on_edit)
+        self.semantic_highlighter = SemanticHighlighter(self)
+        self.edit_listeners.append(self.semantic_highlighter.on_edit)
+        self.edit_listeners.append(self.line_numbers.on_edit)
+        self.edit_listeners.append(self.minimap.on_edit)
+        self.completer = Completer(self)
+        self.edit_listeners.append(self.completer.on_edit)
+        self.structure = StructureIndex(self)
+        self.edit_listeners.append(self.structure.on_edit)
+        self.edit_listeners.append(lambda start, end, text: master.auto_saver.touch(self))
+        self.scroll_listeners = []
+
+        # Add content if provided
+        if content:
+            self.text_area.insert(tk.END, content)
+            self.undo_history.reset()
+            self.text_area.edit_modified(False)
+            # Cached tokens replace the first highlight pass altogether
+            if not master.token_cache.restore(self):
+                self.highlight_scheduler.run()
+
+        # Initialize line numbers
+        self.update_line_numbers()
+
+    def apply_style(self, style):
+        self.text_area.configure(bg=style['bg'], fg=style['fg'], insertbackground=style['cursor'])
+        for tag, options in style['tags'].items():
+            self.text_area.tag_configure(tag, **options)
+        self.line_numbers.set_colors(style['gutter_bg'], style['gutter_fg'])
+        self.minimap.set_style(style)
+
+    def can_hibernate(self):
+        # Only quiet tabs whose text is safe to drop or compress
+        scheduler = self.highlight_scheduler
+        semantic = self.semantic_highlighter
+        return (self.hibernated is None and self.loader is None
+                and not (self.filename and self.is_modified)
+                and scheduler.pending is None and scheduler.future is None and not scheduler.slices
+                and scheduler.cached is None and not scheduler.cached_runs
+                and semantic.pending is None and semantic.future is None and not semantic.runs
+                and self.line_numbers.pending_check is None and not self.scroll_listeners
+                and self.minimap.pending is None and self.minimap.future is None
+                and self not in self.master.auto_saver.jobs and self not in self.master.auto_saver.in_flight)
+
+    def hibernate(self):
+        """Destroy the editor widgets, keeping just enough to rebuild them.
+
+        Text saved on disk is dropped and read back on wake(); anything else
+        is kept zlib-compressed. Undo history and tags are not kept.
+        """
+        text_area = self.text_area
+        content = None
+        if self.is_modified or not self.filename:
+            content = zlib.compress(self.document.get().encode('utf-8', 'surrogatepass'), 1)
+        self.hibernated = {
+            'content': content,
+            'modified': self.is_modified,
+            'cursor': text_area.index(tk.INSERT),
+            'top': text_area.index('@0,0'),
+        }
+
+        widget = text_area._w
+        self.line_numbers.destroy()
+        self.minimap.destroy()
+        text_area.frame.destroy()
+        self.tk.deletecommand(widget)  # the proxy from track_edits()
+        for command in self.edit_commands:
+            self.tk.deletecommand(command)
+        self.completer.cancel()
+        self.structure.cancel()
+        self.undo_history.close()
+        self.text_area = self.line_numbers = self.minimap = None
+        self.highlighter = self.highlight_scheduler = self.semantic_highlighter = None
+        self.completer = self.structure = self.undo_history = None
+        self.document = None
+        self.edit_listeners = []
+        self.highlight_listeners = []
+        self.scroll_listeners = []
+
+    def wake(self):
+        state, self.hibernated = self.hibernated, None
+        if state is None:
+            return
+        self.last_active = time.monotonic()
+        master = self.master
+
+        if state['content'] is not None:
+            self.build_editor(zlib.decompress(state['content']).decode('utf-8', 'surrogatepass'))
+        else:
+            try:
+                large = os.path.getsize(self.filename) >= master.config['large_file_threshold']
+                if large:
+                    self.build_editor()
+                    loader = FileLoader(self, self.filename)
+                    loader.goto = CodeTab.index_key(state['cursor'])
+                    loader.start()
+                    return
+                self.disk_stat = file_stat(self.filename)
+                with open(self.filename, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                self.build_editor()
+                messagebox.showerror("Open Error", str(e))
+                return
+            self.encoding = detect_encoding(data)
+            content = data.decode(self.encoding)
+            self.newline = detect_newline(content)
+            self.saved_hash = content_hash(data)
+            self.build_editor(content.replace('\r\n', '\n').replace('\r', '\n'))
+
+        if state['content'] is not None and self.filename:
+            master.file_watcher.suspect(self.filename)  # not watched while hibernated
+        if state['modified']:
+            self.text_area.edit_modified(True)
+        self.text_area.mark_set(tk.INSERT, state['cursor'])
+        self.text_area.yview(state['top'])
+        self.line_numbers.redraw(force=True)
+
+    def track_edits(self):
+        # Replace the text widget's Tcl command with a proc that reports
+        # every insert, delete and replace (typing, pasting, undo and
+        # programmatic edits) to on_text_command before it runs and to
+        # on_text_edited after. All other commands go straight to the widget,
+        # so their errors reach Tcl callers such as tk_textCopy unchanged
+        widget = self.text_area._w
+        self.text_command = widget + '_orig'
+        self.edit_commands = (widget + '_edit', widget + '_edited')
+        self.pending_edit = None
+        self.tk.call('rename', widget, self.text_command)
+        self.tk.createcommand(self.edit_commands[0], self.on_text_command)
+        self.tk.createcommand(self.edit_commands[1], self.on_text_edited)
+        self.tk.call('proc', widget, 'args', f"""
+            switch -exact -- [lindex $args 0] {{
+                insert - delete - replace {{
+                    if {{[{self.edit_commands[0]} {{*}}$args]}} {{
+                        return {{}}
+                    }}
+                    set result [{self.text_command} {{*}}$args]
+                    {self.edit_commands[1]}
+                    return $result
+                }}
+            }}
+            return [{self.text_command} {{*}}$args]
+        """)
+
+    def on_text_command(self, *args):
+        # Resolve the range an edit is about to replace, for on_text_edited.
+        # Returns 1 when the edit was carried out here instead. An index Tk
+        # cannot resolve is left for the widget itself to report
+        call = self.tk.call
+        command = self.text_command
+        operation = args[0]
+        self.pending_edit = None
+        if len(args) < 2:
+            return 0
+        try:
+            if operation == 'delete' and len(args) > 3:
+                # Several ranges: resolve them all first, then delete back to front
+                ranges = [(call(command, 'index', args[i]), call(command, 'index', args[i + 1]))
+                          for i in range(1, len(args) - 1, 2)]
+                for first, last in sorted(ranges, key=lambda r: self.index_key(r[0]), reverse=True):
+                    self.text_area.delete(first, last)
+                return 1
+
+            start = call(command, 'index', args[1])
+            if operation == 'insert':
+                # Text inserted at 'end' goes in front of the final newline
+                if start == call(command, 'index', 'end'):
+                    start = call(command, 'index', 'end-1c')
+                end = start
+                text = ''.join(args[2::2])
+            else:
+                if operation == 'replace' or len(args) > 2:
+                    end = call(command, 'index', args[2])
+                else:
+                    end = call(command, 'index', start + '+1c')
+                # The final newline can never be deleted
+                if call(command, 'compare', end, '>', 'end-1c'):
+                    end = call(command, 'index', 'end-1c')
+                text = ''.join(args[3::2]) if operation == 'replace' else ''
+        except tk.TclError:
+            return 0
+        self.pending_edit = (self.index_key(start), self.index_key(end), text)
+        return 0
+
+    def on_text_edited(self):
+        edit, self.pending_edit = self.pending_edit, None
+        if edit is not None:
+            start, end, text = edit
+            if text or start < end:
+                self.notify_edit(start, end, text)
+
+    @staticmethod
+    def index_key(index):
+        line, column = index.split('.')
+        return int(line), int(column)
+
+    def notify_edit(self, start, end, text):
+        # start and end are (line, column) positions from before the edit;
+        # the text between them was replaced by text
+        self.edit_count += 1
+        for listener in self.edit_listeners:
+            listener(start, end, text)
+
+    def replace_ranges(self, replacements):
+        # Apply (line, start column, end column, text) replacements, each within
+        # one line and sorted by position, as a single undo step. They bypass
+        # on_text_command and are reported to the listeners as one edit
+        # spanning the affected lines.
+        if not replacements:
+            return
+        call = self.tk.call
+        command = self.text_command
+        first = replacements[0][0]
+        last = replacements[-1][0]
+        old_end = self.index_key(call(command, 'index', f"{last}.0 lineend"))
+        added = sum(text.count('\n') for _, _, _, text in replacements)
+
+        for line, start, end, text in reversed(replacements):
+            call(command, 'replace', f"{line}.{start}", f"{line}.{end}", text)
+
+        text = call(command, 'get', f"{first}.0", f"{last + added}.0 lineend")
+        self.undo_history.begin()
+        try:
+            self.notify_edit((first, 0), old_end, text)
+        finally:
+            self.undo_history.end()
+
+    MAX_DIFF_EDITS = 500  # past this many changed lines the middle is replaced whole
+
+    def replace_text(self, text):
+        """Make the buffer read text, replacing only the lines that differ.
+
+        Applied through the widget as one undo step, so the cursor, the view
+        and the tags of unchanged lines stay where they are.
+        """
+        old, new = text_lines(self.document.get()), text_lines(text)
+        blocks = changed_lines(old, new, self.MAX_DIFF_EDITS)
+        if not blocks:
+            return
+
+        text_area = self.text_area
+        self.undo_history.begin()
+        try:
+            for old_first, old_last, new_first, new_last in reversed(blocks):
+                start = f"{old_first + 1}.0"
+                end = f"{old_last + 1}.0"
+                lines = ''.join(new[new_first:new_last])
+                if old_first == old_last:
+                    text_area.insert(start, lines)
+                elif new_first == new_last:
+                    text_area.delete(start, end)
+                else:
+                    text_area.replace(start, end, lines)
+        finally:
+            self.undo_history.end()
+
+    def goto(self, line, column=0):
+        self.text_area.mark_set(tk.INSERT, f"{line}.{column}")
+        self.text_area.see(tk.INSERT)
+        self.text_area.tag_remove('highlight_line', '1.0', tk.END)
+        self.text_area.tag_add('highlight_line', f"{line}.0", f"{line}.end+1c")
+        self.text_area.tag_config('highlight_line', background='yellow')
+        self.text_area.focus_set()
+
+    def on_text_scroll(self, *args):
+        # Update line numbers when text is scrolled
+        self.text_area.vbar.set(*args)
+        self.line_numbers.redraw()
+        self.minimap.on_scroll()
+        for listener in self.scroll_listeners:
+            listener()
+
+    @instrumented
+    def on_key_release(self, event):
+        # Highlighting is driven by the edits themselves, see HighlightScheduler
+        self.update_line_numbers()
+        self.completer.on_key_release(event)
+        self.show_matching_bracket()
+
+    @instrumented
+    def on_modify(self, event=None):
+        if self.loader:
+            return
+        self.is_modified = self.text_area.edit_modified()
+        if self.is_modified:
+            # Update tab name with asterisk if modified
+            current_tab = self.winfo_parent()
+            current_text = self.master.notebook.tab(current_tab, "text")
+            if not current_text.startswith("*"):
+                self.master.notebook.tab(current_tab, text=f"*{current_text}")
+            
+            self.master.status_bar.config(text="File modified")
+
+    @instrumented
+    def syntax_highlight(self, event=None):
+        # Re-lex the whole buffer, e.g. after a language change
+        self.highlighter.reset()
+        self.highlight_scheduler.run()
+        self.semantic_highlighter.schedule(0)
+        self.structure.reset()
+
+    @instrumented
+    def update_line_numbers(self, event=None):
+        self.line_numbers.redraw()
+
+    def show_matching_bracket(self):
+        # Mark the bracket at the cursor and its match, or flag it if it has none
+        text_area = self.text_area
+        text_area.tag_remove('bracket_match', '1.0', tk.END)
+        text_area.tag_remove('bracket_mismatch', '1.0', tk.END)
+        blocks = self.structure.blocks
+        line, column = self.index_key(text_area.index(tk.INSERT))
+        if line > blocks.count():
+            return
+        item = blocks.item_at(line, column)
+        if item is None:
+            return
+        match = blocks.match(line, item)
+        if match is None or match[1][2] != item[2]:
+            text_area.tag_add('bracket_mismatch', f"{line}.{item[0]}", f"{line}.{item[0] + item[3]}")
+            return
+        other_line, other = match
+        text_area.tag_add('bracket_match', f"{line}.{item[0]}", f"{line}.{item[0] + item[3]}",
+                          f"{other_line}.{other[0]}", f"{other_line}.{other[0] + other[3]}")
+
+    def fold_at(self, line):
+        # The header of the block to fold for a cursor on line, or None
+        blocks = self.structure.blocks
+        if line > blocks.count():
+            return None
+        if blocks.fold_range(line) is not None:
+            return line
+        if self.current_language == 'python':
+            header = blocks.block_start(line)
+            if header is not None and blocks.fold_range(header) is not None:
+                return header
+        opener = blocks.enclosing(line, self.index_key(self.text_area.index(tk.INSERT))[1])
+        if opener is not None and blocks.fold_range(opener[0]) is not None:
+            return opener[0]
+        return None
+
+    def toggle_fold(self, line=None):
+        """Fold the block around line (the cursor's by default), or unfold it.
+
+        Folded lines carry the elided 'folded' tag, so Tk neither lays them
+        out nor draws them however many there are.
+        """
+        text_area = self.text_area
+        if line is None:
+            line = self.index_key(text_area.index(tk.INSERT))[0]
+        folded = text_area.tag_nextrange('folded', f"{line + 1}.0", f"{line + 1}.0+1c")
+        if folded:
+            text_area.tag_remove('folded', *folded)
+        else:
+            header = self.fold_at(line)
+            if header is None:
+                self.master.status_bar.config(text="Nothing to fold here")
+                return
+            first, last = self.structure.blocks.fold_range(header)
+            text_area.tag_add('folded', f"{first}.0", f"{last + 1}.0")
+            cursor = self.index_key(text_area.index(tk.INSERT))[0]
+            if first <= cursor <= last:
+                text_area.mark_set(tk.INSERT, f"{header}.0 lineend")
+        text_area.see(tk.INSERT)
+        self.line_numbers.redraw(force=True)
+
+    def unfold_all(self):
+        self.text_area.tag_remove('folded', '1.0', tk.END)
+        self.line_numbers.redraw(force=True)
+
+    def on_gutter_click(self, event):
+        # Clicking the number of a line that heads a block folds or unfolds it
+        line = self.line_numbers.line_at(event.y)
+        if line is None or line > self.structure.blocks.count():
+            return
+        folded = self.text_area.tag_nextrange('folded', f"{line + 1}.0", f"{line + 1}.0+1c")
+        if folded or self.structure.blocks.fold_range(line) is not None:
+            self.toggle_fold(line)
+
+class LineNumberGutter(tk.Canvas):
+    """Line number gutter that only draws the lines currently on screen.
+
+    A redraw is skipped unless the first visible line, its offset, the line
+    count, the font or the gutter height changed, so typing inside a line or
+    a no-op scroll costs a couple of index lookups regardless of file size.
+    """
+
+    def __init__(self, parent, text_area):
+        self.width = 30
+        super().__init__(parent, width=self.width, highlightthickness=0, borderwidth=0,
+                         takefocus=0, background='lightgray')
+        self.text_area = text_area
+        self.fill = 'black'
+        self.view = None
+        self.font = None
+        self.font_spec = None
+        self.digits = 0
+        self.line_tops = {}
+        self.pending_check = None
+        self.suspended = False
+
+        self.bind('<Configure>', lambda event: self.redraw())
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.bind(sequence, self.on_mouse_wheel)
+
+    @instrumented
+    def redraw(self, force=False):
+        if self.suspended:
+            return
+        text_area = self.text_area
+        first = text_area.index('@0,0')
+        info = text_area.dlineinfo(first)
+        line_count = int(text_area.index('end-1c').split('.')[0])
+        font_spec = str(text_area.cget('font'))
+        height = self.winfo_height()
+
+        view = (first, info[1] if info else None, line_count, font_spec, height)
+        if view == self.view and not force:
+            return
+        self.view = view
+
+        # Follow the text font (zoom) and widen for extra digits
+        if font_spec != self.font_spec:
+            self.font_spec = font_spec
+            self.font = tkfont.Font(font=text_area.cget('font'))
+            self.digits = 0
+        digits = len(str(line_count))
+        if digits != self.digits:
+            self.digits = digits
+            self.width = self.font.measure('0' * (digits + 1)) + 8
+            self.configure(width=self.width)
+
+        self.delete('all')
+        self.line_tops = {}
+        right = self.width - 4
+        index = first
+        while info is not None and info[1] < height:
+            line = int(index.split('.')[0])
+            self.line_tops[line] = info[1]
+            self.create_text(right, info[1], anchor=tk.NE, text=line, font=self.font, fill=self.fill)
+            if line >= line_count:
+                break
+            # Wrapped lines take several display lines; label only their first
+            index = f"{line + 1}.0"
+            if 'folded' in text_area.tag_names(index):
+                # A folded block follows; mark it and skip to the line after
+                self.create_text(2, info[1], anchor=tk.NW, text='+', font=self.font, fill=self.fill)
+                index = text_area.tag_nextrange('folded', index)[1]
+            info = text_area.dlineinfo(index)
+
+    def line_at(self, y):
+        # The line drawn at y, or None below the last one
+        found = None
+        for line, top in sorted(self.line_tops.items(), key=lambda item: item[1]):
+            if top > y:
+                break
+            found = line
+        return found
+
+    def set_colors(self, background, foreground):
+        self.configure(background=background)
+        self.fill = foreground
+        self.itemconfigure('all', fill=foreground)
+
+    def on_edit(self, start, end, text):
+        # Edits that add or remove lines, or that change how a visible line
+        # wraps, move the numbers below them
+        if self.pending_check is not None or self.suspended:
+            return
+        if start[0] != end[0] or '\n' in text or (self.line_tops and start[0] <= max(self.line_tops)):
+            self.pending_check = self.after_idle(self.check_layout)
+
+    def check_layout(self):
+        self.pending_check = None
+        if not self.line_tops:
+            self.redraw()
+            return
+        last = max(self.line_tops)
+        info = self.text_area.dlineinfo(f"{last}.0")
+        self.redraw(force=info is None or info[1] != self.line_tops[last])
+
+    def on_mouse_wheel(self, event):
+        step = -3 if event.num == 4 or event.delta > 0 else 3
+        self.text_area.yview_scroll(step, 'units')
+        return 'break'
+
+_BLANKS = re.compile(r'\s+')
+
+def render_tile(document, lines, states, lexer, palette, columns, row_px):
+    """Render one minimap tile as a binary PPM image.
+
+    Each of lines becomes a row of row_px pixels with one pixel per
+    character, colored by token type; states[n] is the lexer state before
+    lines[n]. palette maps token types, 'bg' and 'fg' to 3-byte colors.
+    Runs on a worker thread.
+    """
+    bg, fg = palette['bg'], palette['fg']
+    blank = bg * columns
+    if lines[-1] - lines[0] == len(lines) - 1:
+        texts = document.get_lines(lines[0], lines[-1]).split('\n')
+    else:
+        texts = [document.get_lines(line, line) for line in lines]
+
+    rows = []
+    for text, state in zip(texts, states):
+        text = text[:columns * 2].expandtabs(4)[:columns]
+        row = bytearray(blank)
+        if text and not text.isspace():
+            row[:len(text) * 3] = fg * len(text)
+            if lexer is not None:
+                for token_type, start, end in lexer.lex(text, state)[1]:
+                    row[start * 3:end * 3] = palette.get(token_type, fg) * (end - start)
+            for match in _BLANKS.finditer(text):
+                start, end = match.span()
+                row[start * 3:end * 3] = bg * (end - start)
+        rows.append(bytes(row) * row_px)
+    return f"P6 {columns} {len(rows) * row_px} 255\n".encode('ascii') + b''.join(rows)
+
+class Minimap(tk.Canvas):
+    """Downsampled overview of a CodeTab's document, drawn from image tiles.
+
+    Every line is a row of ROW_PX pixels; documents of more than MAX_ROWS
+    lines show every step-th line instead. Rows are grouped into tiles of
+    TILE_ROWS, rendered on the highlight worker from a Document snapshot and
+    the highlighter's line states, and kept as PhotoImages. An edit makes
+    stale only the tiles of the lines it touched, or of everything below it
+    when it adds or removes lines, and only stale tiles in view are rendered
+    again; until then the old image stays up. A map taller than the canvas
+    scrolls along with the text.
+    """
+
+    WIDTH = 100  # pixels, one per character column
+    ROW_PX = 2
+    TILE_ROWS = 128
+    MAX_ROWS = 65536
+    MAX_TILES = 48  # tiles kept; the ones farthest from view are dropped
+    RENDER_DELAY_MS = 100
+    POLL_MS = 20
+
+    def __init__(self, parent, tab):
+        super().__init__(parent, width=self.WIDTH, highlightthickness=0, borderwidth=0, takefocus=0)
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.palette = None
+        self.step = 1
+        self.rows = 1
+        self.tiles = {}  # tile -> [PhotoImage, canvas item, version rendered]
+        self.versions = {}  # tile -> version, bumped when its lines change
+        self.version = 0
+        self.pending = None
+        self.future = None
+        self.rendering = None  # (tile, version) in flight
+        self.suspended = False
+        self.viewport = self.create_rectangle(0, 0, 0, 0, width=1)
+
+        self.bind('<Configure>', lambda event: self.schedule())
+        self.bind('<Button-1>', self.on_click)
+        self.bind('<B1-Motion>', self.on_click)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.bind(sequence, self.on_mouse_wheel)
+
+    def set_style(self, style):
+        rgb = lambda color: bytes(value >> 8 for value in self.winfo_rgb(color))
+        palette = {token_type: rgb(options['foreground']) for token_type, options in style['tags'].items()
+                   if 'foreground' in options}
+        palette['bg'] = rgb(style['bg'])
+        palette['fg'] = rgb(style['fg'])
+        self.palette = palette
+        self.configure(background=style['bg'])
+        self.itemconfigure(self.viewport, outline=style['fg'])
+        self.invalidate(1, None)
+
+    def tile_of(self, line):
+        return (line - 1) // self.step // self.TILE_ROWS
+
+    def invalidate(self, first, last):
+        # Mark the tiles of lines first..last (None: to the end) as stale
+        self.version += 1
+        low = self.tile_of(first)
+        if last is None:
+            stale = [tile for tile in self.versions if tile >= low]
+        else:
+            stale = range(low, self.tile_of(last) + 1)
+        for tile in stale:
+            self.versions[tile] = self.version
+        self.schedule()
+
+    def on_edit(self, start, end, text):
+        if '\n' in text or start[0] != end[0]:
+            self.invalidate(start[0], None)  # the lines below moved
+        else:
+            self.invalidate(start[0], start[0])
+
+    def on_highlight(self, first, last):
+        # New lexer states change the colors of those lines
+        self.invalidate(first, last)
+
+    def schedule(self):
+        if self.pending is None and not self.suspended and self.palette is not None:
+            self.pending = self.after(self.RENDER_DELAY_MS, self.refresh)
+
+    def layout(self):
+        # Fit the rows to the document and scroll the map with the text;
+        # returns the first and last map pixel in view
+        line_count = self.tab.document.line_count()
+        step = max(1, -(-line_count // self.MAX_ROWS))
+        if step != self.step:
+            # Every row shows a different line now
+            for image, item, version in self.tiles.values():
+                self.delete(item)
+            self.tiles = {}
+            self.versions = {}
+            self.step = step
+        self.rows = -(-line_count // step)
+        map_height = self.rows * self.ROW_PX
+        height = max(1, self.winfo_height())
+        first, last = self.text_area.yview()
+        if map_height <= height:
+            top = 0
+        else:
+            top = int(first / max(1e-9, 1 - (last - first)) * (map_height - height))
+            top = max(0, min(map_height - height, top))
+        self.configure(scrollregion=(0, 0, self.WIDTH, max(map_height, height)))
+        self.yview_moveto(top / max(map_height, height))
+        self.coords(self.viewport, 0, first * map_height, self.WIDTH - 1, last * map_height)
+        self.tag_raise(self.viewport)
+        return top, top + height
+
+    def on_scroll(self):
+        if not self.suspended and self.palette is not None:
+            self.refresh()
+
+    def refresh(self):
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+            self.pending = None
+        if not self.winfo_ismapped():
+            return  # hidden; <Configure> brings it up to date once shown
+        top, bottom = self.layout()
+        tile_px = self.TILE_ROWS * self.ROW_PX
+        tile_count = -(-self.rows // self.TILE_ROWS)
+        visible = range(top // tile_px, min(tile_count, bottom // tile_px + 1))
+
+        # Drop tiles past the end and, over the limit, those farthest from view
+        for tile in [tile for tile in self.tiles if tile >= tile_count]:
+            self.delete(self.tiles.pop(tile)[1])
+        if len(self.tiles) > self.MAX_TILES:
+            middle = (visible.start + visible.stop) / 2
+            for tile in sorted(self.tiles, key=lambda tile: -abs(tile - middle))[:len(self.tiles) - self.MAX_TILES]:
+                self.delete(self.tiles.pop(tile)[1])
+
+        if self.future is None:
+            for tile in visible:
+                entry = self.tiles.get(tile)
+                version = self.versions.setdefault(tile, self.version)
+                if entry is None or entry[2] != version:
+                    self.render(tile, version)
+                    break
+
+    def render(self, tile, version):
+        tab = self.tab
+        first_row = tile * self.TILE_ROWS
+        last_row = min(self.rows, first_row + self.TILE_ROWS)
+        lines = [row * self.step + 1 for row in range(first_row, last_row)]
+        line_states = tab.highlighter.line_states
+        dirty = SyntaxHighlighter.DIRTY
+        states = []
+        for line in lines:
+            state = line_states[line - 1] if line - 1 < len(line_states) else None
+            states.append(None if state is dirty else state)
+        lexer = tab.master.get_lexer(tab.current_language)
+        self.rendering = (tile, version)
+        self.future = tab.master.highlight_pool.submit(
+            render_tile, tab.document.snapshot(), lines, states, lexer, self.palette, self.WIDTH, self.ROW_PX
+        )
+        self.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        if not self.future.done():
+            self.after(self.POLL_MS, self.poll)
+            return
+        future, self.future = self.future, None
+        tile, version = self.rendering
+        self.rendering = None
+        try:
+            data = future.result()
+        except Exception:
+            data = None  # e.g. the document shrank meanwhile; rendered again below
+        if data is not None and self.versions.get(tile) == version:
+            image = tk.PhotoImage(master=self, data=data, format='PPM')
+            entry = self.tiles.get(tile)
+            if entry is None:
+                item = self.create_image(0, tile * self.TILE_ROWS * self.ROW_PX, anchor=tk.NW, image=image)
+                self.tiles[tile] = [image, item, version]
+            else:
+                self.itemconfigure(entry[1], image=image)
+                entry[0], entry[2] = image, version
+            self.tag_raise(self.viewport)
+        self.refresh()
+
+    def on_click(self, event):
+        # Center the text on the line under the pointer
+        row = int(self.canvasy(event.y)) // self.ROW_PX
+        line_count = self.tab.document.line_count()
+        line = min(line_count, row * self.step + 1)
+        first, last = self.text_area.yview()
+        self.text_area.yview_moveto(max(0.0, (line - 1) / line_count - (last - first) / 2))
+        return 'break'
+
+    def on_mouse_wheel(self, event):
+        step = -3 if event.num == 4 or event.delta > 0 else 3
+        self.text_area.yview_scroll(step, 'units')
+        return 'break'
+
+_ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+
+class _Piece:
+    """Immutable treap node holding one piece of a Document's text."""
+
+    __slots__ = ('text', 'left', 'right', 'priority', 'length', 'newlines', 'own_newlines')
+
+    def __init__(self, text, left=None, right=None, priority=None):
+        self.text = text
+        self.left = left
+        self.right = right
+        self.priority = random.random() if priority is None else priority
+        self.own_newlines = text.count('\n')
+        self.length = len(text)
+        self.newlines = self.own_newlines
+        if left is not None:
+            self.length += left.length
+            self.newlines += left.newlines
+        if right is not None:
+            self.length += right.length
+            self.newlines += right.newlines
+
+def _split(node, offset):
+    # (pieces before offset, pieces from offset on)
+    if node is None:
+        return None, None
+    left_length = node.left.length if node.left is not None else 0
+    if offset <= left_length:
+        left, right = _split(node.left, offset)
+        return left, _merge(right, _Piece(node.text, None, node.right, node.priority))
+    offset -= left_length
+    if offset < len(node.text):
+        # Both halves are new pieces with random priorities of their own;
+        # halves sharing one priority would pile up into a list, and merging
+        # on the way back up keeps the heap order above them
+        return (_merge(node.left, _Piece(node.text[:offset])),
+                _merge(_Piece(node.text[offset:]), node.right))
+    left, right = _split(node.right, offset - len(node.text))
+    return _merge(_Piece(node.text, node.left, None, node.priority), left), right
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return _Piece(left.text, left.left, _merge(left.right, right), left.priority)
+    return _Piece(right.text, _merge(left, right.left), right.right, right.priority)
+
+def _append(node, text, limit):
+    # node with text added to its last piece, or None if that piece is full
+    if node.right is not None:
+        right = _append(node.right, text, limit)
+        return right and _Piece(node.text, node.left, right, node.priority)
+    if len(node.text) + len(text) > limit:
+        return None
+    return _Piece(node.text + text, node.left, None, node.priority)
+
+def _build(texts, low=0, high=None, ceiling=1.0):
+    # Balanced treap over texts[low:high]. Each root draws the largest of as
+    # many uniform priorities below ceiling as its subtree has nodes, so the
+    # tree looks like one grown from random inserts.
+    if high is None:
+        high = len(texts)
+    if low >= high:
+        return None
+    middle = (low + high) // 2
+    priority = ceiling * random.random() ** (1.0 / (high - low))
+    return _Piece(texts[middle],
+                  _build(texts, low, middle, priority),
+                  _build(texts, middle + 1, high, priority),
+                  priority)
+
+class Document:
+    """The text of a CodeTab, kept outside Tk as a persistent rope.
+
+    The text is split into pieces of at most PIECE_SIZE characters held in a
+    treap ordered by position. Every node knows the length and newline count
+    of its subtree, so edits, offset/line conversion and slicing take
+    O(log n) steps plus the size of what is read. Nodes are never modified;
+    an edit builds new nodes along one path, which makes snapshot() O(1)
+    and lets worker threads read a snapshot while the user keeps typing.
+
+    Lines are 1-based and columns 0-based and counted as in Tk indices,
+    offsets count code points. The Tk widget stays the source of truth;
+    on_edit mirrors each edit it reports.
+    """
+
+    PIECE_SIZE = 4096
+    # Tcl 8.6 keeps characters outside the BMP as surrogate pairs, so Tk
+    # columns count each of them twice
+    SURROGATE_COLUMNS = tk.TclVersion < 9
+
+    def __init__(self, text='', _root=None):
+        self.root = _root if _root is not None or not text else self._pieces(text)
+
+    def _pieces(self, text):
+        size = self.PIECE_SIZE
+        return _build([text[i:i + size] for i in range(0, len(text), size)])
+
+    def __len__(self):
+        return self.root.length if self.root is not None else 0
+
+    def line_count(self):
+        return (self.root.newlines if self.root is not None else 0) + 1
+
+    def snapshot(self):
+        return Document(_root=self.root)
+
+    def insert(self, offset, text):
+        if not text:
+            return
+        left, right = _split(self.root, offset)
+        if left is not None and len(text) < self.PIECE_SIZE:
+            appended = _append(left, text, self.PIECE_SIZE)
+            if appended is not None:
+                self.root = _merge(appended, right)
+                return
+        self.root = _merge(_merge(left, self._pieces(text)), right)
+
+    def delete(self, start, end):
+        if start >= end:
+            return
+        left, rest = _split(self.root, start)
+        _, right = _split(rest, end - start)
+        self.root = _merge(left, right)
+
+    def replace(self, start, end, text):
+        self.delete(start, end)
+        self.insert(start, text)
+
+    def line_offset(self, line):
+        # Offset of the first character of line
+        if line <= 1:
+            return 0
+        count = line - 1  # newlines before the line
+        node = self.root
+        offset = 0
+        while node is not None:
+            left_newlines = node.left.newlines if node.left is not None else 0
+            if count <= left_newlines:
+                node = node.left
+                continue
+            count -= left_newlines
+            offset += node.left.length if node.left is not None else 0
+            if count <= node.own_newlines:
+                position = -1
+                for _ in range(count):
+                    position = node.text.find('\n', position + 1)
+                return offset + position + 1
+            count -= node.own_newlines
+            offset += len(node.text)
+            node = node.right
+        return len(self)
+
+    def offset(self, line, column=0):
+        # Offset of the Tk position line.column
+        start = self.line_offset(line)
+        if column and self.SURROGATE_COLUMNS:
+            text = self.get(start, start + column)
+            if _ASTRAL.search(text):
+                columns = 0
+                for index, char in enumerate(text):
+                    if columns >= column:
+                        return start + index
+                    columns += 2 if char > '\uffff' else 1
+                return start + len(text)
+        return start + column
+
+    def position(self, offset):
+        # The Tk position (line, column) of offset
+        node = self.root
+        line = 1
+        remaining = offset
+        while node is not None:
+            left_length = node.left.length if node.left is not None else 0
+            if remaining < left_length:
+                node = node.left
+                continue
+            line += node.left.newlines if node.left is not None else 0
+            remaining -= left_length
+            if remaining < len(node.text):
+                line += node.text.count('\n', 0, remaining)
+                break
+            line += node.own_newlines
+            remaining -= len(node.text)
+            node = node.right
+        start = self.line_offset(line)
+        column = offset - start
+        if column and self.SURROGATE_COLUMNS:
+            column += len(_ASTRAL.findall(self.get(start, offset)))
+        return line, column
+
+    def chunks(self, start=0, end=None, size=65536):
+        """Yield the text between offsets start and end in pieces of about size."""
+        if end is None:
+            end = len(self)
+        pending = []
+        pending_size = 0
+        stack = []
+        node, base = self.root, 0  # base is the offset where node's subtree starts
+        while True:
+            # Walk down to the leftmost piece that ends after start
+            while node is not None and base + node.length > start:
+                stack.append((node, base))
+                if node.left is not None and start < base + node.left.length:
+                    node = node.left
+                else:
+                    node = None
+            if not stack:
+                break
+            node, base = stack.pop()
+            text_start = base + (node.left.length if node.left is not None else 0)
+            if text_start >= end:
+                break
+            text_end = text_start + len(node.text)
+            if text_end > start:
+                piece = node.text[max(start - text_start, 0):min(end, text_end) - text_start]
+                pending.append(piece)
+                pending_size += len(piece)
+                if pending_size >= size:
+                    yield ''.join(pending)
+                    pending = []
+                    pending_size = 0
+            if text_end >= end:
+                break
+            node, base = node.right, text_end
+        if pending:
+            yield ''.join(pending)
+
+    def get(self, start=0, end=None):
+        return ''.join(self.chunks(start, end))
+
+    def get_lines(self, first, last):
+        # Lines first..last without the final newline, like Tk's first.0 to last.end
+        end = self.line_offset(last + 1)
+        if last < self.line_count():
+            end -= 1
+        return self.get(self.line_offset(first), end)
+
+    def on_edit(self, start, end, text):
+        self.replace(self.offset(*start), self.offset(*end), text)
+
+def file_stat(filename):
+    # Cheap fingerprint of a file's current version; None if it is gone
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def line_diff(old, new, max_edits):
+    """Blocks (old_first, old_last, new_first, new_last) turning old into new.
+
+    Myers' greedy shortest edit script over two lists of lines, which costs
+    O((N + M) * D) for D inserted or deleted lines, so the usual external
+    change of a few lines in a big file is cheap. Returns None once D would
+    exceed max_edits.
+    """
+    n, m = len(old), len(new)
+    v = [0] * (2 * max_edits + 3)  # indexed by diagonal k = x - y, may be negative
+    trace = []
+    for d in range(max_edits + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and old[x] == new[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+    else:
+        return None
+
+    # Walk the trace back from the end, collecting the matched lines
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = max(v[previous_k], 0) if d else 0
+        previous_y = previous_x - previous_k if d else 0
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x, y = previous_x, previous_y
+    matches.reverse()
+    matches.append((n, m))
+
+    blocks = []
+    old_first = new_first = 0
+    for x, y in matches:
+        if x > old_first or y > new_first:
+            blocks.append((old_first, x, new_first, y))
+        old_first, new_first = x + 1, y + 1
+    return blocks
+
+def text_lines(text):
+    # The lines of text with their newlines; they join back into text
+    lines = text.split('\n')
+    return [line + '\n' for line in lines[:-1]] + [lines[-1]]
+
+def changed_lines(old, new, max_edits):
+    """line_diff's blocks after skipping the lines old and new start and end with.
+
+    A single block replaces everything in between when that takes more than
+    max_edits; there are no blocks when old and new are the same.
+    """
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if not old_middle and not new_middle:
+        return []
+    blocks = line_diff(old_middle, new_middle, max_edits)
+    if blocks is None:
+        blocks = [(0, len(old_middle), 0, len(new_middle))]
+    return [(prefix + old_first, prefix + old_last, prefix + new_first, prefix + new_last)
+            for old_first, old_last, new_first, new_last in blocks]
+
+def common_prefix(a, b, block=65536):
+    # Length of the start a and b share, compared a block at a time in C
+    limit = min(len(a), len(b))
+    low = 0
+    while low < limit and a[low:low + block] == b[low:low + block]:
+        low += block
+    high = min(low + block, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return min(low, limit)
+
+def common_suffix(a, b, limit, block=65536):
+    # Length of the end a and b share, at most limit
+    low = 0
+    while low + block <= limit and a[len(a) - low - block:len(a) - low] == b[len(b) - low - block:len(b) - low]:
+        low += block
+    high = min(low + block, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return min(low, limit)
+
+class UndoBudget:
+    """Keeps the undo history of all tabs under the 'undo_memory' setting.
+
+    Each UndoHistory adds its resident bytes to used; while the total is over
+    the limit, the history holding the most spills its oldest step.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.histories = set()
+        self.used = 0
+
+    def enforce(self):
+        limit = self.app.config['undo_memory']
+        while self.used > limit:
+            largest = max(self.histories, key=lambda history: history.memory, default=None)
+            if largest is None or not largest.spill():
+                break
+
+class _UndoStep:
+    # One undo: hunks [offset, removed, inserted] in the order they were
+    # applied, kept as a list, as zlib-compressed JSON (packed) or at
+    # (position, length) in the spill log (spilled)
+    __slots__ = ('hunks', 'packed', 'spilled', 'size')
+
+    def __init__(self, hunks, packed=None):
+        self.hunks = hunks
+        self.packed = packed
+        self.spilled = None
+        self.size = 0  # resident bytes, estimated
+
+class UndoHistory:
+    """Undo and redo for a CodeTab, bounded in memory.
+
+    Every edit the tab reports is recorded in document offsets, before the
+    Document applies it, as a hunk (offset, removed, inserted). Hunks are
+    grouped into steps, one per undo: keystrokes typing or deleting one word
+    with pauses under COALESCE_SECONDS, everything between begin() and end(),
+    or any other single edit. A hunk over DIFF_CHARS is cut down to the lines
+    that really changed, and a step over PACK_CHARS is kept compressed.
+
+    Once the steps of the tab take more than 'undo_tab_memory' bytes, or
+    those of all tabs more than 'undo_memory' (see UndoBudget), the oldest
+    are spilled to a compressed log in a temporary file instead of dropped.
+    Undo and redo read back just the step they apply, so they cost the size
+    of that step at any depth.
+    """
+
+    COALESCE_SECONDS = 2.0
+    COALESCE_CHARS = 256  # longest run of keystrokes in one step
+    DIFF_CHARS = 4096
+    PACK_CHARS = 4096
+    MAX_DIFF_EDITS = 500
+    HUNK_BYTES = 64  # estimated cost of a hunk besides its text
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.budget = tab.master.undo_budget
+        self.budget.histories.add(self)
+        self.undo_stack = []
+        self.redo_stack = []
+        # The oldest steps of each stack are the spilled ones
+        self.undo_spilled = 0
+        self.redo_spilled = 0
+        self.memory = 0
+        self.log = None
+        self.open = None  # the step still taking edits
+        self.last_edit = 0
+        self.groups = 0
+        self.replaying = False
+
+    def on_edit(self, start, end, text):
+        # Runs before Document.on_edit, so the removed text is still there
+        if self.replaying or self.tab.loader is not None:
+            return
+        document = self.tab.document
+        offset = document.offset(*start)
+        removed = document.get(offset, document.offset(*end)) if start < end else ''
+        if self.redo_stack:
+            self.clear_redo()
+        now = time.monotonic()
+        if self.groups:
+            self.open.hunks.append([offset, removed, text])
+        elif not self.coalesce(offset, removed, text, now):
+            self.flush()
+            self.open = _UndoStep([[offset, removed, text]])
+            if len(removed) + len(text) != 1:
+                self.flush()  # only keystrokes run together
+        self.last_edit = now
+
+    def coalesce(self, offset, removed, inserted, now):
+        # Extend the open step with a keystroke that continues its word
+        step = self.open
+        if (step is None or len(removed) + len(inserted) != 1
+                or now - self.last_edit > self.COALESCE_SECONDS):
+            return False
+        hunk = step.hunks[0]
+        if len(hunk[1]) + len(hunk[2]) >= self.COALESCE_CHARS:
+            return False
+        word = lambda char: char.isalnum() or char == '_'
+        if inserted:
+            # Typing: a new word starts a new step
+            if hunk[1] or offset != hunk[0] + len(hunk[2]) or word(inserted) and not word(hunk[2][-1]):
+                return False
+            hunk[2] += inserted
+        elif hunk[2]:
+            return False
+        elif offset + 1 == hunk[0]:
+            # Backspace: stops before the space ahead of a deleted word
+            if word(hunk[1][0]) and not word(removed):
+                return False
+            hunk[0] = offset
+            hunk[1] = removed + hunk[1]
+        elif offset == hunk[0]:
+            # Delete: stops at the start of the next word
+            if word(removed) and not word(hunk[1][-1]):
+                return False
+            hunk[1] += removed
+        else:
+            return False
+        return True
+
+    def begin(self):
+        # Record everything up to the matching end() as a single step
+        if not self.groups:
+            self.flush()
+            self.open = _UndoStep([])
+        self.groups += 1
+
+    def end(self):
+        self.groups -= 1
+        if not self.groups:
+            self.flush()
+
+    def flush(self):
+        # Push the open step onto the undo stack
+        step, self.open = self.open, None
+        if step is None:
+            return
+        hunks = []
+        for hunk in step.hunks:
+            if len(hunk[1]) + len(hunk[2]) > self.DIFF_CHARS:
+                hunks.extend(self.compact(*hunk))
+            else:
+                hunks.append(hunk)
+        if hunks:
+            step.hunks = hunks
+            self.push(self.undo_stack, step)
+
+    def compact(self, offset, removed, inserted):
+        # The hunks of a large edit limited to the lines it changes, in the
+        # order they apply, as replace_text would have made them
+        start = removed.rfind('\n', 0, common_prefix(removed, inserted)) + 1
+        end = common_suffix(removed, inserted, min(len(removed), len(inserted)) - start)
+        offset += start
+        old = text_lines(removed[start:len(removed) - end])
+        new = text_lines(inserted[start:len(inserted) - end])
+        hunks = []
+        done = 0  # lines of new before offset
+        for old_first, old_last, new_first, new_last in changed_lines(old, new, self.MAX_DIFF_EDITS):
+            offset += sum(map(len, new[done:new_first]))
+            done = new_first
+            hunks.append([offset, ''.join(old[old_first:old_last]), ''.join(new[new_first:new_last])])
+        return hunks
+
+    def push(self, stack, step):
+        if step.packed is None:
+            chars = sum(len(hunk[1]) + len(hunk[2]) for hunk in step.hunks)
+            if chars > self.PACK_CHARS:
+                step.packed = zlib.compress(json.dumps(step.hunks).encode('ascii'), 1)
+                step.hunks = None
+            else:
+                step.size = chars + self.HUNK_BYTES * len(step.hunks)
+        if step.packed is not None:
+            step.size = len(step.packed) + self.HUNK_BYTES
+        stack.append(step)
+        self.charge(step.size)
+        limit = self.tab.master.config['undo_tab_memory']
+        while self.memory > limit and self.spill():
+            pass
+        self.budget.enforce()
+
+    def pop(self, stack):
+        # The top step of stack, resident again, and its hunks
+        step = stack.pop()
+        if step.spilled is not None:
+            position, length = step.spilled
+            self.log.seek(position)
+            step.packed = self.log.read(length)
+            step.spilled = None
+            if stack is self.undo_stack:
+                self.undo_spilled -= 1
+            else:
+                self.redo_spilled -= 1
+            if not self.undo_spilled and not self.redo_spilled:
+                self.log.seek(0)
+                self.log.truncate()
+        else:
+            self.charge(-step.size)
+        if step.hunks is not None:
+            return step, step.hunks
+        return step, json.loads(zlib.decompress(step.packed))
+
+    def spill(self):
+        # Move the oldest resident step to the log; False if there is none
+        if self.undo_spilled < len(self.undo_stack):
+            step = self.undo_stack[self.undo_spilled]
+            self.undo_spilled += 1
+        elif self.redo_spilled < len(self.redo_stack):
+            step = self.redo_stack[self.redo_spilled]
+            self.redo_spilled += 1
+        else:
+            return False
+        data = step.packed
+        if data is None:
+            data = zlib.compress(json.dumps(step.hunks).encode('ascii'), 1)
+        if self.log is None:
+            self.log = tempfile.TemporaryFile(prefix='nobu-undo-')
+        self.log.seek(0, os.SEEK_END)
+        step.spilled = (self.log.tell(), len(data))
+        self.log.write(data)
+        step.hunks = step.packed = None
+        self.charge(-step.size)
+        step.size = 0
+        return True
+
+    def charge(self, size):
+        self.memory += size
+        self.budget.used += size
+
+    def clear_redo(self):
+        self.charge(-sum(step.size for step in self.redo_stack))
+        self.redo_stack = []
+        self.redo_spilled = 0
+
+    def undo(self):
+        self.flush()
+        if not self.undo_stack:
+            return
+        step, hunks = self.pop(self.undo_stack)
+        self.apply([(offset, inserted, removed) for offset, removed, inserted in reversed(hunks)])
+        self.push(self.redo_stack, step)
+
+    def redo(self):
+        self.flush()
+        if not self.redo_stack:
+            return
+        step, hunks = self.pop(self.redo_stack)
+        self.apply(hunks)
+        self.push(self.undo_stack, step)
+
+    def apply(self, hunks):
+        # Make the hunks' edits through the widget, so every listener but
+        # this one sees them, and leave the cursor after the last
+        text_area = self.tab.text_area
+        document = self.tab.document
+        self.replaying = True
+        try:
+            for offset, removed, inserted in hunks:
+                start = '%d.%d' % document.position(offset)
+                if removed:
+                    end = '%d.%d' % document.position(offset + len(removed))
+                    text_area.replace(start, end, inserted)
+                else:
+                    text_area.insert(start, inserted)
+        finally:
+            self.replaying = False
+        text_area.mark_set(tk.INSERT, '%d.%d' % document.position(offset + len(inserted)))
+        text_area.see(tk.INSERT)
+
+    def reset(self):
+        # Forget everything, e.g. once a file has been loaded
+        self.open = None
+        self.groups = 0
+        self.charge(-self.memory)
+        self.undo_stack = []
+        self.redo_stack = []
+        self.undo_spilled = self.redo_spilled = 0
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def close(self):
+        self.reset()
+        self.budget.histories.discard(self)
+
+class FileChangedError(Exception):
+    """The file changed on disk since the tab last read or wrote it."""
+
+class AutoSaver:
+    """Saves modified tabs in the background, a while after their last edit.
+
+    Every edit restarts that tab's timer on the Tk loop. When it fires, an
+    O(1) snapshot of the tab's Document is handed to a small writer pool;
+    results come back through a queue that the Tk loop polls, so no Tk call
+    is made off the main thread and failures only show in the status bar.
+    Slow or failing writes stretch the delay, quick ones shrink it back.
+    """
+
+    WORKERS = 2
+    MAX_IN_FLIGHT = 4
+    SLOW_WRITE = 2.0  # seconds
+    MAX_BACKOFF = 16
+    POLL_MS = 200
+
+    def __init__(self, app):
+        self.app = app
+        self.pool = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix='nobu-autosave')
+        self.results = queue.Queue()
+        self.jobs = {}
+        self.in_flight = set()
+        self.backoff = 1
+        self.polling = False
+
+    def delay_ms(self):
+        return int(self.app.config['auto_save_interval'] * self.backoff * 1000)
+
+    def touch(self, tab):
+        # Restart the tab's countdown; only tabs backed by a file are saved
+        if not tab.filename:
+            return
+        job = self.jobs.pop(tab, None)
+        if job is not None:
+            tab.after_cancel(job)
+        self.jobs[tab] = tab.after(self.delay_ms(), lambda: self.snapshot(tab))
+
+    def snapshot(self, tab):
+        self.jobs.pop(tab, None)
+        if tab.winfo_parent() not in self.app.notebook.tabs() or tab.hibernated:
+            return
+        if not tab.filename or tab.loader or not tab.text_area.edit_modified():
+            return
+        if tab.disk_conflict is not None:
+            self.app.status_bar.config(text=f"Auto-save paused, changed on disk: {tab.filename}")
+            return
+        if tab in self.in_flight or len(self.in_flight) >= self.MAX_IN_FLIGHT:
+            # Busy writer; try again later instead of piling up snapshots
+            self.touch(tab)
+            return
+
+        job = (tab, tab.filename, tab.edit_count)
+        chunks = tab.document.snapshot().chunks()
+        self.in_flight.add(tab)
+        future = self.pool.submit(
+            self.write, tab, tab.filename, chunks, tab.encoding, tab.newline, tab.saved_hash, tab.save_serial
+        )
+        future.add_done_callback(lambda future: self.results.put((job, future)))
+        if not self.polling:
+            self.polling = True
+            self.app.after(self.POLL_MS, self.poll)
+
+    @staticmethod
+    @instrumented
+    def write(tab, filename, chunks, encoding, newline, saved_hash, serial):
+        # Runs on a writer thread; touches no Tk state
+        with tab.write_lock:
+            if tab.save_serial != serial:
+                return None, 0  # saved by hand in the meantime
+            if tab.disk_stat is not None and file_stat(filename) != tab.disk_stat:
+                raise FileChangedError(filename)  # never write over someone else's changes
+            started = time.monotonic()
+            written = write_atomically(filename, chunks, encoding, newline, skip_hash=saved_hash)
+            tab.save_serial += 1
+            tab.disk_stat = file_stat(filename)
+            return written, time.monotonic() - started
+
+    def poll(self):
+        while True:
+            try:
+                (tab, filename, edit_count), future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight.discard(tab)
+            self.finish(tab, filename, edit_count, future)
+
+        if self.in_flight:
+            self.app.after(self.POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def finish(self, tab, filename, edit_count, future):
+        status_bar = self.app.status_bar
+        try:
+            written, elapsed = future.result()
+        except FileChangedError:
+            # The watcher decides what happens to the tab
+            status_bar.config(text=f"Auto-save skipped, changed on disk: {filename}")
+            self.app.file_watcher.suspect(filename)
+            return
+        except Exception as e:
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+            status_bar.config(text=f"Auto-save failed: {filename}: {e}")
+            self.touch(tab)
+            return
+
+        if elapsed > self.SLOW_WRITE:
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+        else:
+            self.backoff = max(self.backoff // 2, 1)
+
+        if written:
+            tab.saved_hash = written
+        # Edits made after the snapshot keep the tab modified; their own
+        # timer is already running
+        if tab.filename == filename and tab.edit_count == edit_count:
+            self.app.mark_saved(tab)
+            status_bar.config(text=f"Auto-saved: {filename}")
+
+class TabHibernator:
+    """Hibernates background tabs to keep memory flat with many tabs open.
+
+    Every CHECK_MS, tabs that have not been selected for hibernate_after
+    seconds are hibernated, then the least recently selected ones go too
+    until the estimated size of the live tabs fits tab_memory_budget. The
+    estimate is BYTES_PER_CHAR per character, roughly what the Tk widget,
+    its tags and undo history and the Document cost together. A tab wakes
+    up as soon as it is selected.
+    """
+
+    CHECK_MS = 30 * 1000
+    BYTES_PER_CHAR = 8
+
+    def __init__(self, app):
+        self.app = app
+        self.current = None
+        self.app.after(self.CHECK_MS, self.check)
+
+    def tabs(self):
+        notebook = self.app.notebook
+        return [notebook.nametowidget(tab_id).winfo_children()[0] for tab_id in notebook.tabs()]
+
+    def on_tab_changed(self, event=None):
+        now = time.monotonic()
+        if self.current is not None:
+            self.current.last_active = now  # it was in use until now
+            if self.current.completer is not None:
+                self.current.completer.close()
+        selected = self.app.notebook.select()
+        if not selected:
+            self.current = None
+            return
+        self.current = self.app.notebook.nametowidget(selected).winfo_children()[0]
+        self.current.last_active = now
+        self.current.wake()
+
+    def check(self):
+        try:
+            self.enforce()
+        finally:
+            self.app.after(self.CHECK_MS, self.check)
+
+    def enforce(self):
+        config = self.app.config
+        now = time.monotonic()
+        live = [tab for tab in self.tabs() if not tab.hibernated and tab is not self.current]
+        live.sort(key=lambda tab: tab.last_active)
+        used = sum(len(tab.document) for tab in self.tabs() if not tab.hibernated) * self.BYTES_PER_CHAR
+        for tab in live:
+            idle = now - tab.last_active >= config['hibernate_after']
+            if not idle and used <= config['tab_memory_budget']:
+                break
+            if tab.can_hibernate():
+                used -= len(tab.document) * self.BYTES_PER_CHAR
+                tab.hibernate()
+
+class Inotify:
+    """Just enough of inotify, through ctypes, to watch directories.
+
+    Events are read on a daemon thread and queued as (watch descriptor,
+    mask, name).
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    @classmethod
+    def create(cls):
+        # None where inotify is not available
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.events = queue.Queue()
+        threading.Thread(target=self.read, name='nobu-inotify', daemon=True).start()
+
+    def add(self, directory):
+        # Returns the watch descriptor, or -1 on failure
+        return self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+
+    def remove(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError:
+                return
+            offset = 0
+            while offset + 16 <= len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                self.events.put((wd, mask, os.fsdecode(name)))
+                offset += 16 + length
+
+def stat_files(paths):
+    # Runs on a worker thread: file_stat() of every path
+    return {path: file_stat(path) for path in paths}
+
+class FileWatcher:
+    """Notices when the files of open tabs change on disk.
+
+    On Linux the directories of the open files are watched with inotify;
+    elsewhere all of them are stat-ed in one batch on a worker thread every
+    POLL_MS. A file reported either way is read and hashed on the worker,
+    once it has been quiet for SETTLE_MS, and only a hash that differs from
+    the tab's saved_hash counts as a change, so Nobu's own saves are
+    ignored. An unmodified tab is then reloaded through a line diff; a
+    modified one asks first, and if its edits are kept auto-save leaves the
+    file alone until the tab is saved by hand.
+    """
+
+    TICK_MS = 250
+    POLL_MS = 2000
+    SETTLE_MS = 200
+    DELETED = 'deleted'  # disk_conflict of a file deleted on disk
+
+    def __init__(self, app):
+        self.app = app
+        self.worker = SerialWorker('nobu-watcher')
+        self.inotify = Inotify.create()
+        self.watches = {}  # directory -> watch descriptor
+        self.directories = {}  # watch descriptor -> directory
+        self.stats = {}  # path -> file_stat() at the last poll
+        self.polling = None  # future of the poll in flight
+        self.next_poll = 0
+        self.suspects = {}  # path -> time of its latest report
+        self.checking = {}  # tab -> future reading its file
+        app.after(self.TICK_MS, self.tick)
+
+    def open_tabs(self):
+        # path -> tab for every tab whose file is worth watching
+        tabs = {}
+        for tab_id in self.app.notebook.tabs():
+            tab = self.app.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab.filename and tab.hibernated is None and tab.loader is None:
+                tabs[os.path.abspath(tab.filename)] = tab
+        return tabs
+
+    def suspect(self, path):
+        self.suspects[os.path.abspath(path)] = time.monotonic()
+
+    def tick(self):
+        try:
+            tabs = self.open_tabs()
+            if self.inotify is not None:
+                self.watch(tabs)
+            else:
+                self.poll(tabs)
+            self.check(tabs)
+        finally:
+            self.app.after(self.TICK_MS, self.tick)
+
+    def watch(self, tabs):
+        inotify = self.inotify
+        wanted = {os.path.dirname(path) for path in tabs}
+        for directory in wanted - set(self.watches):
+            wd = inotify.add(directory)
+            if wd >= 0:
+                self.watches[directory] = wd
+                self.directories[wd] = directory
+        for directory in set(self.watches) - wanted:
+            wd = self.watches.pop(directory)
+            self.directories.pop(wd, None)
+            inotify.remove(wd)
+
+        while True:
+            try:
+                wd, mask, name = inotify.events.get_nowait()
+            except queue.Empty:
+                break
+            if mask & Inotify.IN_Q_OVERFLOW:
+                for path in tabs:
+                    self.suspect(path)
+            elif mask & Inotify.IN_IGNORED:
+                # The directory is gone; watched again if it comes back
+                directory = self.directories.pop(wd, None)
+                if directory is not None and self.watches.get(directory) == wd:
+                    del self.watches[directory]
+            elif wd in self.directories:
+                path = os.path.join(self.directories[wd], name)
+                if path in tabs:
+                    self.suspect(path)
+
+    def poll(self, tabs):
+        if self.polling is not None:
+            if not self.polling.done():
+                return
+            future, self.polling = self.polling, None
+            for path, stat in future.result().items():
+                if path in self.stats and self.stats[path] != stat:
+                    self.suspect(path)
+                self.stats[path] = stat
+            for path in set(self.stats) - set(tabs):
+                del self.stats[path]
+        now = time.monotonic()
+        if now >= self.next_poll and tabs:
+            self.next_poll = now + self.POLL_MS / 1000
+            self.polling = self.worker.submit(stat_files, list(tabs))
+
+    def check(self, tabs):
+        now = time.monotonic()
+        for path, reported in list(self.suspects.items()):
+            tab = tabs.get(path)
+            if tab is None:
+                del self.suspects[path]
+            elif now - reported >= self.SETTLE_MS / 1000 and tab not in self.checking:
+                del self.suspects[path]
+                self.checking[tab] = self.worker.submit(self.read, tab, path)
+
+        for tab, future in list(self.checking.items()):
+            if not future.done():
+                continue
+            del self.checking[tab]
+            path, data, digest, stat = future.result()
+            if tabs.get(path) is tab:
+                self.changed(tab, path, data, digest, stat)
+
+    @staticmethod
+    def read(tab, path):
+        # Runs on the worker; the lock keeps a save from landing halfway
+        with tab.write_lock:
+            stat = file_stat(path)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return path, None, None, None
+        return path, data, content_hash(data), stat
+
+    def changed(self, tab, path, data, digest, stat):
+        status_bar = self.app.status_bar
+        name = os.path.basename(path)
+        if data is None:
+            if tab.disk_conflict != self.DELETED:
+                status_bar.config(text=f"Deleted on disk: {path}")
+                tab.disk_conflict = self.DELETED
+            return
+        if digest == tab.saved_hash:
+            tab.disk_stat = stat
+            if tab.disk_conflict == self.DELETED:
+                tab.disk_conflict = None  # put back as it was
+            return
+        if digest == tab.disk_conflict:
+            return  # already asked about this version
+
+        if tab.text_area.edit_modified():
+            reload = messagebox.askyesno(
+                "File Changed",
+                f"{name} changed on disk, and it has unsaved changes here.\n\n"
+                "Reload it from disk and discard your changes?"
+            )
+            if not reload:
+                tab.disk_conflict = digest
+                status_bar.config(text=f"Kept your changes to {name}; auto-save is paused until you save it")
+                return
+
+        try:
+            encoding = detect_encoding(data)
+            text = data.decode(encoding)
+        except (UnicodeDecodeError, LookupError) as e:
+            status_bar.config(text=f"Changed on disk but could not be reloaded: {path}: {e}")
+            return
+        tab.replace_text(text.replace('\r\n', '\n').replace('\r', '\n'))
+        tab.encoding = encoding
+        tab.newline = detect_newline(text)
+        tab.saved_hash = digest
+        tab.disk_stat = stat
+        tab.disk_conflict = None
+        self.app.mark_saved(tab)
+        status_bar.config(text=f"Reloaded, changed on disk: {path}")
+
+class FileLoader:
+    """Streams a large file into a CodeTab without blocking the Tk loop.
+
+    A reader thread decodes the file incrementally in READ_SIZE blocks and
+    hands the text over through a bounded queue, so at most a few blocks are
+    held in memory. The Tk loop inserts what is ready for up to
+    INSERT_BUDGET seconds per turn. Highlighting, the line number gutter and
+    the undo history stay off until the whole file is in.
+    """
+
+    READ_SIZE = 256 * 1024
+    QUEUE_BLOCKS = 8
+    INSERT_BUDGET = 0.02  # seconds of inserting per turn of the event loop
+    POLL_MS = 15
+
+    def __init__(self, tab, filename):
+        self.tab = tab
+        self.filename = filename
+        self.total = max(os.path.getsize(filename), 1)
+        self.loaded = 0
+        self.encoding = 'utf-8'
+        self.newline = None
+        self.content_hash = None
+        self.blocks = queue.Queue(maxsize=self.QUEUE_BLOCKS)
+        self.cancelled = threading.Event()
+        self.goto = None  # (line, column) to show once the file is in
+
+        # Progress bar and cancel button above the text while loading
+        self.bar = ttk.Frame(tab)
+        self.bar.pack(side=tk.TOP, fill=tk.X, before=tab.line_numbers)
+        ttk.Label(self.bar, text=f"Loading {os.path.basename(filename)}").pack(side=tk.LEFT, padx=5)
+        self.progress = ttk.Progressbar(self.bar, maximum=100)
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(self.bar, text="Cancel", command=self.cancel).pack(side=tk.RIGHT)
+
+    def start(self):
+        tab = self.tab
+        tab.loader = self
+        tab.disk_stat = file_stat(self.filename)
+        tab.line_numbers.suspended = True
+        tab.highlight_scheduler.suspended = True
+        tab.minimap.suspended = True
+        tab.text_area.configure(state=tk.DISABLED)
+        threading.Thread(target=self.read, daemon=True).start()
+        tab.text_area.after(self.POLL_MS, self.pump)
+
+    def read(self):
+        try:
+            digest = hashlib.blake2b(digest_size=16)
+            decoder = None
+            carry = ''
+            with open(self.filename, 'rb') as f:
+                while not self.cancelled.is_set():
+                    data = f.read(self.READ_SIZE)
+                    final = not data
+                    digest.update(data)
+                    if decoder is None:
+                        self.encoding = detect_encoding(data)
+                        decoder = codecs.getincrementaldecoder(self.encoding)()
+                    text = carry + decoder.decode(data, final)
+                    # A \r at the end of a block may be half of a \r\n
+                    carry = ''
+                    if text.endswith('\r') and not final:
+                        text, carry = text[:-1], '\r'
+                    if self.newline is None:
+                        self.newline = detect_newline(text)
+                    text = text.replace('\r\n', '\n').replace('\r', '\n')
+                    self.put((text, len(data)))
+                    if final:
+                        break
+            self.content_hash = digest.hexdigest()
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        # Block while the Tk loop catches up, but give up once cancelled
+        while not self.cancelled.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def pump(self):
+        if self.cancelled.is_set():
+            return
+        text_area = self.tab.text_area
+        deadline = time.perf_counter() + self.INSERT_BUDGET
+        while time.perf_counter() < deadline:
+            try:
+                item = self.blocks.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.finish()
+                return
+            if isinstance(item, Exception):
+                self.fail(item)
+                return
+            text, size = item
+            text_area.configure(state=tk.NORMAL)
+            text_area.insert(tk.END, text)
+            text_area.configure(state=tk.DISABLED)
+            self.loaded += size
+
+        self.progress['value'] = 100 * self.loaded / self.total
+        text_area.after(self.POLL_MS, self.pump)
+
+    def finish(self):
+        tab = self.tab
+        self.bar.destroy()
+        tab.loader = None
+        tab.encoding = self.encoding
+        tab.newline = self.newline
+        tab.saved_hash = self.content_hash
+        tab.text_area.configure(state=tk.NORMAL)
+        tab.undo_history.reset()
+        tab.text_area.edit_modified(False)
+        tab.line_numbers.suspended = False
+        tab.line_numbers.redraw(force=True)
+        tab.highlight_scheduler.suspended = False
+        tab.minimap.suspended = False
+        tab.minimap.schedule()
+        if not tab.master.token_cache.restore(tab):
+            tab.highlight_scheduler.schedule()
+        if self.goto:
+            tab.goto(*self.goto)
+        tab.master.status_bar.config(text=f"Opened: {self.filename}")
+
+    def fail(self, error):
+        self.cancel()
+        messagebox.showerror("Open Error", str(error))
+
+    def cancel(self):
+        # Abandon the open altogether rather than leave a truncated buffer
+        # that could later be saved over the file
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        tab = self.tab
+        tab.loader = None
+        notebook = tab.master.notebook
+        container = tab.winfo_parent()
+        if container in notebook.tabs():
+            notebook.forget(container)
+        tab.master.status_bar.config(text=f"Loading cancelled: {self.filename}")
+
+class SyntaxHighlighter:
+    """Keeps the syntax tags of one CodeTab up to date incrementally.
+
+    line_states[n] holds the lexer state at the end of line n (index 0 is the
+    state before line 1). Edits mark the lines they touch as DIRTY; re-lexing
+    starts at the first dirty line and stops as soon as the computed state
+    matches a stored (clean) one, then resumes at the next dirty line.
+    """
+
+    DIRTY = object()
+    CHUNK_LINES = 64
+    MAX_CHUNK_LINES = 4096
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.line_states = [None, self.DIRTY]
+        self.dirty_first = 1
+        self.dirty_last = 1
+        self.used_tags = set()
+        # Bumped by every edit and reset so stale lexing results can be told apart
+        self.generation = 0
+
+    def on_edit(self, start, end, text):
+        first, last = start[0], end[0]
+        added = text.count('\n')
+        self.line_states[first:last + 1] = [self.DIRTY] * (added + 1)
+        self.generation += 1
+
+        if self.dirty_first is None:
+            self.dirty_first, self.dirty_last = first, first + added
+            return
+        if self.dirty_last > last:
+            self.dirty_last += added - (last - first)
+        self.dirty_first = min(self.dirty_first, first)
+        self.dirty_last = max(self.dirty_last, first + added)
+
+    def reset(self):
+        text_area = self.text_area
+        for tag in self.used_tags:
+            text_area.tag_remove(tag, '1.0', tk.END)
+        self.used_tags.clear()
+
+        line_count = self.line_count()
+        self.line_states = [None] + [self.DIRTY] * line_count
+        self.dirty_first = 1
+        self.dirty_last = line_count
+        self.generation += 1
+        self.configure_tags()
+
+    def line_count(self):
+        return int(self.text_area.index('end-1c').split('.')[0])
+
+    def configure_tags(self):
+        master = self.tab.master
+        style = master.get_style()
+        lexer = master.get_lexer(self.tab.current_language)
+        for token_type in lexer.token_types:
+            # Token types no theme knows fall back to the foreground color
+            self.text_area.tag_config(token_type, **style['tags'].get(token_type, {'foreground': style['fg']}))
+
+    def prepare(self):
+        # Make sure line_states still lines up with the widget before lexing
+        lexer = self.tab.master.get_lexer(self.tab.current_language)
+        if len(self.line_states) != self.line_count() + 1:
+            self.reset()
+        if not self.used_tags:
+            self.configure_tags()
+        self.used_tags.update(lexer.token_types)
+        return lexer
+
+    @instrumented
+    def highlight_dirty(self, max_lines=None):
+        """Re-lex dirty lines on the calling thread.
+
+        Gives up after roughly max_lines lines, leaving the rest dirty.
+        Returns True once nothing is left to re-lex.
+        """
+        if self.dirty_first is None:
+            return True
+
+        lexer = self.prepare()
+        line_count = self.line_count()
+        chunk = self.CHUNK_LINES
+        done = 0
+        while self.dirty_first is not None:
+            if max_lines is not None and done >= max_lines:
+                return False
+            first = self.dirty_first
+            last = min(line_count, first + chunk - 1)
+            text = self.text_area.get(f"{first}.0", f"{last}.end")
+            for run in lexer.slices(text, self.line_states[first - 1], first, chunk):
+                settled = self.apply_slice(*run)
+            done += last - first + 1
+            chunk = self.CHUNK_LINES if settled else min(chunk * 2, self.MAX_CHUNK_LINES)
+        return True
+
+    def apply_slice(self, first, last, end_states, ranges):
+        """Store a lexed run of lines and tag it; returns True if it settled.
+
+        Past the line where the state settles the run's tokens are the same as
+        the stored ones, so applying the whole run is still correct.
+        """
+        line_states = self.line_states
+        # Only the state at the end of the run decides; an unchanged line
+        # earlier in it may just be the end of another dirty region
+        settled = line_states[last] == end_states[-1]
+        line_states[first:last + 1] = end_states
+
+        text_area = self.text_area
+        for token_type, indices in ranges.items():
+            text_area.tag_remove(token_type, f"{first}.0", f"{last}.end")
+            if indices:
+                text_area.tag_add(token_type, *indices)
+        for listener in self.tab.highlight_listeners:
+            listener(first, last)
+
+        if not settled and last + 1 < len(line_states):
+            # The next line's entry state changed; it has to be re-lexed too
+            line_states[last + 1] = self.DIRTY
+            self.dirty_first = last + 1
+            self.dirty_last = max(self.dirty_last, last + 1)
+            return False
+
+        # Settled; jump to the next region still waiting to be re-lexed
+        try:
+            self.dirty_first = line_states.index(self.DIRTY, last + 1, self.dirty_last + 1)
+        except ValueError:
+            self.dirty_first = self.dirty_last = None
+        return True
+
+class HighlightScheduler:
+    """Keeps syntax highlighting off the keystroke path of a CodeTab.
+
+    Edits are coalesced with a short debounce. Small dirty regions are then
+    re-lexed right away; larger ones are snapshotted and lexed on the shared
+    worker thread, and the results are applied back on the Tk loop a few
+    runs of lines at a time. Results for a snapshot that an edit has made
+    stale are dropped and the region is rescheduled.
+    """
+
+    DEBOUNCE_MS = 30
+    MAX_DELAY = 0.15  # seconds a burst of edits may postpone highlighting
+    POLL_MS = 10
+    SYNC_LINES = 1000
+    ROUND_LINES = 20000
+    SLICE_LINES = 500
+    SLICE_BUDGET = 0.008  # seconds of tagging per turn of the event loop
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.highlighter = tab.highlighter
+        self.text_area = tab.text_area
+        self.pending = None
+        self.pending_since = 0
+        self.future = None
+        self.round_generation = None
+        self.slices = None
+        self.suspended = False
+        self.cached = None  # future decoding tokens from the token cache
+        self.cached_runs = None
+
+    def on_edit(self, start, end, text):
+        self.schedule()
+
+    def schedule(self):
+        if self.suspended:
+            return
+        now = time.monotonic()
+        if self.pending is not None:
+            if now - self.pending_since >= self.MAX_DELAY:
+                return
+            self.text_area.after_cancel(self.pending)
+        else:
+            self.pending_since = now
+        self.pending = self.text_area.after(self.DEBOUNCE_MS, self.run)
+
+    @instrumented
+    def run(self):
+        self.pending = None
+        # A round in flight reschedules itself once it is applied or dropped
+        if self.future is not None or self.slices or self.cached is not None or self.cached_runs:
+            return
+        if self.highlighter.highlight_dirty(max_lines=self.SYNC_LINES):
+            self.tab.master.token_cache.store(self.tab)
+            return
+        self.start_round()
+
+    def start_round(self):
+        highlighter = self.highlighter
+        lexer = highlighter.prepare()
+        if highlighter.dirty_first is None:
+            return
+        first = highlighter.dirty_first
+        last = min(highlighter.line_count(), first + self.ROUND_LINES - 1)
+        text = self.text_area.get(f"{first}.0", f"{last}.end")
+        state = highlighter.line_states[first - 1]
+
+        self.round_generation = highlighter.generation
+        self.future = self.tab.master.highlight_pool.submit(
+            lexer.slices, text, state, first, self.SLICE_LINES
+        )
+        self.text_area.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        if not self.future.done():
+            self.text_area.after(self.POLL_MS, self.poll)
+            return
+        future, self.future = self.future, None
+        if self.round_generation != self.highlighter.generation:
+            self.schedule()
+            return
+        self.slices = future.result()
+        self.slices.reverse()
+        self.apply_slices()
+
+    @instrumented
+    def apply_slices(self):
+        highlighter = self.highlighter
+        deadline = time.perf_counter() + self.SLICE_BUDGET
+        while self.slices:
+            if self.round_generation != highlighter.generation:
+                self.slices = None
+                break
+            if highlighter.apply_slice(*self.slices.pop()):
+                self.slices = None
+                break
+            if time.perf_counter() > deadline:
+                self.text_area.after(1, self.apply_slices)
+                return
+        self.slices = None
+        if highlighter.dirty_first is not None:
+            self.schedule()
+        else:
+            self.tab.master.token_cache.store(self.tab)
+
+    def restore(self, line_states, future):
+        # Take the line states of an unchanged file from the token cache; its
+        # tags are decoded by future and applied a few runs at a time
+        highlighter = self.highlighter
+        if self.pending is not None:
+            self.text_area.after_cancel(self.pending)
+            self.pending = None
+        self.slices = None
+        highlighter.prepare()
+        highlighter.line_states = line_states
+        highlighter.dirty_first = highlighter.dirty_last = None
+        highlighter.generation += 1
+        for tag in highlighter.used_tags:
+            self.text_area.tag_remove(tag, '1.0', tk.END)
+        for listener in self.tab.highlight_listeners:
+            listener(1, len(line_states) - 1)
+        self.round_generation = highlighter.generation
+        self.cached = future
+        self.text_area.after(self.POLL_MS, self.poll_cached)
+
+    def poll_cached(self):
+        if not self.cached.done():
+            self.text_area.after(self.POLL_MS, self.poll_cached)
+            return
+        future, self.cached = self.cached, None
+        try:
+            self.cached_runs = future.result()
+        except Exception:
+            self.cached_runs = None
+            self.tab.syntax_highlight()
+            return
+        self.cached_runs.reverse()
+        self.apply_cached()
+
+    @instrumented
+    def apply_cached(self):
+        highlighter = self.highlighter
+        text_area = self.text_area
+        deadline = time.perf_counter() + self.SLICE_BUDGET
+        while self.cached_runs:
+            if self.round_generation != highlighter.generation:
+                # Edited meanwhile: lines not tagged yet are lexed as usual
+                first = min(self.cached_runs[-1][0], highlighter.dirty_first or self.cached_runs[-1][0])
+                self.cached_runs = None
+                line_states = highlighter.line_states
+                line_states[first:] = [highlighter.DIRTY] * (len(line_states) - first)
+                highlighter.dirty_first = first
+                highlighter.dirty_last = len(line_states) - 1
+                self.schedule()
+                return
+            first, last, ranges = self.cached_runs.pop()
+            for token_type, indices in ranges.items():
+                text_area.tag_add(token_type, *indices)
+            if time.perf_counter() > deadline:
+                text_area.after(1, self.apply_cached)
+                return
+        self.cached_runs = None
+        if highlighter.dirty_first is not None:
+            self.schedule()
+
+_DEFINITION = re.compile(r'(?:async\s+)?(?:def|class)\s+')
+
+class _SemanticVisitor(ast.NodeVisitor):
+    """Collects the semantic spans of a parsed module, see python_semantic_spans."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.spans = {tag: [] for tag in SEMANTIC_TAGS}
+        self.parameters = frozenset()  # parameters visible in the current function
+        self.bound = []  # names bound by each enclosing scope
+        self.fstrings = []  # (line, column, end line, end column) of each f-string
+        self.in_fstring = False
+
+    def column(self, line, offset):
+        # ast columns count UTF-8 bytes; Tk counts characters
+        text = self.lines[line - 1]
+        return offset if text.isascii() else len(text.encode('utf-8')[:offset].decode('utf-8', 'ignore'))
+
+    def add(self, tag, line, column, end_line, end_column):
+        self.spans[tag].append((line, column, end_line, end_column))
+
+    def add_name(self, tag, line, offset, name):
+        column = self.column(line, offset)
+        self.add(tag, line, column, line, column + len(name))
+
+    def bound_names(self, node):
+        # Names the module or a function binds itself; nested functions and
+        # classes are only walked for their own names
+        names = set()
+        if isinstance(node, ast.Module):
+            stack = list(node.body)
+        else:
+            arguments = node.args
+            names.update(arg.arg for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs)
+            names.update(arg.arg for arg in (arguments.vararg, arguments.kwarg) if arg)
+            stack = list(node.body) if isinstance(node.body, list) else [node.body]
+        while stack:
+            child = stack.pop()
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.add(child.name)
+                stack.extend(child.decorator_list)
+                continue
+            if isinstance(child, ast.Lambda):
+                continue
+            if isinstance(child, ast.Name) and not isinstance(child.ctx, ast.Load):
+                names.add(child.id)
+            elif isinstance(child, ast.alias):
+                names.add((child.asname or child.name).split('.')[0])
+            elif isinstance(child, ast.ExceptHandler) and child.name:
+                names.add(child.name)
+            stack.extend(ast.iter_child_nodes(child))
+        return names
+
+    def visit_Module(self, node):
+        self.bound = [self.bound_names(node)]
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        for decorator in node.decorator_list:
+            self.decorator(decorator)
+        line = self.lines[node.lineno - 1]
+        match = _DEFINITION.match(line, self.column(node.lineno, node.col_offset))
+        if match:
+            self.add('definition', node.lineno, match.end(), node.lineno, match.end() + len(node.name))
+        if isinstance(node, ast.ClassDef):
+            for child in node.bases + node.keywords:
+                self.visit(child)
+            self.bound.append(set())
+            for child in node.body:
+                self.visit(child)
+            self.bound.pop()
+            return
+        self.function(node, node.args, node.returns, node.body)
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self.function(node, node.args, None, [node.body])
+
+    def function(self, node, arguments, returns, body):
+        # Defaults and annotations belong to the enclosing scope
+        for child in arguments.defaults + [d for d in arguments.kw_defaults if d]:
+            self.visit(child)
+        every = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+        every += [arg for arg in (arguments.vararg, arguments.kwarg) if arg]
+        for arg in every:
+            self.add_name('parameter', arg.lineno, arg.col_offset, arg.arg)
+            if arg.annotation:
+                self.visit(arg.annotation)
+        if returns:
+            self.visit(returns)
+
+        outer = self.parameters
+        self.parameters = outer | {arg.arg for arg in every}
+        self.bound.append(self.bound_names(node))
+        for child in body:
+            self.visit(child)
+        self.bound.pop()
+        self.parameters = outer
+
+    def decorator(self, node):
+        # From the '@' to the end of the decorator's name, without its arguments
+        target = node.func if isinstance(node, ast.Call) else node
+        line = self.lines[node.lineno - 1]
+        at = line.rfind('@', 0, self.column(node.lineno, node.col_offset))
+        if at != -1:
+            self.add('decorator', node.lineno, at, target.end_lineno,
+                     self.column(target.end_lineno, target.end_col_offset))
+        if target is not node:
+            for child in node.args + node.keywords:
+                self.visit(child)
+
+    def visit_Name(self, node):
+        if self.in_fstring:
+            return  # positions inside f-strings are unreliable before 3.12
+        if node.id in self.parameters:
+            self.add_name('parameter', node.lineno, node.col_offset, node.id)
+        elif node.id in PYTHON_BUILTINS and any(node.id in names for names in self.bound):
+            self.add_name('identifier', node.lineno, node.col_offset, node.id)
+
+    def visit_Attribute(self, node):
+        self.visit(node.value)
+        if node.attr in PYTHON_BUILTINS and not self.in_fstring:
+            end = self.column(node.end_lineno, node.end_col_offset)
+            self.add('identifier', node.end_lineno, end - len(node.attr), node.end_lineno, end)
+
+    def visit_keyword(self, node):
+        # keywords have positions since Python 3.9
+        if node.arg in PYTHON_BUILTINS and not self.in_fstring and hasattr(node, 'lineno'):
+            self.add_name('identifier', node.lineno, node.col_offset, node.arg)
+        self.visit(node.value)
+
+    def visit_JoinedStr(self, node):
+        if not self.in_fstring and any(isinstance(value, ast.FormattedValue) for value in node.values):
+            self.fstrings.append((node.lineno, self.column(node.lineno, node.col_offset), node.end_lineno,
+                                  self.column(node.end_lineno, node.end_col_offset)))
+        in_fstring, self.in_fstring = self.in_fstring, True
+        if sys.version_info >= (3, 12):
+            self.in_fstring = False  # positions inside f-strings are exact from 3.12 on
+        self.generic_visit(node)
+        self.in_fstring = in_fstring
+
+def _fstring_fields(literal):
+    # (start, end) offsets of the replacement fields of one f-string literal
+    prefix = re.match(r'[A-Za-z]*', literal).group()
+    quote = 3 if literal.startswith(('"""', "'''"), len(prefix)) else 1
+    raw = 'r' in prefix.lower()
+    pos = len(prefix) + quote
+    stop = len(literal) - quote
+    fields = []
+    while pos < stop:
+        char = literal[pos]
+        if char == '\\' and not raw:
+            if literal.startswith('N{', pos + 1):
+                pos = literal.find('}', pos) + 1  # a named escape, not a field
+            else:
+                pos += 1 if literal[pos + 1] in '{}' else 2
+        elif char == '{' and literal[pos + 1] != '{':
+            start = pos
+            depth = 0
+            quoted = None
+            while pos < stop:
+                char = literal[pos]
+                if quoted:
+                    if char == quoted:
+                        quoted = None
+                elif char in '\'"':
+                    quoted = char
+                elif char in '{[(':
+                    depth += 1
+                elif char in '}])':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                pos += 1
+            fields.append((start, pos + 1))
+            pos += 1
+        else:
+            pos += 2 if char in '{}' else 1
+    return fields
+
+def python_semantic_spans(source, run_lines=500):
+    """Classify the parts of Python source that the regex lexer cannot.
+
+    Returns runs of at most run_lines lines like Lexer.slices: (first, last,
+    ranges), where ranges maps each of SEMANTIC_TAGS to a flat list of Tk
+    indices. Returns None when source does not parse. Runs in a worker process.
+    """
+    # Imported here; only the worker process needs them
+    import io
+    import tokenize
+
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    lines = source.split('\n')
+    visitor = _SemanticVisitor(lines)
+    visitor.visit(tree)
+
+    # The fields of f-strings, found by tokenizing each f-string on its own;
+    # one expression can join several literals
+    fstring_start = getattr(tokenize, 'FSTRING_START', None)
+    fstring_end = getattr(tokenize, 'FSTRING_END', None)
+    for line, column, end_line, end_column in visitor.fstrings:
+        text = '\n'.join(lines[line - 1:end_line])
+        text = '(' + text[column:len(text) - len(lines[end_line - 1]) + end_column] + ')'
+        line_starts = [0]
+        for match in re.finditer('\n', text):
+            line_starts.append(match.end())
+
+        literals = []
+        opened = None
+        depth = 0
+        try:
+            for token in tokenize.generate_tokens(io.StringIO(text).readline):
+                if token.type == tokenize.STRING:
+                    if 'f' in re.match(r'[A-Za-z]*', token.string).group().lower():
+                        literals.append((token.start, token.string))
+                elif token.type == fstring_start:
+                    depth += 1
+                    if depth == 1:
+                        opened = token.start
+                elif token.type == fstring_end:
+                    depth -= 1
+                    if depth == 0:
+                        first = line_starts[opened[0] - 1] + opened[1]
+                        last = line_starts[token.end[0] - 1] + token.end[1]
+                        literals.append((opened, text[first:last]))
+        except (tokenize.TokenError, SyntaxError):
+            continue
+
+        for (row, offset), literal in literals:
+            # Back from the wrapped text to the buffer
+            row_line = line + row - 1
+            row_column = column + offset - 1 if row == 1 else offset
+            for first, last in _fstring_fields(literal):
+                positions = []
+                for position in (first, last):
+                    newline = literal.rfind('\n', 0, position)
+                    if newline == -1:
+                        positions += (row_line, row_column + position)
+                    else:
+                        positions += (row_line + literal.count('\n', 0, position), position - newline - 1)
+                visitor.add('fstring_field', *positions)
+
+    # Split into runs of lines; a span crossing a run boundary is cut in two
+    runs = {}
+    for tag, spans in visitor.spans.items():
+        for line, column, end_line, end_column in spans:
+            while True:
+                run = (line - 1) // run_lines
+                run_end = (run + 1) * run_lines + 1  # first line of the next run
+                ranges = runs.setdefault(run, {name: [] for name in SEMANTIC_TAGS})[tag]
+                if end_line < run_end:
+                    ranges += (f"{line}.{column}", f"{end_line}.{end_column}")
+                    break
+                ranges += (f"{line}.{column}", f"{run_end}.0")
+                line, column = run_end, 0
+    count = len(lines)
+    result = []
+    for run in range((count + run_lines - 1) // run_lines):
+        empty = {tag: [] for tag in SEMANTIC_TAGS}
+        result.append((run * run_lines + 1, min(count, (run + 1) * run_lines), runs.get(run, empty)))
+    return result
+
+class SemanticHighlighter:
+    """Python highlighting that needs a parse rather than a regex.
+
+    Definitions, parameters, decorators, names that shadow builtins and the
+    fields of f-strings are tagged on top of the SyntaxHighlighter's tags.
+    Once the tab has been idle for IDLE_MS after an edit, the buffer is parsed
+    in a worker process and the spans are applied a run of lines at a time.
+    A buffer that does not parse keeps its last good tags, which Tk moves
+    along with the text.
+    """
+
+    IDLE_MS = 500
+    POLL_MS = 50
+    MAX_CHARS = 4_000_000
+    SLICE_BUDGET = 0.008  # seconds of tagging per turn of the event loop
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.pending = None
+        self.future = None
+        self.generation = 0
+        self.round_generation = None
+        self.runs = None
+        for tag in SEMANTIC_TAGS:
+            self.text_area.tag_raise(tag)
+
+    def on_edit(self, start, end, text):
+        self.generation += 1
+        self.schedule()
+
+    def schedule(self, delay=None):
+        if self.pending is not None:
+            self.text_area.after_cancel(self.pending)
+        self.pending = self.text_area.after(self.IDLE_MS if delay is None else delay, self.run)
+
+    def run(self):
+        self.pending = None
+        # A parse in flight reschedules itself once it is applied or dropped
+        if self.future is not None or self.runs:
+            return
+        tab = self.tab
+        if tab.loader is not None:
+            self.schedule()
+            return
+        if tab.current_language != 'python':
+            self.clear()
+            return
+        text = tab.document.get()
+        if len(text) > self.MAX_CHARS:
+            self.clear()
+            return
+        self.round_generation = self.generation
+        self.future = tab.master.get_semantic_pool().submit(python_semantic_spans, text)
+        self.text_area.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        if not self.future.done():
+            self.text_area.after(self.POLL_MS, self.poll)
+            return
+        future, self.future = self.future, None
+        if self.round_generation != self.generation:
+            self.schedule()
+            return
+        try:
+            runs = future.result()
+        except Exception:
+            return  # e.g. the worker died; tried again after the next edit
+        if runs is None:
+            return  # does not parse; keep the last good tags
+        runs.reverse()
+        self.runs = runs
+        self.apply_runs()
+
+    @instrumented
+    def apply_runs(self):
+        text_area = self.text_area
+        deadline = time.perf_counter() + self.SLICE_BUDGET
+        while self.runs:
+            if self.round_generation != self.generation:
+                self.runs = None
+                self.schedule()
+                return
+            first, last, ranges = self.runs.pop()
+            for tag in SEMANTIC_TAGS:
+                text_area.tag_remove(tag, f"{first}.0", f"{last + 1}.0")
+                if ranges[tag]:
+                    text_area.tag_add(tag, *ranges[tag])
+            if time.perf_counter() > deadline:
+                text_area.after(1, self.apply_runs)
+                return
+        self.runs = None
+
+    def clear(self):
+        for tag in SEMANTIC_TAGS:
+            self.text_area.tag_remove(tag, '1.0', tk.END)
+
+class TokenCache:
+    """On-disk cache of the syntax tokens of unchanged files.
+
+    Once a file of at least min_size bytes has been highlighted without being
+    edited, it is lexed again on the highlight worker and stored as one entry
+    per path: a JSON header with the path, mtime, size, content hash, line
+    count and pattern version, then the zlib-compressed line states and
+    token runs. Each run is four unsigned ints (line delta, start column,
+    end line delta, end column), grouped by token type. An entry whose header
+    no longer matches the file is discarded on lookup. The pattern version
+    is a hash of the language's patterns, so editing language_keywords
+    invalidates every entry of that language. The least recently used
+    entries are evicted once the cache exceeds max_size bytes.
+    """
+
+    FORMAT = 1
+    RUN_LINES = 500
+
+    def __init__(self, directory, max_size, min_size):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.min_size = min_size
+        self.versions = {}
+
+    def version(self, master, language):
+        if language not in self.versions:
+            spec = master.language_keywords[language]
+            spec = json.dumps([self.FORMAT, spec['patterns'], spec.get('multiline', [])], sort_keys=True)
+            self.versions[language] = hashlib.blake2b(spec.encode('utf-8'), digest_size=8).hexdigest()
+        return self.versions[language]
+
+    def entry_path(self, filename):
+        name = hashlib.blake2b(os.path.abspath(filename).encode('utf-8'), digest_size=16).hexdigest()
+        return self.directory / f"{name}.tokens"
+
+    def header(self, tab):
+        # What a cached entry must match to be used for tab, or None
+        if not tab.filename or not tab.saved_hash or self.max_size <= 0:
+            return None
+        try:
+            stat = os.stat(tab.filename)
+        except OSError:
+            return None
+        if stat.st_size < self.min_size:
+            return None
+        return {
+            'path': os.path.abspath(tab.filename),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': tab.saved_hash,
+            'language': tab.current_language,
+            'version': self.version(tab.master, tab.current_language),
+            'lines': tab.highlighter.line_count(),
+        }
+
+    def restore(self, tab):
+        """Apply the cached tokens of tab's file; returns False on a miss."""
+        tab.cache_header = None
+        header = self.header(tab)
+        if header is None:
+            return False
+        path = self.entry_path(tab.filename)
+        try:
+            with open(path, 'rb') as f:
+                stored = json.loads(f.readline())
+                payload = f.read()
+        except (OSError, ValueError):
+            stored = None
+        if stored is None or {k: stored.get(k) for k in header} != header:
+            if stored is not None:
+                self.discard(path)
+            # Store the tokens once this tab has been highlighted
+            tab.cache_header = (header, tab.edit_count)
+            return False
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        data = zlib.decompress(payload)
+        lines = header['lines']
+        line_states = [None] + [None if b == 0 else b - 1 for b in data[:lines]]
+        future = tab.master.highlight_pool.submit(
+            self.decode, data[lines:], stored['types'], stored['counts'], self.RUN_LINES
+        )
+        tab.highlight_scheduler.restore(line_states, future)
+        return True
+
+    def store(self, tab):
+        # Called once tab's highlighting has caught up with the buffer
+        cached = tab.cache_header
+        if cached is None:
+            return
+        tab.cache_header = None
+        header, edit_count = cached
+        if (tab.edit_count != edit_count or tab.current_language != header['language']
+                or tab.text_area.edit_modified()):
+            return
+        lexer = tab.master.get_lexer(tab.current_language)
+        tab.master.highlight_pool.submit(self.write, header, lexer, tab.document.snapshot())
+
+    @staticmethod
+    def encode(lexer, text):
+        # Return (line state bytes, token types, run counts, run bytes)
+        line_starts, tokens, end_states = lexer.lex(text)
+        states = bytes(0 if state is None else state + 1 for state in end_states)
+        runs = {token_type: array('I') for token_type in lexer.token_types}
+        previous = dict.fromkeys(lexer.token_types, 0)
+        count = len(line_starts)
+        row = 0
+        for token_type, start, end in tokens:
+            while row + 1 < count and line_starts[row + 1] <= start:
+                row += 1
+            if row + 1 < count and end >= line_starts[row + 1]:
+                end_row = bisect.bisect_right(line_starts, end) - 1
+            else:
+                end_row = row
+            runs[token_type].extend(
+                (row - previous[token_type], start - line_starts[row],
+                 end_row - row, end - line_starts[end_row])
+            )
+            previous[token_type] = row
+        types = list(runs)
+        counts = [len(runs[token_type]) for token_type in types]
+        return states, types, counts, b''.join(runs[token_type].tobytes() for token_type in types)
+
+    @staticmethod
+    def decode(data, types, counts, size):
+        # Return [(first, last, ranges)] runs of at most size lines, where
+        # ranges maps token types to the flat Tk indices of one tag add
+        values = array('I')
+        values.frombytes(data)
+        buckets = {}
+        offset = 0
+        for token_type, count in zip(types, counts):
+            row = 0
+            for i in range(offset, offset + count, 4):
+                row += values[i]
+                end_row = row + values[i + 2]
+                bucket = buckets.setdefault(row // size, {})
+                bucket.setdefault(token_type, []).extend(
+                    (f"{row + 1}.{values[i + 1]}", f"{end_row + 1}.{values[i + 3]}")
+                )
+            offset += count
+        return [(key * size + 1, key * size + size, buckets[key]) for key in sorted(buckets)]
+
+    def write(self, header, lexer, document):
+        # Runs on the highlight worker thread
+        states, types, counts, runs = self.encode(lexer, document.get())
+        stored = dict(header, types=types, counts=counts)
+        try:
+            self.directory.mkdir(exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(json.dumps(stored).encode('utf-8') + b'\n')
+                    f.write(zlib.compress(states + runs, 1))
+                os.replace(temp_path, self.entry_path(header['path']))
+            except BaseException:
+                self.discard(temp_path)
+                raise
+            self.evict()
+        except OSError as e:
+            print(f"Token cache error: {e}")
+
+    def evict(self):
+        # Drop the least recently used entries until the cache fits max_size
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tokens'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.discard(path)
+            total -= size
+
+    @staticmethod
+    def discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+_NO_INDENT = float('inf')
+
+class _LineBlock:
+    """Immutable treap node holding the structure records of a run of lines.
+
+    A record is (depth, low, high, indent, header, items, state) for one
+    line: depth is the net number of brackets it opens, low the lowest and
+    high the highest running depth within it counted from its start and
+    from its end, indent the width of its indentation (None for a blank,
+    comment or string line), header whether it ends in a colon, items its
+    (column, delta, label, length) brackets and state the lexer state at
+    its end. Every node sums these up for its
+    subtree, so a search for a depth or indent can skip whole subtrees.
+    """
+
+    __slots__ = ('records', 'left', 'right', 'priority', 'own', 'count', 'depth', 'low', 'high', 'indent')
+
+    def __init__(self, records, left=None, right=None, priority=None, own=None):
+        self.records = records
+        self.left = left
+        self.right = right
+        self.priority = random.random() if priority is None else priority
+        if own is None:
+            depth, low, high, indent = 0, 0, 0, _NO_INDENT
+            for record in records:
+                low = min(low, depth + record[1])
+                high = max(record[2], high + record[0])
+                depth += record[0]
+                if record[3] is not None and record[3] < indent:
+                    indent = record[3]
+            own = (depth, low, high, indent)
+        self.own = own  # the sums over records alone, reused by copies of this node
+        depth, low, high, indent = own
+        count = len(records)
+        if left is not None:
+            low = min(left.low, left.depth + low)
+            high = max(high, depth + left.high)
+            depth += left.depth
+            indent = min(indent, left.indent)
+            count += left.count
+        if right is not None:
+            low = min(low, depth + right.low)
+            high = max(right.high, right.depth + high)
+            depth += right.depth
+            indent = min(indent, right.indent)
+            count += right.count
+        self.count, self.depth, self.low, self.high, self.indent = count, depth, low, high, indent
+
+def _split_lines(node, count):
+    # (the first count lines, the rest)
+    if node is None:
+        return None, None
+    left_count = node.left.count if node.left is not None else 0
+    if count <= left_count:
+        left, right = _split_lines(node.left, count)
+        return left, _merge_lines(right, _LineBlock(node.records, None, node.right, node.priority, node.own))
+    count -= left_count
+    if count < len(node.records):
+        # New blocks get random priorities; merging on the way back up keeps
+        # the heap order above them, as in _split
+        return (_merge_lines(node.left, _LineBlock(node.records[:count])),
+                _merge_lines(_LineBlock(node.records[count:]), node.right))
+    left, right = _split_lines(node.right, count - len(node.records))
+    return _merge_lines(_LineBlock(node.records, node.left, None, node.priority, node.own), left), right
+
+def _merge_lines(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return _LineBlock(left.records, left.left, _merge_lines(left.right, right), left.priority, left.own)
+    return _LineBlock(right.records, _merge_lines(left, right.left), right.right, right.priority, right.own)
+
+def _build_lines(records, size=32):
+    # Balanced treap of records, size lines to a node; see _build
+    groups = [tuple(records[i:i + size]) for i in range(0, len(records), size)]
+    def build(low, high, ceiling):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        priority = ceiling * random.random() ** (1.0 / (high - low))
+        return _LineBlock(groups[middle], build(low, middle, priority), build(middle + 1, high, priority), priority)
+    return build(0, len(groups), 1.0)
+
+def _find_forward(node, base, start, acc, test, line_test=None):
+    # First line from start on for which line_test(acc, depth, low, high,
+    # indent) holds, acc being the sum of the depths of the lines from start
+    # up to it: (line, acc) or (None, acc past the subtree). test gets the
+    # sums of whole subtrees and must hold for any that has such a line.
+    line_test = line_test or test
+    if node is None or base + node.count < start:
+        return None, acc
+    if base + 1 >= start and not test(acc, node.depth, node.low, node.high, node.indent):
+        return None, acc + node.depth
+    line, acc = _find_forward(node.left, base, start, acc, test, line_test)
+    if line is not None:
+        return line, acc
+    base += node.left.count if node.left is not None else 0
+    for row, record in enumerate(node.records, base + 1):
+        if row < start:
+            continue
+        if line_test(acc, *record[:4]):
+            return row, acc
+        acc += record[0]
+    return _find_forward(node.right, base + len(node.records), start, acc, test, line_test)
+
+def _find_backward(node, base, end, acc, test, line_test=None):
+    # Last line up to end for which line_test holds, acc summing the depths
+    # of the lines after it up to end
+    line_test = line_test or test
+    if node is None or base >= end:
+        return None, acc
+    if base + node.count <= end and not test(acc, node.depth, node.low, node.high, node.indent):
+        return None, acc + node.depth
+    left_count = node.left.count if node.left is not None else 0
+    line, acc = _find_backward(node.right, base + left_count + len(node.records), end, acc, test, line_test)
+    if line is not None:
+        return line, acc
+    for row in range(base + left_count + len(node.records), base + left_count, -1):
+        if row > end:
+            continue
+        record = node.records[row - base - left_count - 1]
+        if line_test(acc, *record[:4]):
+            return row, acc
+        acc += record[0]
+    return _find_backward(node.left, base, end, acc, test, line_test)
+
+# Where a fold over a line opened by a bracket would make no sense
+HTML_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                  'param', 'source', 'track', 'wbr'}
+BRACKETS = {'(': ('(', 1), ')': ('(', -1), '[': ('[', 1), ']': ('[', -1), '{': ('{', 1), '}': ('{', -1)}
+_BRACKET = re.compile(r'[()\[\]{}]')
+_HTML_TAG = re.compile(r'<(/?)([A-Za-z][\w:.-]*)(?:[^<>"\']|"[^"]*"|\'[^\']*\')*?(/?)>')
+
+def scan_structure(lexer, text, state, language):
+    """The structure records of the lines of text, lexed from state.
+
+    Brackets, or tags for HTML, inside strings and comments are skipped.
+    Only Python lines get an indent.
+    """
+    line_starts, tokens, end_states = lexer.lex(text, state)
+    # Quotes in HTML text are no strings, only those within tags
+    opaque = ('comment',) if language == 'html' else ('string', 'comment')
+    skipped = [(start, end) for token_type, start, end in tokens if token_type in opaque]
+    skip_starts = [start for start, _ in skipped]
+
+    def hidden(offset):
+        position = bisect.bisect_right(skip_starts, offset) - 1
+        return position >= 0 and offset < skipped[position][1]
+
+    items = [[] for _ in line_starts]
+    if language == 'html':
+        for match in _HTML_TAG.finditer(text):
+            name = match.group(2).lower()
+            if hidden(match.start()) or (not match.group(1) and (match.group(3) or name in HTML_VOID_TAGS)):
+                continue
+            row = bisect.bisect_right(line_starts, match.start()) - 1
+            items[row].append((match.start() - line_starts[row], -1 if match.group(1) else 1, name,
+                               match.end(2) - match.start()))
+    else:
+        for match in _BRACKET.finditer(text):
+            if hidden(match.start()):
+                continue
+            row = bisect.bisect_right(line_starts, match.start()) - 1
+            label, delta = BRACKETS[match.group()]
+            items[row].append((match.start() - line_starts[row], delta, label, 1))
+
+    records = []
+    python = language == 'python'
+    starts = [state] + end_states[:-1]
+    for row, line in enumerate(text.split('\n')):
+        line_items = items[row]
+        depth = low = high = 0
+        if line_items:
+            for item in line_items:
+                depth += item[1]
+                if depth < low:
+                    low = depth
+            suffix = 0
+            for item in reversed(line_items):
+                suffix += item[1]
+                if suffix > high:
+                    high = suffix
+        indent = None
+        header = False
+        if python and starts[row] is None:
+            stripped = line.lstrip(' \t')
+            if stripped and stripped[0] != '#':
+                indent = len(line) - len(stripped)
+                if '\t' in line[:indent]:
+                    indent = len(line[:indent].expandtabs(8))
+                header = stripped.rstrip().endswith(':')
+                if not header and '#' in stripped:
+                    # "if x:  # why" is a header too
+                    end = line_starts[row] + len(line)
+                    position = bisect.bisect_right(skip_starts, end - 1) - 1
+                    if position >= 0 and skipped[position][0] > line_starts[row] + indent:
+                        header = text[line_starts[row]:skipped[position][0]].rstrip().endswith(':')
+        records.append((depth, low, high, indent, header, tuple(line_items), end_states[row]))
+    return records
+
+class BlockIndex:
+    """The bracket and indentation structure of a buffer, line by line.
+
+    Lines are held in a treap of _LineBlock nodes ordered by line number, so
+    replacing lines and finding the bracket that matches another or the
+    line that ends an indented block take O(log n) steps plus the length
+    of the lines at either end.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def count(self):
+        return self.root.count if self.root is not None else 0
+
+    def replace(self, first, last, records):
+        # Lines first..last become records; last is first - 1 to insert
+        left, rest = _split_lines(self.root, first - 1)
+        _, right = _split_lines(rest, last - first + 1)
+        self.root = _merge_lines(_merge_lines(left, _build_lines(records)), right)
+
+    def records(self, first, last):
+        _, rest = _split_lines(self.root, first - 1)
+        middle, _ = _split_lines(rest, last - first + 1)
+        result = []
+        stack, node = [], middle
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            result.extend(node.records)
+            node = node.right
+        return result
+
+    def record(self, line):
+        node = self.root
+        while node is not None:
+            left_count = node.left.count if node.left is not None else 0
+            if line <= left_count:
+                node = node.left
+                continue
+            line -= left_count
+            if line <= len(node.records):
+                return node.records[line - 1]
+            line -= len(node.records)
+            node = node.right
+        return None
+
+    def item_at(self, line, column):
+        # The bracket under the cursor at line.column, else the one just before it
+        record = self.record(line)
+        before = None
+        for item in record[5] if record else ():
+            if item[0] <= column < item[0] + item[3]:
+                return item
+            if item[0] + item[3] == column:
+                before = item
+        return before
+
+    def match(self, line, item):
+        # (line, item) of the bracket matching item on line, or None
+        items = self.record(line)[5]
+        position = items.index(item)
+        if item[1] > 0:
+            acc = 0
+            for other in items[position + 1:]:
+                acc += other[1]
+                if acc < 0:
+                    return line, other
+            found, acc = _find_forward(self.root, 0, line + 1, acc,
+                                       lambda acc, depth, low, high, indent: acc + low < 0)
+            if found is None:
+                return None
+            for other in self.record(found)[5]:
+                acc += other[1]
+                if acc < 0:
+                    return found, other
+        else:
+            return self.opener_before(line, position)
+
+    def opener_before(self, line, position):
+        # The innermost bracket still open before items[position] of line
+        items = self.record(line)[5]
+        acc = 0
+        for other in reversed(items[:position]):
+            acc += other[1]
+            if acc > 0:
+                return line, other
+        found, acc = _find_backward(self.root, 0, line - 1, acc,
+                                    lambda acc, depth, low, high, indent: acc + high > 0)
+        if found is None:
+            return None
+        for other in reversed(self.record(found)[5]):
+            acc += other[1]
+            if acc > 0:
+                return found, other
+
+    def enclosing(self, line, column):
+        # The innermost bracket open at line.column, or None
+        items = self.record(line)[5]
+        position = 0
+        while position < len(items) and items[position][0] < column:
+            position += 1
+        return self.opener_before(line, position)
+
+    def block_end(self, line):
+        # Last line of the indented block headed by line, or None. Lines
+        # that start inside brackets continue a statement and end nothing.
+        record = self.record(line)
+        if record is None or not record[4]:
+            return None
+        indent = record[3]
+        body, _ = _find_forward(self.root, 0, line + 1, 0,
+                                lambda acc, depth, low, high, found: found is not None and found != _NO_INDENT)
+        if body is None or self.record(body)[3] <= indent:
+            return None
+        after, _ = _find_forward(
+            self.root, 0, body, 0,
+            lambda acc, depth, low, high, found: found <= indent and acc + low <= 0,
+            lambda acc, depth, low, high, found: found is not None and found <= indent and acc <= 0)
+        last = (after or self.count() + 1) - 1
+        while last > body and self.record(last)[3] is None:
+            last -= 1  # blank lines before the next statement stay visible
+        return last
+
+    def block_start(self, line):
+        # The header of the innermost indented block containing line, or None
+        record = self.record(line)
+        indent = record[3] if record is not None else None
+        if indent is None:
+            # Blank lines belong to the block of the next statement
+            found, _ = _find_forward(self.root, 0, line, 0,
+                                     lambda acc, depth, low, high, found: found is not None and found != _NO_INDENT)
+            if found is None:
+                return None
+            line, indent = found, self.record(found)[3]
+        header, _ = _find_backward(
+            self.root, 0, line - 1, 0,
+            lambda acc, depth, low, high, found: found < indent and acc + high >= 0,
+            lambda acc, depth, low, high, found: found is not None and found < indent and acc + depth >= 0)
+        return header
+
+    def fold_range(self, line):
+        """The lines (first, last) a fold headed by line hides, or None.
+
+        An indented block hides its body; a bracket left open on line hides
+        the lines up to the one holding its match.
+        """
+        end = self.block_end(line)
+        if end is not None:
+            return line + 1, end
+        record = self.record(line)
+        for item in record[5] if record else ():
+            if item[1] > 0:
+                match = self.match(line, item)
+                if match is not None and match[0] > line + 1:
+                    return line + 1, match[0] - 1
+        return None
+
+class StructureIndex:
+    """Keeps the BlockIndex of a CodeTab in step with its text.
+
+    Works like SyntaxHighlighter, with a lexer that only knows strings and
+    comments: an edit replaces its lines with placeholders and marks them
+    dirty, and rescanning stops at the first line past them whose lexer
+    state at its end came out as before. Small edits are rescanned right
+    away; the initial scan and anything an edit sets off further down, like
+    an opened string, go on in SCAN_BUDGET slices of the event loop.
+    """
+
+    PLACEHOLDER = (0, 0, 0, None, False, (), object())
+    EDIT_LINES = 64
+    CHUNK_LINES = 2000
+    EDIT_BUDGET = 0.004  # seconds of rescanning right after an edit
+    SCAN_BUDGET = 0.01
+    LOADING_MS = 200
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.blocks = BlockIndex()
+        self.dirty = 1  # first line to rescan, None when up to date
+        self.dirty_end = 0  # lines up to here are rescanned whatever their state
+        self.scan_job = None
+        self.schedule()
+
+    def reset(self):
+        # After a language change
+        self.blocks = BlockIndex()
+        self.dirty, self.dirty_end = 1, 0
+        self.schedule()
+
+    def schedule(self):
+        if self.scan_job is None:
+            self.scan_job = self.text_area.after_idle(self.scan)
+
+    def cancel(self):
+        if self.scan_job is not None:
+            self.text_area.after_cancel(self.scan_job)
+            self.scan_job = None
+
+    def on_edit(self, start, end, text):
+        first, last = start[0], end[0]
+        added = text.count('\n')
+        blocks = self.blocks
+        count = blocks.count()
+        if first > count:
+            return  # not scanned yet
+        if last > count:
+            blocks.replace(first, count, [])
+            self.dirty = first if self.dirty is None else min(self.dirty, first)
+            self.schedule()
+            return
+        blocks.replace(first, last, [self.PLACEHOLDER] * (added + 1))
+        if self.dirty is None:
+            self.dirty, self.dirty_end = first, first + added
+        else:
+            # Lines from the old dirty one on are stale until rescanned, so
+            # the rescan must not stop before it
+            shift = added - (last - first)
+            if self.dirty > last:
+                stale = self.dirty + shift
+            else:
+                stale = max(self.dirty, first + added)
+            if self.dirty_end > last:
+                self.dirty_end += shift
+            self.dirty = min(self.dirty, first)
+            self.dirty_end = max(self.dirty_end, first + added, stale)
+        self.run(self.EDIT_BUDGET)
+        if self.dirty is not None:
+            self.schedule()
+
+    def scan(self):
+        self.scan_job = None
+        if self.tab.loader is not None:
+            # Left until the file is in; FileLoader has the loop meanwhile
+            self.scan_job = self.text_area.after(self.LOADING_MS, self.scan)
+            return
+        self.run(self.SCAN_BUDGET)
+        if self.dirty is not None:
+            self.scan_job = self.text_area.after(1, self.scan)
+        else:
+            self.tab.show_matching_bracket()
+
+    @instrumented
+    def run(self, budget):
+        tab = self.tab
+        language = tab.current_language
+        lexer = tab.master.get_structure_lexer(language)
+        blocks = self.blocks
+        line_count = int(self.text_area.index('end-1c').split('.')[0])
+        deadline = time.perf_counter() + budget
+        while self.dirty is not None:
+            first = self.dirty
+            count = blocks.count()
+            if first > line_count:
+                if count > line_count:
+                    blocks.replace(line_count + 1, count, [])
+                self.dirty, self.dirty_end = None, 0
+                break
+            size = self.CHUNK_LINES if first > count else self.EDIT_LINES
+            last = min(line_count, first + self.CHUNK_LINES - 1, max(self.dirty_end, first + size - 1))
+            text = self.text_area.get(f"{first}.0", f"{last}.0 lineend")
+            state = blocks.record(first - 1)[6] if first > 1 else None
+            records = scan_structure(lexer, text, state, language)
+
+            # Done at the first line past the edit whose state came out the same
+            old_last = min(last, count)
+            old = blocks.records(first, old_last) if first <= old_last else []
+            converged = None
+            for line in range(max(self.dirty_end, first), old_last + 1):
+                if records[line - first][6] == old[line - first][6]:
+                    converged = line
+                    break
+            if converged is not None:
+                blocks.replace(first, converged, records[:converged - first + 1])
+                count = blocks.count()
+                self.dirty = count + 1 if count < line_count else None  # the initial scan goes on
+                self.dirty_end = 0
+            else:
+                blocks.replace(first, old_last, records)
+                self.dirty = last + 1 if last < line_count else None
+                if self.dirty is None:
+                    self.dirty_end = 0
+            if time.perf_counter() >= deadline:
+                break
+
+class SearchIndex:
+    """Matches of one query in a CodeTab, kept per line and updated on edits.
+
+    The buffer is scanned once when the index is built. After that every edit
+    only rescans the lines it touched, so counting, stepping through matches
+    and replacing all of them never search the whole text again. Matches are
+    line-local: empty matches and matches spanning a newline are ignored.
+    Only the matches on screen carry the highlight tag; it is refreshed when
+    the view scrolls or the buffer changes.
+    """
+
+    CHUNK_LINES = 4096
+    TAG = 'search_match'
+
+    def __init__(self, tab, regex, expand=False):
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.regex = regex
+        self.expand = expand  # whether replacements are regex templates
+        self.view_job = None
+
+        matches, flags, self.count = self.scan(1, int(self.text_area.index('end-1c').split('.')[0]))
+        self.line_matches = [None] + matches
+        self.flags = bytearray(1) + flags  # 1 for every line with a match
+
+        self.text_area.tag_config(self.TAG, background='#fff3a0')
+        self.text_area.tag_raise('highlight')
+        tab.edit_listeners.append(self.on_edit)
+        tab.scroll_listeners.append(self.schedule_view)
+        self.schedule_view()
+
+    def scan(self, first, last):
+        # Return (matches, flags, count) for lines first..last of the buffer
+        matches = [None] * (last - first + 1)
+        flags = bytearray(last - first + 1)
+        count = 0
+        for chunk_first in range(first, last + 1, self.CHUNK_LINES):
+            chunk_last = min(last, chunk_first + self.CHUNK_LINES - 1)
+            text = self.text_area.get(f"{chunk_first}.0", f"{chunk_last}.0 lineend")
+            row = chunk_first - first
+            position = 0
+            for match in self.regex.finditer(text):
+                start, end = match.span()
+                if start == end or text.find('\n', start, end) != -1:
+                    continue
+                row += text.count('\n', position, start)
+                position = start
+                line_start = text.rfind('\n', 0, start) + 1
+                if matches[row] is None:
+                    matches[row] = []
+                    flags[row] = 1
+                matches[row].append((start - line_start, end - line_start))
+                count += 1
+        return matches, flags, count
+
+    def on_edit(self, start, end, text):
+        first, last = start[0], end[0]
+        self.count -= sum(len(m) for m in self.line_matches[first:last + 1] if m)
+        matches, flags, count = self.scan(first, first + text.count('\n'))
+        self.line_matches[first:last + 1] = matches
+        self.flags[first:last + 1] = flags
+        self.count += count
+        self.schedule_view()
+
+    def next_match(self, line, column):
+        # First match starting at or after line.column, wrapping around to the top
+        for match in self.line_matches[line] or ():
+            if match[0] >= column:
+                return line, match
+        found = self.flags.find(1, line + 1)
+        if found == -1:
+            found = self.flags.find(1)
+        if found == -1:
+            return None
+        return found, self.line_matches[found][0]
+
+    def replacement(self, line_text, start, template):
+        if not self.expand:
+            return template
+        return self.regex.match(line_text, start).expand(template)
+
+    def replace_all(self, template):
+        # Replace every match as one undo step; returns the number replaced
+        first = self.flags.find(1)
+        if first == -1:
+            return 0
+        last = self.flags.rfind(1)
+        lines = self.text_area.get(f"{first}.0", f"{last}.0 lineend").split('\n')
+        replacements = []
+        for row, line_text in enumerate(lines):
+            for start, end in self.line_matches[first + row] or ():
+                replacements.append(
+                    (first + row, start, end, self.replacement(line_text, start, template)))
+        self.tab.replace_ranges(replacements)
+        return len(replacements)
+
+    def schedule_view(self):
+        if self.view_job is None:
+            self.view_job = self.text_area.after_idle(self.refresh_view)
+
+    def refresh_view(self):
+        self.view_job = None
+        text_area = self.text_area
+        text_area.tag_remove(self.TAG, '1.0', tk.END)
+        first = int(text_area.index('@0,0').split('.')[0])
+        last = int(text_area.index(f"@0,{text_area.winfo_height()}").split('.')[0])
+        indices = []
+        for line in range(first, min(last, len(self.line_matches) - 1) + 1):
+            for start, end in self.line_matches[line] or ():
+                indices += (f"{line}.{start}", f"{line}.{end}")
+        if indices:
+            text_area.tag_add(self.TAG, *indices)
+
+    def close(self):
+        if self.on_edit in self.tab.edit_listeners:
+            self.tab.edit_listeners.remove(self.on_edit)
+        if self.schedule_view in self.tab.scroll_listeners:
+            self.tab.scroll_listeners.remove(self.schedule_view)
+        if self.view_job is not None:
+            self.text_area.after_cancel(self.view_job)
+            self.view_job = None
+        self.text_area.tag_remove(self.TAG, '1.0', tk.END)
+
+class FindReplaceDialog(tk.Toplevel):
+    def __init__(self, parent, tab):
+        super().__init__(parent)
+        self.tab = tab
+        self.text_widget = tab.text_area
+        self.index = None
+        self.index_key = None
+
+        self.title("Find and Replace")
+        self.geometry("400x280")
+        
+        # Find section
+        tk.Label(self, text="Find:").pack(pady=5)
+        self.find_entry = tk.Entry(self, width=40)
+        self.find_entry.pack()
+        
+        # Replace section
+        tk.Label(self, text="Replace:").pack(pady=5)
+        self.replace_entry = tk.Entry(self, width=40)
+        self.replace_entry.pack()
+
+        # Search options
+        options_frame = tk.Frame(self)
+        options_frame.pack(pady=5)
+        self.regex_var = tk.BooleanVar(value=False)
+        self.case_var = tk.BooleanVar(value=True)
+        self.word_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(options_frame, text="Regex", variable=self.regex_var).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(options_frame, text="Match case", variable=self.case_var).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(options_frame, text="Whole word", variable=self.word_var).pack(side=tk.LEFT, padx=5)
+        
+        # Word count label
+        self.word_count_label = tk.Label(self, text="")
+        self.word_count_label.pack(pady=5)
+        
+        # Buttons
+        buttons_frame = tk.Frame(self)
+        buttons_frame.pack(pady=10)
+        
+        tk.Button(buttons_frame, text="Find", command=self.find_text).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons_frame, text="Replace", command=self.replace_text).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons_frame, text="Replace All", command=self.replace_all).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons_frame, text="Count", command=self.count_occurrences).pack(side=tk.LEFT, padx=5)
+
+        self.text_widget.tag_config('highlight', background='yellow')
+
+        # Bind Enter key to find_text
+        self.find_entry.bind('<Return>', lambda e: self.find_text())
+        self.bind('<Destroy>', self.on_destroy)
+
+    def get_index(self):
+        # Build the match index once per query and set of options
+        pattern = self.find_entry.get()
+        if not pattern:
+            return None
+        key = (pattern, self.regex_var.get(), self.case_var.get(), self.word_var.get())
+        if self.index is not None and key == self.index_key:
+            return self.index
+        try:
+            regex = compile_search(*key)
+        except re.error as e:
+            self.word_count_label.config(text=f"Invalid pattern: {e}")
+            return None
+        self.close_index()
+        self.index = SearchIndex(self.tab, regex, expand=key[1])
+        self.index_key = key
+        self.word_count_label.config(text=f"Occurrences: {self.index.count}")
+        return self.index
+
+    def close_index(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+            self.index_key = None
+
+    def on_destroy(self, event):
+        if event.widget is self and self.text_widget.winfo_exists():
+            self.close_index()
+            self.text_widget.tag_remove('highlight', '1.0', tk.END)
+
+    def find_text(self):
+        index = self.get_index()
+        if index is None:
+            return
+
+        # Search onwards from the cursor, which sits at the end of the last match
+        line, column = self.tab.index_key(self.text_widget.index(tk.INSERT))
+        found = index.next_match(line, column)
+        self.text_widget.tag_remove('highlight', '1.0', tk.END)
+        if found is None:
+            messagebox.showinfo("Find", "Text not found")
+            return
+
+        line, (start, end) = found
+        start_pos, end_pos = f"{line}.{start}", f"{line}.{end}"
+        
+        # Highlight the found text
+        self.text_widget.tag_add('highlight', start_pos, end_pos)
+        self.text_widget.see(start_pos)
+        self.text_widget.mark_set(tk.INSERT, end_pos)
+
+    def replace_text(self):
+        # Replace the highlighted match if it is still a match, then find the next one
+        index = self.get_index()
+        ranges = self.text_widget.tag_ranges('highlight')
+        if index is None or not ranges:
+            return
+        line, start = self.tab.index_key(str(ranges[0]))
+        end = self.tab.index_key(str(ranges[1]))[1]
+        if (start, end) in (index.line_matches[line] or ()):
+            line_text = self.text_widget.get(f"{line}.0", f"{line}.0 lineend")
+            replacement = index.replacement(line_text, start, self.replace_entry.get())
+            self.text_widget.replace(f"{line}.{start}", f"{line}.{end}", replacement)
+            self.text_widget.mark_set(tk.INSERT, f"{line}.{start}+{len(replacement)}c")
+        self.find_text()  # Find next occurrence
+
+    def replace_all(self):
+        index = self.get_index()
+        if index is None:
+            return
+        self.text_widget.tag_remove('highlight', '1.0', tk.END)
+        occurrences = index.replace_all(self.replace_entry.get())
+        self.word_count_label.config(text=f"Occurrences: {index.count}")
+
+        # Show how many replacements were made
+        messagebox.showinfo("Replace All", f"Replaced {occurrences} occurrence(s)")
+
+    def count_occurrences(self):
+        index = self.get_index()
+        if index is not None:
+            self.word_count_label.config(text=f"Occurrences: {index.count}")
+
+SEARCH_WHOLE_BYTES = 32 * 1024 * 1024  # larger files are searched through mmap
+SEARCH_WINDOW_BYTES = 8 * 1024 * 1024
+
+def search_files(paths, source, flags, max_matches=1000, max_line=300):
+    # Runs in a worker process. Each file is decoded and its newlines
+    # normalized as when it is opened, then searched with the same str
+    # pattern as Find, so case folding and \w cover non-ASCII text too;
+    # files with a NUL byte near the start are taken as binary. Files over
+    # SEARCH_WHOLE_BYTES are memory-mapped and decoded a window of whole
+    # lines at a time, so a worker never holds more than a window of them;
+    # matches there cannot span two windows. Returns (path, line, column,
+    # line text) for the first max_matches matches of every file.
+    regex = re.compile(source, flags)
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    continue
+                if size <= SEARCH_WHOLE_BYTES:
+                    data = f.read()
+                    if b'\0' in data[:8192]:
+                        continue
+                    texts = [data.decode(detect_encoding(data), 'replace')]
+                    _search_texts(path, texts, regex, max_matches, max_line, results)
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if b'\0' in data[:8192]:
+                        continue
+                    _search_texts(path, _mapped_texts(data, SEARCH_WINDOW_BYTES), regex, max_matches, max_line, results)
+        except (OSError, ValueError):
+            continue
+    return results
+
+def _mapped_texts(data, size):
+    # The decoded text of a mapped file, about size bytes at a time. Windows
+    # end after a newline, unless a line runs on for another size bytes.
+    decoder = codecs.getincrementaldecoder(detect_encoding(data[:4]))('replace')
+    start = 0
+    while start < len(data):
+        end = data.find(b'\n', start + size, start + 2 * size)
+        end = min(start + size, len(data)) if end == -1 else end + 1
+        yield decoder.decode(data[start:end], end == len(data))
+        start = end
+
+def _search_texts(path, texts, regex, max_matches, max_line, results):
+    # Adds the matches in texts, the consecutive pieces of one file, to results
+    line = 1
+    found = 0
+    carry = 0  # columns of the current line in the texts before
+    for text in texts:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        position = 0
+        for match in regex.finditer(text):
+            start = match.start()
+            line += text.count('\n', position, start)
+            position = start
+            line_start = text.rfind('\n', 0, start) + 1
+            line_end = text.find('\n', start)
+            if line_end == -1:
+                line_end = len(text)
+            column = start - line_start + (carry if line_start == 0 else 0)
+            results.append((path, line, column, text[line_start:min(line_end, line_start + max_line)]))
+            found += 1
+            if found >= max_matches:
+                return
+        line += text.count('\n', position)
+        newline = text.rfind('\n')
+        carry = len(text) - newline - 1 + (carry if newline == -1 else 0)
+
+class ProjectSearch:
+    """Searches a directory tree on the worker processes of a pool.
+
+    A feeder thread walks the tree, groups files into batches of roughly
+    BATCH_BYTES and keeps at most IN_FLIGHT batches per worker queued, so a
+    cancel takes effect within a few batches. Matches are put on the results
+    queue as each batch completes, followed by None once the search is over.
+    """
+
+    BATCH_FILES = 256
+    BATCH_BYTES = 16 * 1024 * 1024
+    IN_FLIGHT = 2
+
+    def __init__(self, pool, root, source, flags, patterns):
+        self.pool = pool
+        self.root = root
+        self.source = source
+        self.flags = flags
+        self.patterns = patterns
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.files = 0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def batches(self):
+        paths, size = [], 0
+        for path, file_size in iter_search_files(self.root, self.patterns):
+            paths.append(path)
+            size += file_size
+            if len(paths) >= self.BATCH_FILES or size >= self.BATCH_BYTES:
+                yield paths
+                paths, size = [], 0
+        if paths:
+            yield paths
+
+    def run(self):
+        pending = set()
+        limit = self.IN_FLIGHT * (os.cpu_count() or 1)
+        try:
+            for paths in self.batches():
+                if self.cancelled.is_set():
+                    break
+                while len(pending) >= limit and not self.cancelled.is_set():
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    self.collect(done)
+                self.files += len(paths)
+                pending.add(self.pool.submit(search_files, paths, self.source, self.flags))
+            while pending and not self.cancelled.is_set():
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                self.collect(done)
+        except Exception as e:
+            self.results.put(e)
+        finally:
+            for future in pending:
+                future.cancel()
+            self.results.put(None)
+
+    def collect(self, futures):
+        for future in futures:
+            matches = future.result()
+            if matches and not self.cancelled.is_set():
+                self.results.put(matches)
+
+class FindInFilesDialog(tk.Toplevel):
+    POLL_MS = 50
+    MAX_ROWS_PER_POLL = 2000
+
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.search = None
+        self.poll_job = None
+        self.file_nodes = {}
+        self.match_count = 0
+
+        self.title("Find in Files")
+        self.geometry("700x450")
+
+        # Query section
+        form = tk.Frame(self)
+        form.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(form, text="Find:").grid(row=0, column=0, sticky=tk.W)
+        self.find_entry = tk.Entry(form, width=50)
+        self.find_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
+        tk.Label(form, text="In folder:").grid(row=1, column=0, sticky=tk.W)
+        self.folder_entry = tk.Entry(form, width=50)
+        self.folder_entry.grid(row=1, column=1, sticky=tk.EW, padx=5)
+        self.folder_entry.insert(0, os.getcwd())
+        tk.Button(form, text="Browse", command=self.browse).grid(row=1, column=2)
+        form.columnconfigure(1, weight=1)
+
+        # Search options
+        options_frame = tk.Frame(self)
+        options_frame.pack(fill=tk.X, padx=5)
+        self.regex_var = tk.BooleanVar(value=False)
+        self.case_var = tk.BooleanVar(value=True)
+        self.word_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(options_frame, text="Regex", variable=self.regex_var).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(options_frame, text="Match case", variable=self.case_var).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(options_frame, text="Whole word", variable=self.word_var).pack(side=tk.LEFT, padx=5)
+        tk.Button(options_frame, text="Cancel", command=self.cancel).pack(side=tk.RIGHT, padx=5)
+        tk.Button(options_frame, text="Search", command=self.start_search).pack(side=tk.RIGHT, padx=5)
+
+        # Results panel: one node per file, one child per match
+        results_frame = tk.Frame(self)
+        results_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.results = ttk.Treeview(results_frame, show='tree')
+        scrollbar = ttk.Scrollbar(results_frame, command=self.results.yview)
+        self.results.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results.pack(fill=tk.BOTH, expand=True)
+        self.results.bind('<Double-1>', self.open_result)
+        self.results.bind('<Return>', self.open_result)
+
+        self.status_label = tk.Label(self, text="", anchor=tk.W)
+        self.status_label.pack(fill=tk.X, padx=5)
+
+        self.find_entry.bind('<Return>', lambda e: self.start_search())
+        self.find_entry.focus_set()
+        self.bind('<Destroy>', self.on_destroy)
+
+    def browse(self):
+        folder = filedialog.askdirectory(initialdir=self.folder_entry.get() or None)
+        if folder:
+            self.folder_entry.delete(0, tk.END)
+            self.folder_entry.insert(0, folder)
+
+    def start_search(self):
+        pattern = self.find_entry.get()
+        root = self.folder_entry.get()
+        if not pattern:
+            return
+        if not os.path.isdir(root):
+            messagebox.showwarning("Find in Files", f"Not a folder: {root}")
+            return
+        source = search_source(pattern, self.regex_var.get(), self.word_var.get())
+        flags = search_flags(self.case_var.get())
+        try:
+            re.compile(source, flags)
+        except re.error as e:
+            self.status_label.config(text=f"Invalid pattern: {e}")
+            return
+
+        self.cancel()
+        self.results.delete(*self.results.get_children())
+        self.file_nodes = {}
+        self.match_count = 0
+        self.root_dir = root
+        patterns = load_ignore_patterns(root, self.app.config['search_ignore'])
+        self.search = ProjectSearch(self.app.get_search_pool(), root, source, flags, patterns)
+        self.search.start()
+        self.status_label.config(text="Searching...")
+        self.poll_job = self.after(self.POLL_MS, self.poll)
+
+    def cancel(self):
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+            self.status_label.config(text=f"Cancelled: {self.match_count} match(es)")
+        if self.poll_job is not None:
+            self.after_cancel(self.poll_job)
+            self.poll_job = None
+
+    def poll(self):
+        # Move results into the panel a bounded number of rows per turn
+        self.poll_job = None
+        search = self.search
+        rows = 0
+        while rows < self.MAX_ROWS_PER_POLL:
+            try:
+                item = search.results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.search = None
+                self.status_label.config(
+                    text=f"{self.match_count} match(es) in {len(self.file_nodes)} file(s), "
+                         f"{search.files} file(s) searched")
+                return
+            if isinstance(item, Exception):
+                self.status_label.config(text=f"Search error: {item}")
+                continue
+            for path, line, column, text in item:
+                self.add_result(path, line, column, text)
+            rows += len(item)
+        self.status_label.config(text=f"Searching... {self.match_count} match(es)")
+        self.poll_job = self.after(self.POLL_MS, self.poll)
+
+    def add_result(self, path, line, column, text):
+        node = self.file_nodes.get(path)
+        if node is None:
+            label = os.path.relpath(path, self.root_dir)
+            node = self.results.insert('', tk.END, text=label, open=True, values=(path,))
+            self.file_nodes[path] = node
+        self.results.insert(node, tk.END, text=f"{line}: {text.strip()}",
+                            values=(path, line, column))
+        self.match_count += 1
+
+    def open_result(self, event=None):
+        selection = self.results.selection()
+        if not selection:
+            return
+        values = self.results.item(selection[0], 'values')
+        if len(values) == 3:
+            path, line, column = values
+            self.app.open_at(path, int(line), int(column))
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.cancel()
+
+def line_starts(text):
+    # Offsets at which each line of text starts
+    starts = [0]
+    find = text.find
+    newline = find('\n')
+    while newline != -1:
+        starts.append(newline + 1)
+        newline = find('\n', newline + 1)
+    return starts
+
+_PYTHON_DEFINITION = re.compile(r'^[ \t]*(?:async[ \t]+)?(def|class)[ \t]+(\w+)', re.MULTILINE)
+_JAVASCRIPT_DEFINITIONS = (
+    ('function', re.compile(r'\bfunction\b\s*\*?\s*([A-Za-z_$][\w$]*)')),
+    ('class', re.compile(r'\bclass\s+([A-Za-z_$][\w$]*)')),
+    ('function', re.compile(r'\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?'
+                            r'(?:function\b|\([^()]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)')),
+    ('method', re.compile(r'^[ \t]*(?:static\s+)?(?:async\s+)?(?!(?:if|for|while|switch|catch|function|return)\b)'
+                          r'([A-Za-z_$][\w$]*)\s*\([^()\n]*\)\s*\{', re.MULTILINE)),
+)
+# Nodes whose children can hold definitions: statements, except clauses and match cases
+_BLOCKS = (ast.stmt, ast.excepthandler) + ((ast.match_case,) if hasattr(ast, 'match_case') else ())
+_CSS_COMMENT = re.compile(r'/\*[\s\S]*?\*/')
+_CSS_SELECTOR = re.compile(r'([^{};]+)\{')
+_JSON_STRING = re.compile(r'"((?:[^"\\\n]|\\.)*)"(\s*:)?')
+
+def extract_symbols(text, language):
+    """Return the definitions in text as (name, kind, line, column, container).
+
+    Python is parsed with ast, falling back to a regex for code that does not
+    parse; the other languages are matched with regexes.
+    """
+    symbols = []
+    starts = line_starts(text)
+
+    def position(offset):
+        row = bisect.bisect_right(starts, offset) - 1
+        return row + 1, offset - starts[row]
+
+    if language == 'python':
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is None:
+            for match in _PYTHON_DEFINITION.finditer(text):
+                kind = 'class' if match.group(1) == 'class' else 'function'
+                symbols.append((match.group(2), kind, *position(match.start(2)), None))
+            return symbols
+        lines = text.split('\n')
+        stack = [(child, None, False) for child in reversed(tree.body)]
+        while stack:
+            node, container, in_class = stack.pop()
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                line = lines[node.lineno - 1]
+                column = node.col_offset if line.isascii() else len(
+                    line.encode('utf-8')[:node.col_offset].decode('utf-8', 'ignore'))
+                match = _DEFINITION.match(line, column)
+                if match:
+                    column = match.end()
+                is_class = isinstance(node, ast.ClassDef)
+                kind = 'class' if is_class else 'method' if in_class else 'function'
+                symbols.append((node.name, kind, node.lineno, column, container))
+                qualified = f"{container}.{node.name}" if container else node.name
+                stack.extend((child, qualified, is_class) for child in reversed(node.body))
+            else:
+                stack.extend((child, container, in_class) for child in reversed(list(ast.iter_child_nodes(node)))
+                             if isinstance(child, _BLOCKS))
+    elif language == 'javascript':
+        for kind, pattern in _JAVASCRIPT_DEFINITIONS:
+            for match in pattern.finditer(text):
+                symbols.append((match.group(1), kind, *position(match.start(1)), None))
+        symbols.sort(key=lambda symbol: symbol[2:4])
+    elif language == 'css':
+        # Blank out comments, keeping offsets, so they cannot hide a selector
+        code = _CSS_COMMENT.sub(lambda match: re.sub(r'[^\n]', ' ', match.group()), text)
+        for match in _CSS_SELECTOR.finditer(code):
+            selector = match.group(1)
+            stripped = selector.lstrip()
+            if stripped.strip():
+                kind = 'at-rule' if stripped.startswith('@') else 'selector'
+                offset = match.start(1) + len(selector) - len(stripped)
+                symbols.append((' '.join(stripped.split()), kind, *position(offset), None))
+    elif language == 'json':
+        for match in _JSON_STRING.finditer(text):
+            if match.group(2):
+                symbols.append((match.group(1), 'key', *position(match.start(1)), None))
+    return symbols
+
+def index_files(paths, max_bytes):
+    # Runs in a worker process. Returns (path, mtime, size, symbols) for each
+    # path that could be read; files over max_bytes are recorded without symbols
+    results = []
+    for path in paths:
+        language = LANGUAGE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        try:
+            stat = os.stat(path)
+            symbols = []
+            if language and stat.st_size <= max_bytes:
+                with open(path, 'rb') as f:
+                    text = f.read().decode('utf-8', 'replace')
+                symbols = extract_symbols(text.replace('\r\n', '\n').replace('\r', '\n'), language)
+        except OSError:
+            continue
+        results.append((path, stat.st_mtime, stat.st_size, symbols))
+    return results
+
+def buffer_symbols(path, text):
+    # Runs in a worker process; symbols of an open tab's unsaved text
+    language = LANGUAGE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    return [(path, -1, len(text), extract_symbols(text, language) if language else [])]
+
+def fuzzy_score(query, name):
+    """Score name against a lowercase query; None if query is not a subsequence of it.
+
+    Characters matched in a row, at the start of a word and prefixes score
+    higher; longer names score a little lower.
+    """
+    lower = name.lower()
+    score = 0
+    position = 0
+    previous = -2
+    for char in query:
+        index = lower.find(char, position)
+        if index == -1:
+            return None
+        if index == previous + 1:
+            score += 5
+        if index == 0 or not name[index - 1].isalnum() or (name[index].isupper() and name[index - 1].islower()):
+            score += 3
+        score -= min(index - position, 5)
+        previous = index
+        position = index + 1
+    if lower == query:
+        score += 30
+    elif lower.startswith(query):
+        score += 15
+    return score - len(name) / 16
+
+class SerialWorker:
+    """Runs submitted calls one at a time on a daemon thread.
+
+    Like a one-thread executor, except that work still queued or running
+    never holds up the interpreter at exit.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def submit(self, function, *args):
+        from concurrent.futures import Future
+        future = Future()
+        self.jobs.put((future, function, args))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+        return future
+
+    def run(self):
+        while True:
+            future, function, args = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+class SymbolIndex:
+    """On-disk SQLite index of the definitions in open files and project folders.
+
+    Files are re-read only when their mtime or size changed, and parsed in
+    batches on the worker processes of a pool. All writes go through one
+    worker thread and queries through another; the database is in WAL mode
+    so a query never waits for an update in progress. The unsaved text of a
+    modified tab is indexed with an mtime of -1, so the file is read again
+    from disk the next time it is checked.
+    """
+
+    FORMAT = 1
+    BATCH_FILES = 64
+    IN_FLIGHT = 2
+    MAX_BYTES = 4 * 1024 * 1024  # larger files are listed but not parsed
+    PREFIX_CANDIDATES = 200
+    FUZZY_CANDIDATES = 2000
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = SerialWorker('nobu-symbols')
+        self.reader = SerialWorker('nobu-symbol-query')
+        self.connections = threading.local()
+        self.names = None  # see load_names, used on the query thread only
+        self.names_version = None
+
+    def connection(self):
+        connection = getattr(self.connections, 'connection', None)
+        if connection is None:
+            # Imported here; sqlite3 is not needed to start the editor
+            import sqlite3
+            connection = sqlite3.connect(str(self.path), timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if connection.execute('PRAGMA user_version').fetchone()[0] != self.FORMAT:
+                with connection:
+                    connection.execute('DROP TABLE IF EXISTS files')
+                    connection.execute('DROP TABLE IF EXISTS symbols')
+                    connection.execute('CREATE TABLE files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER)')
+                    connection.execute('CREATE TABLE symbols (name TEXT COLLATE NOCASE, kind TEXT, '
+                                       'path TEXT, line INTEGER, col INTEGER, container TEXT)')
+                    connection.execute('CREATE INDEX symbols_name ON symbols (name)')
+                    connection.execute('CREATE INDEX symbols_path ON symbols (path)')
+                    connection.execute(f'PRAGMA user_version={self.FORMAT}')
+            self.connections.connection = connection
+        return connection
+
+    def update(self, pool, paths=(), buffers=(), folders=()):
+        """Bring the index up to date in the background.
+
+        paths are files to check by mtime, buffers (path, text) pairs of
+        unsaved text and folders (root, ignore patterns) pairs of trees to
+        walk. Returns a future for the number of files parsed.
+        """
+        return self.writer.submit(self.run_update, pool, list(paths), list(buffers), list(folders))
+
+    def run_update(self, pool, paths, buffers, folders):
+        connection = self.connection()
+        known = {path: (mtime, size) for path, mtime, size in connection.execute('SELECT path, mtime, size FROM files')}
+        stale = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if known.get(path) != (stat.st_mtime, stat.st_size):
+                stale.append(path)
+        gone = []
+        for root, patterns in folders:
+            prefix = os.path.join(root, '')
+            seen = set()
+            for path, size in iter_search_files(root, patterns):
+                if os.path.splitext(path)[1].lower() not in LANGUAGE_EXTENSIONS:
+                    continue
+                seen.add(path)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                if known.get(path) != (mtime, size):
+                    stale.append(path)
+            gone += [path for path in known if path.startswith(prefix) and path not in seen]
+
+        if gone:
+            with connection:
+                connection.executemany('DELETE FROM symbols WHERE path = ?', [(path,) for path in gone])
+                connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in gone])
+
+        pending = [pool.submit(buffer_symbols, path, text) for path, text in buffers]
+        stale = list(dict.fromkeys(stale))
+        limit = self.IN_FLIGHT * (os.cpu_count() or 1)
+        parsed = 0
+        for start in range(0, len(stale), self.BATCH_FILES):
+            while len(pending) >= limit:
+                done, remaining = wait(pending, return_when=FIRST_COMPLETED)
+                parsed += self.store(connection, done)
+                pending = list(remaining)
+            pending.append(pool.submit(index_files, stale[start:start + self.BATCH_FILES], self.MAX_BYTES))
+        if pending:
+            parsed += self.store(connection, wait(pending)[0])
+        return parsed
+
+    def store(self, connection, futures):
+        files = [entry for future in futures for entry in future.result()]
+        with connection:
+            for path, mtime, size, symbols in files:
+                connection.execute('DELETE FROM symbols WHERE path = ?', (path,))
+                connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path, mtime, size))
+                connection.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)',
+                                       [(name, kind, path, line, column, container)
+                                        for name, kind, line, column, container in symbols])
+        return len(files)
+
+    def query(self, text, limit=50):
+        # Returns a future for the best matches as (name, kind, path, line, column, container)
+        return self.reader.submit(self.run_query, text, limit)
+
+    def run_query(self, text, limit):
+        query = ''.join(text.split()).lower()
+        connection = self.connection()
+        names, lowered, blob, starts = self.load_names(connection)
+        if not query:
+            return []
+
+        # Prefixes first, straight off the sorted names, then the names that
+        # hold query as a subsequence, one regex search per matching name
+        candidates = []
+        first = bisect.bisect_left(lowered, query)
+        for row in range(first, min(first + self.PREFIX_CANDIDATES, len(lowered))):
+            if not lowered[row].startswith(query):
+                break
+            candidates.append(row)
+        # Each character is matched at its first occurrence after the previous
+        # one, which never needs backtracking
+        escaped = [re.escape(char) for char in query]
+        pattern = re.compile(escaped[0] + ''.join(f'[^{char}\\n]*{char}' for char in escaped[1:]))
+        position = 0
+        while len(candidates) < self.FUZZY_CANDIDATES:
+            match = pattern.search(blob, position)
+            if match is None:
+                break
+            row = bisect.bisect_right(starts, match.start()) - 1
+            candidates.append(row)
+            position = starts[row + 1] if row + 1 < len(starts) else len(blob)
+
+        scores = {}
+        for row in candidates:
+            if row not in scores:
+                scores[row] = fuzzy_score(query, names[row])
+        best = sorted(scores, key=lambda row: (-scores[row], lowered[row]))[:limit]
+        if not best:
+            return []
+        rank = {lowered[row]: position for position, row in enumerate(best)}
+        rows = connection.execute(
+            'SELECT name, kind, path, line, col, container FROM symbols WHERE name IN '
+            f'({", ".join("?" * len(best))}) LIMIT ?', [names[row] for row in best] + [limit * 4]
+        ).fetchall()
+        rows.sort(key=lambda row: (rank.get(row[0].lower(), limit), row[0], row[2], row[3]))
+        return rows[:limit]
+
+    def load_names(self, connection):
+        # The distinct names, sorted by their lowercase form and also joined
+        # one per line for the regex pass; reloaded once the writer commits
+        version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if version != self.names_version:
+            names = sorted((row[0] for row in connection.execute('SELECT DISTINCT name FROM symbols')),
+                           key=str.lower)
+            lowered = [name.lower() for name in names]
+            blob = '\n'.join(lowered)
+            self.names = names, lowered, blob, line_starts(blob)
+            self.names_version = version
+        return self.names
+
+    def symbol_count(self):
+        # Returns a future for the number of symbols indexed
+        return self.reader.submit(lambda: self.connection().execute('SELECT COUNT(*) FROM symbols').fetchone()[0])
+
+class GoToSymbolDialog(tk.Toplevel):
+    POLL_MS = 20
+
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.index = app.symbol_index
+        self.query_future = None
+        self.update_future = None
+        self.poll_job = None
+        self.last_query = None
+
+        self.title("Go to Symbol")
+        self.geometry("650x400")
+
+        self.query_entry = tk.Entry(self)
+        self.query_entry.pack(fill=tk.X, padx=5, pady=5)
+
+        # One row per symbol; where it is defined is kept in hidden columns
+        results_frame = tk.Frame(self)
+        results_frame.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.results = ttk.Treeview(results_frame, columns=('kind', 'container', 'location', 'path', 'line', 'column'),
+                                    displaycolumns=('kind', 'container', 'location'))
+        self.results.heading('#0', text="Symbol", anchor=tk.W)
+        self.results.heading('kind', text="Kind", anchor=tk.W)
+        self.results.heading('container', text="In", anchor=tk.W)
+        self.results.heading('location', text="Location", anchor=tk.W)
+        self.results.column('kind', width=70, stretch=False)
+        scrollbar = ttk.Scrollbar(results_frame, command=self.results.yview)
+        self.results.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results.pack(fill=tk.BOTH, expand=True)
+        self.results.bind('<Double-1>', self.open_result)
+        self.results.bind('<Return>', self.open_result)
+
+        bottom = tk.Frame(self)
+        bottom.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(bottom, text="Index Folder...", command=self.index_folder).pack(side=tk.RIGHT)
+        self.status_label = tk.Label(bottom, text="", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.query_entry.bind('<KeyRelease>', lambda e: self.start_query())
+        self.query_entry.bind('<Return>', self.open_result)
+        self.query_entry.bind('<Down>', lambda e: self.move_selection(1))
+        self.query_entry.bind('<Up>', lambda e: self.move_selection(-1))
+        self.bind('<Escape>', lambda e: self.destroy())
+        self.query_entry.focus_set()
+
+        self.start_update()
+
+    def start_update(self, folder=None):
+        self.update_future = self.app.update_symbol_index(folder)
+        self.status_label.config(text="Indexing...")
+        self.schedule_poll()
+
+    def index_folder(self):
+        folder = filedialog.askdirectory(parent=self, initialdir=os.getcwd())
+        if folder:
+            self.start_update(folder)
+
+    def start_query(self):
+        text = self.query_entry.get()
+        if text == self.last_query:
+            return
+        self.last_query = text
+        # Only the latest query matters; older ones are dropped when they finish
+        self.query_future = self.index.query(text)
+        self.schedule_poll()
+
+    def schedule_poll(self):
+        if self.poll_job is None:
+            self.poll_job = self.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        self.poll_job = None
+        if self.query_future is not None and self.query_future.done():
+            future, self.query_future = self.query_future, None
+            try:
+                self.show_results(future.result())
+            except Exception as e:
+                self.status_label.config(text=f"Symbol index error: {e}")
+        if self.update_future is not None and self.update_future.done():
+            future, self.update_future = self.update_future, None
+            try:
+                parsed = future.result()
+                self.status_label.config(text=f"Index up to date, {parsed} file(s) parsed")
+            except Exception as e:
+                self.status_label.config(text=f"Indexing error: {e}")
+            # The index changed under the last query
+            self.last_query = None
+            self.start_query()
+        if self.query_future is not None or self.update_future is not None:
+            self.schedule_poll()
+
+    def show_results(self, rows):
+        self.results.delete(*self.results.get_children())
+        for name, kind, path, line, column, container in rows:
+            location = f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}:{line}"
+            self.results.insert('', tk.END, text=name, values=(kind, container or '', location, path, line, column))
+        children = self.results.get_children()
+        if children:
+            self.results.selection_set(children[0])
+            self.results.see(children[0])
+
+    def move_selection(self, step):
+        children = self.results.get_children()
+        if not children:
+            return 'break'
+        selection = self.results.selection()
+        index = children.index(selection[0]) + step if selection else 0
+        index = max(0, min(len(children) - 1, index))
+        self.results.selection_set(children[index])
+        self.results.see(children[index])
+        return 'break'
+
+    def open_result(self, event=None):
+        selection = self.results.selection()
+        if not selection:
+            return
+        values = self.results.item(selection[0], 'values')
+        path, line, column = values[3], int(values[4]), int(values[5])
+        self.destroy()
+        self.app.open_at(path, line, column)
+
+    def destroy(self):
+        if self.poll_job is not None:
+            self.after_cancel(self.poll_job)
+            self.poll_job = None
+        super().destroy()
+
+# Identifiers worth completing: at least three characters, not starting with a digit
+IDENTIFIER = re.compile(r'(?<!\w)[^\W\d]\w{2,}')
+
+def language_vocabulary(spec):
+    # Sorted keywords and builtins of a language_keywords entry; languages
+    # without word sets give them as a \b(a|b|...)\b highlighting pattern
+    words = set(spec.get('keywords', ())) | set(spec.get('builtins', ()))
+    for token_type in ('keywords', 'builtin'):
+        pattern = spec.get('patterns', {}).get(token_type, '')
+        match = re.fullmatch(r'\\b\(([\w|]+)\)\\b', pattern)
+        if match:
+            words.update(match.group(1).split('|'))
+    return sorted(word for word in words if IDENTIFIER.fullmatch(word))
+
+class CompletionIndex:
+    """The identifiers of one buffer with their number of occurrences.
+
+    line_words[n] holds the identifiers on line n (None for none), so an
+    edit only rescans the lines it touched and takes the old lines' words
+    back out of the counts. Prefix lookups bisect a sorted list of the
+    distinct words, which is kept up to date word by word and only sorted
+    again after a large paste or the initial scan. recent maps words to
+    when an edit last introduced them or a completion inserted them.
+    """
+
+    RESORT_WORDS = 64  # more new words than this and the list is sorted again
+    MAX_RECENT = 1000
+
+    def __init__(self):
+        self.line_words = [None]
+        self.counts = {}
+        self.words = []  # the keys of counts, sorted; None when stale
+        self.recent = {}
+
+    def words_of(self, line):
+        words = IDENTIFIER.findall(line)
+        return tuple(map(sys.intern, words)) if words else None
+
+    def replace_lines(self, first, last, lines, touched=True):
+        # Lines first..last now read lines; last is first - 1 to append
+        old = self.line_words[first:last + 1]
+        new = [self.words_of(line) for line in lines]
+        self.line_words[first:last + 1] = new
+
+        counts = self.counts
+        added = []
+        for words in new:
+            for word in words or ():
+                count = counts.get(word, 0)
+                if not count:
+                    added.append(word)
+                counts[word] = count + 1
+        removed = []
+        for words in old:
+            for word in words or ():
+                count = counts[word] - 1
+                if count:
+                    counts[word] = count
+                else:
+                    del counts[word]
+                    removed.append(word)
+
+        if touched:
+            # Words the edit brought in count as just used
+            now = time.monotonic()
+            before = {word for words in old for word in words or ()}
+            for word in {word for words in new for word in words or ()} - before:
+                self.recent[word] = now
+            if len(self.recent) > 2 * self.MAX_RECENT:
+                newest = heapq.nlargest(self.MAX_RECENT, self.recent.items(), key=lambda item: item[1])
+                self.recent = dict(newest)
+
+        words = self.words
+        if words is None:
+            return
+        if len(added) + len(removed) > self.RESORT_WORDS:
+            self.words = None
+            return
+        for word in removed:
+            if word not in counts:  # it may have been removed and added back
+                del words[bisect.bisect_left(words, word)]
+        for word in added:
+            position = bisect.bisect_left(words, word)
+            if position == len(words) or words[position] != word:
+                words.insert(position, word)
+
+    def use(self, word):
+        self.recent[word] = time.monotonic()
+
+    def starting_with(self, prefix):
+        if self.words is None:
+            self.words = sorted(self.counts)
+        words = self.words
+        return words[bisect.bisect_left(words, prefix):bisect.bisect_left(words, prefix + '\U0010ffff')]
+
+RECENT_SECONDS = 600  # how long a used word ranks above the others
+
+def rank_completions(prefix, indexes, vocabulary=(), limit=50):
+    """Words starting with prefix, best first.
+
+    Words used in the last RECENT_SECONDS come first, most recent first;
+    the rest by their number of occurrences over all indexes, so keywords
+    and builtins from vocabulary come last unless they are used.
+    """
+    totals = {}
+    used = {}
+    for index in indexes:
+        counts, recent = index.counts, index.recent
+        for word in index.starting_with(prefix):
+            totals[word] = totals.get(word, 0) + counts[word]
+            when = recent.get(word)
+            if when is not None and when > used.get(word, 0):
+                used[word] = when
+    start = bisect.bisect_left(vocabulary, prefix)
+    for word in vocabulary[start:bisect.bisect_left(vocabulary, prefix + '\U0010ffff')]:
+        totals.setdefault(word, 0)
+    totals.pop(prefix, None)  # the word being typed
+
+    cutoff = time.monotonic() - RECENT_SECONDS
+    def score(word):
+        when = used.get(word, 0)
+        return (when if when >= cutoff else 0, totals[word])
+    return heapq.nlargest(limit, totals, key=score)
+
+class Completer:
+    """Keeps a tab's CompletionIndex current and drives its popup.
+
+    The buffer is scanned into the index in CHUNK_LINES pieces for up to
+    SCAN_BUDGET seconds per turn of the event loop. Edits below the part
+    scanned so far are left to the scan; the rest update the index from the
+    changed lines alone.
+    """
+
+    CHUNK_LINES = 1024
+    SCAN_BUDGET = 0.01
+    LOADING_MS = 200
+    AUTO_PREFIX = 3  # characters typed before the popup opens by itself
+    LIMIT = 50
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.text_area = tab.text_area
+        self.index = CompletionIndex()
+        self.scan_job = None
+        self.popup = None
+        self.schedule()
+
+    def schedule(self):
+        if self.scan_job is None:
+            self.scan_job = self.text_area.after_idle(self.scan)
+
+    def scan(self):
+        self.scan_job = None
+        if self.tab.loader is not None:
+            # Left until the file is in; FileLoader has the loop meanwhile
+            self.scan_job = self.text_area.after(self.LOADING_MS, self.scan)
+            return
+        index = self.index
+        line_count = int(self.text_area.index('end-1c').split('.')[0])
+        deadline = time.perf_counter() + self.SCAN_BUDGET
+        while len(index.line_words) <= line_count and time.perf_counter() < deadline:
+            first = len(index.line_words)
+            last = min(line_count, first + self.CHUNK_LINES - 1)
+            lines = self.text_area.get(f"{first}.0", f"{last}.0 lineend").split('\n')
+            index.replace_lines(first, first - 1, lines, touched=False)
+        if len(index.line_words) <= line_count:
+            self.scan_job = self.text_area.after(1, self.scan)
+
+    def on_edit(self, start, end, text):
+        first, last = start[0], end[0]
+        index = self.index
+        scanned = len(index.line_words) - 1
+        if first > scanned:
+            return
+        if last > scanned:
+            # Runs past the scanned part; rescan from the first changed line
+            index.replace_lines(first, scanned, [], touched=False)
+            self.schedule()
+            return
+        new_last = first + text.count('\n')
+        lines = self.text_area.get(f"{first}.0", f"{new_last}.0 lineend").split('\n')
+        index.replace_lines(first, last, lines)
+
+    def cancel(self):
+        if self.scan_job is not None:
+            self.text_area.after_cancel(self.scan_job)
+            self.scan_job = None
+        self.close()
+
+    def prefix(self):
+        line = self.text_area.get('insert linestart', tk.INSERT)
+        match = re.search(r'\w+$', line)
+        return match.group() if match and not match.group()[0].isdigit() else ''
+
+    def completions(self, prefix):
+        app = self.tab.master
+        indexes = [self.index]
+        for tab_id in app.notebook.tabs():
+            tab = app.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab is not self.tab and tab.completer is not None:
+                indexes.append(tab.completer.index)
+        return rank_completions(prefix, indexes, app.get_vocabulary(self.tab.current_language), self.LIMIT)
+
+    @instrumented
+    def complete(self, automatic=False):
+        # Open or refresh the popup for the word before the cursor
+        prefix = self.prefix()
+        if not prefix or (automatic and self.popup is None and len(prefix) < self.AUTO_PREFIX):
+            self.close()
+            return
+        words = self.completions(prefix)
+        if not words:
+            self.close()
+            return
+        if self.popup is None:
+            self.popup = CompletionPopup(self)
+        self.popup.show(prefix, words)
+
+    def accept(self, word, prefix):
+        text_area = self.text_area
+        self.close()
+        text_area.replace(f"insert-{len(prefix)}c", tk.INSERT, word)
+        self.index.use(word)
+
+    def close(self):
+        if self.popup is not None:
+            popup, self.popup = self.popup, None
+            popup.destroy()
+
+    def on_key(self, event):
+        # Keys the popup takes over from the text while it is open
+        popup = self.popup
+        if popup is None:
+            return None
+        if event.keysym in ('Down', 'Up'):
+            popup.move_selection(1 if event.keysym == 'Down' else -1)
+        elif event.keysym in ('Return', 'Tab'):
+            popup.accept()
+        else:  # Escape
+            self.close()
+        return 'break'
+
+    def on_key_release(self, event):
+        if event.keysym in ('Down', 'Up', 'Return', 'Tab', 'Escape'):
+            return
+        if event.char and (event.char.isalnum() or event.char == '_') or (self.popup and event.keysym == 'BackSpace'):
+            self.complete(automatic=True)
+        elif self.popup is not None:
+            self.close()
+
+class CompletionPopup(tk.Toplevel):
+    VISIBLE_ROWS = 10
+
+    def __init__(self, completer):
+        text_area = completer.text_area
+        super().__init__(text_area)
+        self.completer = completer
+        self.prefix = ''
+        self.overrideredirect(True)
+        self.listbox = tk.Listbox(self, height=self.VISIBLE_ROWS, activestyle='none', exportselection=False,
+                                  font=text_area.cget('font'))
+        self.listbox.pack(fill=tk.BOTH, expand=True)
+        self.listbox.bind('<ButtonRelease-1>', lambda event: self.accept())
+
+    def show(self, prefix, words):
+        self.prefix = prefix
+        listbox = self.listbox
+        listbox.delete(0, tk.END)
+        listbox.insert(tk.END, *words)
+        listbox.configure(height=min(len(words), self.VISIBLE_ROWS),
+                          width=max(len(word) for word in words) + 2)
+        listbox.selection_set(0)
+
+        # Just below the start of the word being completed
+        text_area = self.completer.text_area
+        box = text_area.bbox(f"insert-{len(prefix)}c")
+        if box is None:
+            self.completer.close()
+            return
+        x, y, width, height = box
+        self.geometry(f"+{text_area.winfo_rootx() + x}+{text_area.winfo_rooty() + y + height}")
+        self.lift()
+
+    def move_selection(self, step):
+        listbox = self.listbox
+        selection = listbox.curselection()
+        index = max(0, min(listbox.size() - 1, (selection[0] if selection else -1) + step))
+        listbox.selection_clear(0, tk.END)
+        listbox.selection_set(index)
+        listbox.see(index)
+
+    def accept(self):
+        selection = self.listbox.curselection()
+        if selection:
+            self.completer.accept(self.listbox.get(selection[0]), self.prefix)
+        else:
+            self.completer.close()
+
+def profile_startup(root, app, marks):
+    # Report when the window first painted and when the visible tab was
+    # loaded, highlighted and ready for input, counted from module load
+    def on_expose(event):
+        marks.setdefault('first paint', time.perf_counter())
+
+    def check():
+        selected = app.notebook.select()
+        tab = app.notebook.nametowidget(selected).winfo_children()[0] if selected else None
+        scheduler = tab.highlight_scheduler if tab is not None and not tab.hibernated else None
+        busy = (not app.startup_done or 'first paint' not in marks or scheduler is None or tab.loader
+                or scheduler.pending is not None or scheduler.future is not None or scheduler.slices
+                or scheduler.cached is not None or scheduler.cached_runs)
+        if busy:
+            root.after(5, check)
+            return
+        marks['interactive'] = time.perf_counter()
+        report = ', '.join(f"{name} {(mark - STARTED) * 1000:.1f} ms" for name, mark in marks.items())
+        print(f"Startup: {report}", file=sys.stderr)
+
+    root.bind('<Expose>', on_expose, add='+')
+    root.after(5, check)
+
+def main():
+    parser = argparse.ArgumentParser(description="Nobu - Code Editor")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print the time to first paint and to interactive')
+    args = parser.parse_args()
+    marks = {'imports': time.perf_counter()}
+
+    root = tk.Tk()
+    
+    try:
+        root.iconbitmap('nobu_icon.ico')  
+    except Exception:
+        pass  # Fallback if icon loading fails
+    
+    app = Nobu(root)
+    app.pack(fill=tk.BOTH, expand=True)
+    if args.profile_startup:
+        marks['window built'] = time.perf_counter()
+        profile_startup(root, app, marks)
+    
+    # Custom window management
+    def on_closing():
+        # Check for unsaved changes in all tabs
+        for tab_id in app.notebook.tabs():
+            tab = app.notebook.nametowidget(tab_id).winfo_children()[0]
+            if tab.is_modified:
+                response = messagebox.askyesnocancel(
+                    "Unsaved Changes", 
+                    "You have unsaved changes. Do you want to save before exiting?"
+                )
+                
+                if response is None:  # Cancel
+                    return
+                elif response:  # Yes
+                    app.save_file(tab)
+        
+        # Save configuration and the open files before closing
+        app.save_session()
+        app.save_config()
+        root.destroy()
+    
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    root.mainloop()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,812 @@
+# The parts of Nobu that need no Tk: language rules and themes, the lexer,
+# file encoding and atomic saves, search helpers, export and the headless
+# batch mode behind "python nobu.py --batch". nobu.py imports from here, so
+# scripts and worker processes can use them without loading Tk.
+
+import time
+import re
+import os
+import sys
+import json
+import codecs
+import hashlib
+import shutil
+import tempfile
+import argparse
+import bisect
+import keyword
+import builtins
+import functools
+import fnmatch
+import html
+
+PYTHON_KEYWORDS = set(keyword.kwlist)
+PYTHON_BUILTINS = {name for name in dir(builtins) if not name.startswith('_')} - PYTHON_KEYWORDS
+
+# Languages by file extension
+LANGUAGE_EXTENSIONS = {
+    '.py': 'python',
+    '.html': 'html',
+    '.css': 'css',
+    '.js': 'javascript',
+    '.json': 'json'
+}
+
+def language_for(filename):
+    # The language of a file by its extension, Python for anything unknown
+    return LANGUAGE_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), 'python')
+
+def default_language_keywords():
+    # Highlighting rules per language; Nobu copies these into language_keywords
+    return {
+        'python': {
+            'keywords': PYTHON_KEYWORDS,
+            'builtins': PYTHON_BUILTINS,
+            'patterns': {
+                'keywords': r'\b(' + '|'.join(sorted(PYTHON_KEYWORDS)) + r')\b',
+                'builtin': r'\b(' + '|'.join(sorted(PYTHON_BUILTINS)) + r')\b',
+                'string': r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')',
+                'comment': r'(#.*$)',
+                'numbers': r'\b(\d+)\b'
+            },
+            'multiline': [
+                ('string', r'"""', r'(?<!\\)"""'),
+                ('string', r"'''", r"(?<!\\)'''")
+            ]
+        },
+        'html': {
+            'patterns': {
+                'tag': r'(</?[!\w:-]+|/?>)',
+                'attribute': r'\s([a-zA-Z-]+)=',
+                'string': r'(\".*?\"|\'.*?\')',
+                'comment': r'(<!--[\s\S]*?-->)'
+            },
+            'multiline': [
+                ('comment', r'<!--', r'-->')
+            ]
+        },
+        'css': {
+            'patterns': {
+                'selector': r'([^\{\}\n]+)\{',
+                'property': r'([\w-]+)(?=[ \t]*:)',
+                'value': r':[ \t]*([^;\n]+);',
+                'comment': r'(/\*[\s\S]*?\*/)',
+                'numbers': r'\b(\d+\.?\d*)\b'
+            },
+            'multiline': [
+                ('comment', r'/\*', r'\*/')
+            ]
+        },
+        'javascript': {
+            'patterns': {
+                'keywords': r'\b(function|var|let|const|if|else|for|while|do|switch|case|break|return|try|catch|finally|class|extends|new|this)\b',
+                'builtin': r'\b(console|document|window|Array|Object|String|Number|Boolean|Function|Symbol|RegExp)\b',
+                'string': r'(\".*?\"|\'.*?\'|`[\s\S]*?`)',
+                'comment': r'(/\*[\s\S]*?\*/|//.*$)',
+                'numbers': r'\b(\d+\.?\d*)\b'
+            },
+            'multiline': [
+                ('comment', r'/\*', r'\*/'),
+                ('string', r'`', r'(?<!\\)`')
+            ]
+        },
+        'json': {
+            'patterns': {
+                'string': r'(\".*?\")',
+                'numbers': r'\b(\d+\.?\d*)\b',
+                'keywords': r'\b(true|false|null)\b',
+                'punctuation': r'([\{\}\[\],:])'
+            }
+        }
+    }
+
+# Tags set by SemanticHighlighter, in increasing priority. 'identifier' and
+# 'fstring_field' are drawn in the plain foreground: they undo the regex
+# tags on names that only look like builtins and on the code inside f-strings
+SEMANTIC_TAGS = ('fstring_field', 'identifier', 'decorator', 'parameter', 'definition')
+
+# Token types whose theme key is spelled differently
+STYLE_ALIASES = {'keywords': 'keyword', 'numbers': 'number'}
+
+def resolve_style(theme, language_keywords):
+    """Precompute the widget colors and the tag options of every token type."""
+    token_types = set()
+    for spec in language_keywords.values():
+        token_types.update(spec['patterns'])
+        token_types.update(token_type for token_type, _, _ in spec.get('multiline', []))
+    token_types.update(SEMANTIC_TAGS)
+    fg = theme['fg']
+    tags = {}
+    for token_type in sorted(token_types):
+        color = theme.get(token_type) or theme.get(STYLE_ALIASES.get(token_type, token_type)) or fg
+        tags[token_type] = {'foreground': color}
+    tags['bracket_match'] = {'background': theme.get('bracket_match', '#c8e6c9')}
+    tags['bracket_mismatch'] = {'background': theme.get('bracket_mismatch', '#ffcdd2')}
+    return {
+        'bg': theme['bg'],
+        'fg': fg,
+        'cursor': theme.get('cursor', fg),
+        'gutter_bg': theme.get('gutter_bg', theme['bg']),
+        'gutter_fg': theme.get('gutter_fg', theme.get('comment', fg)),
+        'tags': tags,
+    }
+
+THEMES = {
+    "default": {
+        "bg": "white",
+        "fg": "black",
+        "keyword": "blue",
+        "builtin": "purple",
+        "string": "green",
+        "comment": "gray",
+        "number": "orange",
+        "tag": "#0000FF",
+        "attribute": "#FF00FF",
+        "selector": "#A0A000",
+        "property": "#00A0A0",
+        "value": "#0000A0",
+        "punctuation": "#808080",
+        "definition": "darkcyan",
+        "parameter": "#a0522d",
+        "decorator": "#808000",
+        "gutter_bg": "lightgray",
+        "gutter_fg": "black",
+        "bracket_match": "#c8e6c9",
+        "bracket_mismatch": "#ffcdd2"
+    },
+    "dark": {
+        "bg": "#282c34",
+        "fg": "#abb2bf",
+        "keyword": "#c678dd",
+        "builtin": "#61afef",
+        "string": "#98c379",
+        "comment": "#5c6370",
+        "number": "#d19a66",
+        "tag": "#61afef",
+        "attribute": "#c678dd",
+        "selector": "#98c379",
+        "property": "#56b6c2",
+        "value": "#61afef",
+        "punctuation": "#abb2bf",
+        "definition": "#61afef",
+        "parameter": "#e06c75",
+        "decorator": "#e5c07b",
+        "cursor": "#528bff",
+        "gutter_bg": "#21252b",
+        "gutter_fg": "#636d83",
+        "bracket_match": "#3e4451",
+        "bracket_mismatch": "#5c2b2e"
+    },
+    "light": {
+        "bg": "#f5f5f5",
+        "fg": "#333333",
+        "keyword": "#0000ff",
+        "builtin": "#800080",
+        "string": "#008000",
+        "comment": "#808080",
+        "number": "#ff8c00",
+        "tag": "#0000FF",
+        "attribute": "#FF00FF",
+        "selector": "#A0A000",
+        "property": "#00A0A0",
+        "value": "#0000A0",
+        "punctuation": "#808080",
+        "definition": "#795e26",
+        "parameter": "#a0522d",
+        "decorator": "#af00db",
+        "gutter_bg": "#e8e8e8",
+        "gutter_fg": "#999999",
+        "bracket_match": "#d7e8d0",
+        "bracket_mismatch": "#f5c6c6"
+    }
+}
+
+# Tk color names used by the built-in themes, with the values Tk gives them
+NAMED_COLORS = {
+    'white': '#ffffff',
+    'black': '#000000',
+    'blue': '#0000ff',
+    'purple': '#a020f0',
+    'green': '#00ff00',
+    'gray': '#bebebe',
+    'orange': '#ffa500',
+    'darkcyan': '#008b8b',
+    'lightgray': '#d3d3d3',
+}
+
+def hex_color(color, default='#000000'):
+    # '#rrggbb' for a '#rgb', '#rrggbb' or NAMED_COLORS color, else default
+    color = color.lower()
+    if re.fullmatch(r'#[0-9a-f]{6}', color):
+        return color
+    if re.fullmatch(r'#[0-9a-f]{3}', color):
+        return '#' + ''.join(c * 2 for c in color[1:])
+    return NAMED_COLORS.get(color, default)
+
+def theme_colors(theme, language_keywords):
+    # A theme as the colors export_highlighted takes, without Tk to name them
+    style = resolve_style(theme, language_keywords)
+    fg = hex_color(style['fg'], '#000000')
+    colors = {token_type: hex_color(options['foreground'], fg)
+              for token_type, options in style['tags'].items() if 'foreground' in options}
+    colors['bg'] = hex_color(style['bg'], '#ffffff')
+    colors['fg'] = fg
+    return colors
+
+class Lexer:
+    """Tokenizes a language in a single pass of one compiled regex.
+
+    Every pattern becomes a named group of one alternation. Groups are tried
+    in PRECEDENCE order (comments, then strings, then the remaining patterns
+    in declaration order), so a keyword inside a string is never a keyword.
+    Constructs listed under 'multiline' may run to the end of the text; the
+    index of the one still open is the lexer state carried into the next line.
+    """
+
+    PRECEDENCE = ('comment', 'string')
+
+    def __init__(self, spec):
+        patterns = spec['patterns']
+        multiline = spec.get('multiline', [])
+
+        self.token_types = list(patterns)
+        for token_type, _, _ in multiline:
+            if token_type not in self.token_types:
+                self.token_types.append(token_type)
+
+        ordered = [t for t in self.PRECEDENCE if t in self.token_types]
+        ordered += [t for t in self.token_types if t not in ordered]
+
+        alternatives = []
+        self.group_types = {}
+        for token_type in ordered:
+            for index, (multiline_type, opener, closer) in enumerate(multiline):
+                if multiline_type == token_type:
+                    alternatives.append(
+                        f'(?P<m{index}>{opener}(?:[\\s\\S]*?{closer}|(?P<open{index}>[\\s\\S]*\\Z)))'
+                    )
+                    self.group_types[f'm{index}'] = token_type
+            if token_type in patterns:
+                name = f't{len(self.group_types)}'
+                alternatives.append(f'(?P<{name}>{patterns[token_type]})')
+                self.group_types[name] = token_type
+
+        self.regex = re.compile('|'.join(alternatives), re.MULTILINE)
+        self.multiline = [(token_type, re.compile(closer)) for token_type, _, closer in multiline]
+
+    def lex(self, text, state=None):
+        """Return (line_starts, tokens, end_states) for text.
+
+        tokens are (token_type, start, end) offsets in order of start;
+        end_states[n] is the lexer state at the end of the n-th line of text.
+        """
+        line_starts = [0]
+        find = text.find
+        newline = find('\n')
+        while newline != -1:
+            line_starts.append(newline + 1)
+            newline = find('\n', newline + 1)
+
+        tokens = []
+        end_states = [None] * len(line_starts)
+        pos = 0
+
+        # Finish a construct left open before the start of text
+        if state is not None:
+            token_type, closer = self.multiline[state]
+            match = closer.search(text)
+            if not match:
+                end_states = [state] * len(line_starts)
+                return line_starts, [(token_type, 0, len(text))], end_states
+            pos = match.end()
+            tokens.append((token_type, 0, pos))
+            last_row = bisect.bisect_right(line_starts, pos - 1) - 1
+            end_states[:last_row] = [state] * last_row
+
+        group_types = self.group_types
+        for match in self.regex.finditer(text, pos):
+            start, end = match.span()
+            if start == end:
+                continue
+            name = match.lastgroup
+            tokens.append((group_types[name], start, end))
+            if name[0] != 'm':
+                continue
+
+            # Record which lines this construct leaves open; one that is
+            # never closed stays open through the end of the text
+            index = int(name[1:])
+            first_row = bisect.bisect_right(line_starts, start) - 1
+            if match.start(f'open{index}') != -1:
+                end_states[first_row:] = [index] * (len(line_starts) - first_row)
+                break
+            last_row = bisect.bisect_right(line_starts, end - 1) - 1
+            end_states[first_row:last_row] = [index] * (last_row - first_row)
+
+        return line_starts, tokens, end_states
+
+    def slices(self, text, state, first, size):
+        """Lex text, which starts at line first, in runs of at most size lines.
+
+        Each run is (first, last, end_states, ranges) where ranges maps every
+        token type to the flat list of Tk indices to pass to a single tag add.
+        Safe to call from a worker thread.
+        """
+        line_starts, tokens, end_states = self.lex(text, state)
+
+        def index(offset):
+            row = bisect.bisect_right(line_starts, offset) - 1
+            return f"{first + row}.{offset - line_starts[row]}"
+
+        runs = []
+        count = len(line_starts)
+        position = 0
+        carry = None
+        for row in range(0, count, size):
+            row_last = min(row + size, count) - 1
+            low = line_starts[row]
+            high = line_starts[row_last + 1] - 1 if row_last + 1 < count else len(text)
+
+            pending = [carry] if carry else []
+            carry = None
+            while position < len(tokens) and tokens[position][1] < high:
+                pending.append(tokens[position])
+                position += 1
+
+            ranges = {token_type: [] for token_type in self.token_types}
+            for token in pending:
+                token_type, start, end = token
+                # A token running past this run continues in the next one
+                if end > high:
+                    carry = token
+                start, end = max(start, low), min(end, high)
+                if start < end:
+                    ranges[token_type] += (index(start), index(end))
+
+            runs.append((first + row, first + row_last, end_states[row:row_last + 1], ranges))
+        return runs
+
+def detect_encoding(data):
+    # Files are UTF-8 unless they start with a byte order mark
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    return 'utf-8'
+
+def detect_newline(text):
+    # The first line ending decides the style; None until one is seen
+    cr = text.find('\r')
+    lf = text.find('\n')
+    if cr == -1 and lf == -1:
+        return None
+    if cr != -1 and (lf == -1 or cr < lf):
+        return '\r\n' if text.startswith('\n', cr + 1) else '\r'
+    return '\n'
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def write_atomically(filename, chunks, encoding='utf-8', newline=None, skip_hash=None):
+    """Stream text chunks into filename without ever leaving it half written.
+
+    The chunks are encoded into a temp file in the same directory, which is
+    fsynced and renamed over the target. Returns the hash of the bytes
+    written, or None when they hash to skip_hash and the target was left
+    untouched.
+    """
+    target = os.path.realpath(filename)
+    directory = os.path.dirname(target)
+    newline = newline or os.linesep
+    encoder = codecs.getincrementalencoder(encoding)()
+    digest = hashlib.blake2b(digest_size=16)
+
+    fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix='.tmp', dir=directory)
+    try:
+        with open(fd, 'wb') as f:
+            for chunk in chunks:
+                if newline != '\n':
+                    chunk = chunk.replace('\n', newline)
+                data = encoder.encode(chunk)
+                digest.update(data)
+                f.write(data)
+            data = encoder.encode('', True)
+            digest.update(data)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        written_hash = digest.hexdigest()
+        if written_hash == skip_hash and os.path.exists(target):
+            os.remove(temp)
+            return None
+
+        # Keep the permissions of the file being replaced
+        if os.path.exists(target):
+            shutil.copymode(target, temp)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp, 0o666 & ~umask)
+        os.replace(temp, target)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable where the platform allows it
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    return written_hash
+
+def iter_line_blocks(chunks, block_lines):
+    # Regroup text chunks into blocks of block_lines or more whole lines;
+    # only the last block may end without a newline
+    pending = []
+    pending_lines = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_lines += chunk.count('\n')
+        if pending_lines < block_lines:
+            continue
+        text = ''.join(pending)
+        cut = text.rfind('\n') + 1
+        yield text[:cut]
+        pending = [text[cut:]]
+        pending_lines = 0
+    text = ''.join(pending)
+    if text:
+        yield text
+
+def read_text(path, size=1024 * 1024):
+    """Yield the text of the file at path in pieces, with newlines as \\n.
+
+    Decoded as Nobu opens files, see detect_encoding; raises
+    UnicodeDecodeError for anything else.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(size)
+        decoder = codecs.getincrementaldecoder(detect_encoding(data))()
+        carry = ''
+        while True:
+            final = not data
+            text = carry + decoder.decode(data, final)
+            carry = ''
+            if text.endswith('\r') and not final:
+                carry, text = '\r', text[:-1]  # it may be half a \r\n
+            if text:
+                yield text.replace('\r\n', '\n').replace('\r', '\n')
+            if final:
+                break
+            data = f.read(size)
+
+EXPORT_FORMATS = {
+    'html': ("HTML", ".html"),
+    'ansi': ("ANSI Text", ".ans"),
+}
+
+def _hex_rgb(color):
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+def export_highlighted(chunks, lexer, colors, fmt='html', title='', block_lines=2000):
+    """Render source text as self-contained HTML or ANSI colored text.
+
+    chunks yields the source in pieces of any size; the output is yielded
+    the same way. colors maps 'bg', 'fg' and token types to '#rrggbb'. The
+    source is lexed block_lines whole lines at a time with the lexer state
+    carried over, as SyntaxHighlighter does, so memory stays bounded by the
+    block size however long the source is. Safe to call from a worker
+    thread.
+    """
+    token_colors = {token_type: color for token_type, color in colors.items() if token_type not in ('bg', 'fg')}
+    if fmt == 'html':
+        escape = functools.partial(html.escape, quote=False)
+        rules = [f".t-{token_type} {{ color: {color}; }}" for token_type, color in sorted(token_colors.items())]
+        yield ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+               f'<title>{escape(title)}</title>\n<style>\n'
+               f'body {{ margin: 0; background: {colors["bg"]}; color: {colors["fg"]}; }}\n'
+               'pre { margin: 0; padding: 1em; font-family: Consolas, Menlo, monospace; }\n'
+               + '\n'.join(rules) + '\n</style>\n</head>\n<body>\n<pre>')
+        opening = {token_type: f'<span class="t-{token_type}">' for token_type in token_colors}
+        closing = '</span>'
+    else:
+        escape = lambda text: text
+        opening = {token_type: '\x1b[38;2;%d;%d;%dm' % _hex_rgb(color) for token_type, color in token_colors.items()}
+        closing = '\x1b[39m'
+
+    def render(text, state):
+        _, tokens, end_states = lexer.lex(text, state)
+        parts = []
+        position = 0
+        for token_type, start, end in tokens:
+            if start > position:
+                parts.append(escape(text[position:start]))
+            token = escape(text[start:end])
+            if token_type in opening:
+                # Reopened on every line, so each line reads on its own
+                on = opening[token_type]
+                token = '\n'.join(on + part + closing if part else '' for part in token.split('\n'))
+            parts.append(token)
+            position = end
+        parts.append(escape(text[position:]))
+        return ''.join(parts), end_states[-1]
+
+    state = None
+    for text in iter_line_blocks(chunks, block_lines):
+        rendered, state = render(text, state)
+        yield rendered
+    if fmt == 'html':
+        yield '</pre>\n</body>\n</html>\n'
+
+# Skipped by Find in Files and the batch mode unless configured otherwise
+SEARCH_IGNORE = ['.git/', '.hg/', '.svn/', '__pycache__/', 'node_modules/',
+                 '.venv/', 'venv/', '*.pyc', '*.min.js']
+
+def search_source(pattern, regex=False, whole_word=False):
+    source = pattern if regex else re.escape(pattern)
+    if whole_word:
+        source = rf'(?<!\w)(?:{source})(?!\w)'
+    return source
+
+def search_flags(case_sensitive=True):
+    return re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+
+def compile_search(pattern, regex=False, case_sensitive=True, whole_word=False):
+    # Raises re.error for an invalid regular expression
+    return re.compile(search_source(pattern, regex, whole_word), search_flags(case_sensitive))
+
+def load_ignore_patterns(root, patterns):
+    # Configured patterns plus the simple entries of the root .gitignore;
+    # negated entries are not supported and are skipped
+    patterns = list(patterns)
+    try:
+        with open(os.path.join(root, '.gitignore'), 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(('#', '!')):
+                    patterns.append(line.lstrip('/'))
+    except OSError:
+        pass
+    return patterns
+
+def is_ignored(name, relative_path, is_dir, patterns):
+    for pattern in patterns:
+        if pattern.endswith('/'):
+            if not is_dir:
+                continue
+            pattern = pattern[:-1]
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern):
+            return True
+    return False
+
+def iter_search_files(root, patterns):
+    # Yield (path, size) for every file under root that the patterns let through
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            entries = list(os.scandir(os.path.join(root, relative_dir)))
+        except OSError:
+            continue
+        entries.sort(key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            relative_path = os.path.join(relative_dir, entry.name).replace(os.sep, '/')
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored(entry.name, relative_path, True, patterns):
+                        subdirs.append(relative_path)
+                elif entry.is_file() and not is_ignored(entry.name, relative_path, False, patterns):
+                    yield entry.path, entry.stat().st_size
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+# Batch mode: python nobu.py --batch [options] paths...
+
+BATCH_BLOCK_LINES = 2000
+
+@functools.lru_cache(maxsize=None)
+def batch_lexer(language):
+    # One lexer per language for the life of a worker process
+    return Lexer(default_language_keywords()[language])
+
+def batch_file(path, relative, options):
+    """Count, search, replace in and export one file for batch_main.
+
+    Runs in a worker process and returns a dict for the JSON output. Counting
+    and export stream the file BATCH_BLOCK_LINES lines at a time; find and
+    replace read it whole, as the editor would.
+    """
+    result = {'path': path}
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(8192)
+        if b'\0' in head:
+            result['skipped'] = 'binary'
+            return result
+        language = options['language'] or language_for(path)
+        result['language'] = language
+        lexer = batch_lexer(language)
+
+        if options['count']:
+            lines = 0
+            chars = 0
+            tokens = {}
+            state = None
+            last = '\n'
+            for text in iter_line_blocks(read_text(path), BATCH_BLOCK_LINES):
+                lines += text.count('\n')
+                chars += len(text)
+                last = text[-1:] or last
+                _, found, end_states = lexer.lex(text, state)
+                state = end_states[-1]
+                for token_type, _, _ in found:
+                    tokens[token_type] = tokens.get(token_type, 0) + 1
+            # A final line without a newline still counts
+            if last != '\n':
+                lines += 1
+            result.update(lines=lines, chars=chars, tokens=tokens)
+
+        if options['find'] is not None:
+            regex = compile_search(options['find'], options['regex'], not options['ignore_case'],
+                                   options['whole_word'])
+            with open(path, 'rb') as f:
+                data = f.read()
+            encoding = detect_encoding(data)
+            text = data.decode(encoding)
+            newline = detect_newline(text)
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            if options['replace'] is None:
+                matches = []
+                count = 0
+                line = 1
+                position = 0
+                for match in regex.finditer(text):
+                    count += 1
+                    if len(matches) < options['max_matches']:
+                        start = match.start()
+                        line += text.count('\n', position, start)
+                        position = start
+                        line_start = text.rfind('\n', 0, start) + 1
+                        line_end = text.find('\n', start)
+                        if line_end == -1:
+                            line_end = len(text)
+                        matches.append([line, start - line_start, text[line_start:min(line_end, line_start + 300)]])
+                result.update(found=count, matches=matches)
+            else:
+                replacement = options['replace']
+                if not options['regex']:
+                    replacement = lambda match, literal=replacement: literal
+                text, count = regex.subn(replacement, text)
+                result['replaced'] = count
+                if count and options['write']:
+                    write_atomically(path, [text], encoding, newline)
+                    result['written'] = True
+
+        if options['export']:
+            extension = EXPORT_FORMATS[options['export']][1]
+            if options['output_dir']:
+                target = os.path.join(options['output_dir'], relative) + extension
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            else:
+                target = path + extension
+            colors = theme_colors(options['theme'], default_language_keywords())
+            write_atomically(target, export_highlighted(
+                read_text(path), lexer, colors, options['export'], os.path.basename(path), BATCH_BLOCK_LINES
+            ), 'utf-8', '\n')
+            result['output'] = target
+    except (OSError, UnicodeDecodeError, re.error) as e:
+        result['error'] = str(e)
+    return result
+
+def _batch_job(job):
+    return batch_file(*job)
+
+def iter_batch_files(paths, any_language=False):
+    # Yield (path, relative path) for every file named or found under a
+    # named folder; files in folders must have a known extension unless
+    # any_language, and ignored ones are skipped as in Find in Files
+    for root in paths:
+        if not os.path.isdir(root):
+            yield root, os.path.basename(root)
+            continue
+        for path, size in iter_search_files(root, load_ignore_patterns(root, SEARCH_IGNORE)):
+            if any_language or os.path.splitext(path)[1].lower() in LANGUAGE_EXTENSIONS:
+                yield path, os.path.relpath(path, root)
+
+def batch_main(argv=None):
+    """Run the batch mode; prints a JSON line per file, then a summary line.
+
+    Returns the exit status: 0, or 1 if any file failed. Files are spread
+    over a pool of worker processes unless there is only one file or one job.
+    """
+    parser = argparse.ArgumentParser(
+        prog='nobu.py --batch',
+        description="Count, search, replace in and export files without opening the editor. "
+                    "Prints one JSON object per file and then a summary, one per line."
+    )
+    parser.add_argument('--batch', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='+', help='files, and folders to search for files in')
+    parser.add_argument('--language', choices=sorted(default_language_keywords()),
+                        help='language of every file, instead of telling it by extension')
+    parser.add_argument('--count', action='store_true',
+                        help='count lines, characters and tokens (the default with no other action)')
+    parser.add_argument('--export', choices=sorted(EXPORT_FORMATS), help='write a highlighted copy of each file')
+    parser.add_argument('--output-dir', help='where exports go (default: next to each file)')
+    parser.add_argument('--theme', default='dark', choices=sorted(THEMES), help='export theme (default: %(default)s)')
+    parser.add_argument('--find', metavar='PATTERN', help='text to search for')
+    parser.add_argument('--replace', metavar='TEXT', help='replace what --find matches with this')
+    parser.add_argument('--regex', action='store_true', help='--find is a regular expression')
+    parser.add_argument('--ignore-case', action='store_true')
+    parser.add_argument('--whole-word', action='store_true')
+    parser.add_argument('--write', action='store_true', help='save replacements; without it they are only counted')
+    parser.add_argument('--max-matches', type=int, default=100, help='matches listed per file (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.replace is not None and args.find is None:
+        parser.error('--replace needs --find')
+    if args.find is not None:
+        try:
+            compile_search(args.find, args.regex, not args.ignore_case, args.whole_word)
+        except re.error as e:
+            parser.error(f"invalid regular expression: {e}")
+    options = {
+        'language': args.language,
+        'count': args.count or not (args.export or args.find is not None),
+        'export': args.export,
+        'output_dir': args.output_dir and os.path.abspath(args.output_dir),
+        'theme': THEMES[args.theme],
+        'find': args.find,
+        'replace': args.replace,
+        'regex': args.regex,
+        'ignore_case': args.ignore_case,
+        'whole_word': args.whole_word,
+        'write': args.write,
+        'max_matches': args.max_matches,
+    }
+
+    started = time.perf_counter()
+    jobs = [(path, relative, options) for path, relative in iter_batch_files(args.paths, args.language)]
+    workers = max(1, min(args.jobs, len(jobs)))
+    summary = {'files': 0, 'errors': 0, 'skipped': 0, 'workers': workers}
+    totals = ('lines', 'chars', 'found', 'replaced')
+
+    def emit(result):
+        summary['files'] += 1
+        summary['errors'] += 'error' in result
+        summary['skipped'] += 'skipped' in result
+        for key in totals:
+            if key in result:
+                summary[key] = summary.get(key, 0) + result[key]
+        sys.stdout.write(json.dumps(result) + '\n')
+
+    if workers == 1:
+        for job in jobs:
+            emit(batch_file(*job))
+    else:
+        # Spawned workers import only this module, never nobu.py or Tk
+        import multiprocessing
+        chunksize = max(1, min(64, len(jobs) // (workers * 8)))
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            for result in pool.imap_unordered(_batch_job, jobs, chunksize):
+                emit(result)
+    seconds = time.perf_counter() - started
+    summary['seconds'] = round(seconds, 3)
+    summary['files_per_second'] = round(summary['files'] / seconds, 1) if seconds else None
+    sys.stdout.write(json.dumps({'summary': summary}) + '\n')
+    sys.stdout.flush()
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(batch_main())
@@ -0,0 +1,139 @@
+"""Tests for Document, the headless mirror of a CodeTab's text.
+
+Run with python -m pytest or python -m unittest from the repository root;
+no display is needed.
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nobu import Document
+
+EMOJI = '\U0001F600'
+
+def tk_columns(text):
+    # Columns as Tcl 8.6 counts them: two for a character outside the BMP
+    return sum(2 if char > '\uffff' else 1 for char in text)
+
+def reference_position(text, offset):
+    line = text.count('\n', 0, offset) + 1
+    start = text.rfind('\n', 0, offset) + 1
+    return line, tk_columns(text[start:offset])
+
+class DocumentTest(unittest.TestCase):
+
+    def setUp(self):
+        # Small pieces so that edits split and merge many nodes
+        self.piece_size = Document.PIECE_SIZE
+        Document.PIECE_SIZE = 8
+        self.surrogates = Document.SURROGATE_COLUMNS
+        Document.SURROGATE_COLUMNS = True
+
+    def tearDown(self):
+        Document.PIECE_SIZE = self.piece_size
+        Document.SURROGATE_COLUMNS = self.surrogates
+
+    def assertMirrors(self, document, text):
+        self.assertEqual(document.get(), text)
+        self.assertEqual(len(document), len(text))
+        self.assertEqual(document.line_count(), text.count('\n') + 1)
+        self.assertEqual(''.join(document.chunks(size=5)), text)
+
+    def test_build_and_get(self):
+        text = 'first line\nsecond\n\nlast'
+        document = Document(text)
+        self.assertMirrors(document, text)
+        self.assertEqual(document.get(6, 16), text[6:16])
+        self.assertEqual(document.get_lines(2, 3), 'second\n')
+        self.assertEqual(document.get_lines(4, 4), 'last')
+        self.assertMirrors(Document(), '')
+
+    def test_insert_delete_replace(self):
+        document = Document('hello world')
+        document.insert(5, ',')
+        document.insert(len(document), '!\n')
+        document.delete(0, 1)
+        document.replace(0, 4, 'HELL')
+        self.assertMirrors(document, 'HELL, world!\n')
+
+    def test_line_offsets(self):
+        text = 'a\nbc\n\ndef\n'
+        document = Document(text)
+        for line, offset in enumerate([0, 2, 5, 6, 10], 1):
+            self.assertEqual(document.line_offset(line), offset)
+            self.assertEqual(document.offset(line), offset)
+        self.assertEqual(document.offset(4, 2), 8)
+        for offset in range(len(text) + 1):
+            self.assertEqual(document.position(offset), reference_position(text, offset))
+
+    def test_columns_outside_the_bmp(self):
+        # Tk counts the emoji as two columns, so 'b' is at 1.3
+        text = f"a{EMOJI}b\nx{EMOJI}{EMOJI}y"
+        document = Document(text)
+        self.assertEqual(document.offset(1, 1), 1)
+        self.assertEqual(document.offset(1, 3), 2)
+        self.assertEqual(document.offset(2, 5), 7)
+        self.assertEqual(document.position(2), (1, 3))
+        self.assertEqual(document.position(7), (2, 5))
+        self.assertEqual(document.position(len(text)), (2, 6))
+
+    def test_on_edit_after_emoji(self):
+        document = Document(f"x = '{EMOJI}'  # smile\n")
+        # Tk reports the comment as starting at 1.10, not 1.9
+        document.on_edit((1, 10), (1, 17), '# grin')
+        self.assertMirrors(document, f"x = '{EMOJI}'  # grin\n")
+        document.on_edit((1, 5), (1, 7), '')
+        self.assertMirrors(document, "x = ''  # grin\n")
+
+    def test_columns_as_code_points(self):
+        Document.SURROGATE_COLUMNS = False
+        document = Document(f"a{EMOJI}b")
+        self.assertEqual(document.offset(1, 2), 2)
+        self.assertEqual(document.position(2), (1, 2))
+
+    def test_snapshot_is_unaffected_by_edits(self):
+        document = Document('one\ntwo\n')
+        snapshot = document.snapshot()
+        document.insert(0, 'zero\n')
+        document.delete(len(document) - 4, len(document))
+        self.assertMirrors(snapshot, 'one\ntwo\n')
+        self.assertMirrors(document, 'zero\none\n')
+
+    def test_repeated_inserts_stay_shallow(self):
+        # Split pieces used to keep or outrank their parent's priority,
+        # which turned repeated inserts into one piece into a list
+        Document.PIECE_SIZE = 4096
+        document = Document('x' * 4000)
+        for _ in range(5000):
+            document.insert(2000, 'y' * 200)
+
+        def depth(node):
+            return 0 if node is None else 1 + max(depth(node.left), depth(node.right))
+        self.assertLess(depth(document.root), 60)
+        self.assertEqual(len(document), 4000 + 5000 * 200)
+
+    def test_random_edits_match_a_string(self):
+        rng = random.Random(7)
+        alphabet = ['a', 'b', ' ', '\n', EMOJI, 'é']
+        text = ''
+        document = Document()
+        for _ in range(2000):
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, min(len(text), start + 12))
+            inserted = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+            # Edits arrive as Tk positions, like the text proxy reports them
+            document.on_edit(reference_position(text, start), reference_position(text, end), inserted)
+            text = text[:start] + inserted + text[end:]
+            if rng.random() < 0.05:
+                self.assertMirrors(document, text)
+        self.assertMirrors(document, text)
+        for offset in range(0, len(text) + 1, 7):
+            position = reference_position(text, offset)
+            self.assertEqual(document.position(offset), position)
+            self.assertEqual(document.offset(*position), offset)
+
+if __name__ == '__main__':
+    unittest.main()
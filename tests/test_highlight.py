@@ -0,0 +1,213 @@
+"""Tests for SyntaxHighlighter's incremental re-lexing.
+
+The highlighter only needs a handful of text widget methods, so these run
+against FakeText and need no display.
+"""
+import os
+import random
+import sys
+import unittest
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nobu import SyntaxHighlighter, HighlightScheduler, Lexer, default_language_keywords
+
+KEYWORDS = default_language_keywords()
+
+class FakeText:
+    """The parts of a Tk text widget SyntaxHighlighter uses, tags by character."""
+
+    def __init__(self, text):
+        self.lines = text.split('\n')
+        self.tags = {}
+        self.callbacks = []
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def position(self, index):
+        if index in ('end', 'end-1c'):
+            return len(self.lines), len(self.lines[-1])
+        line, column = index.split('.')
+        line = int(line)
+        if column == 'end':
+            return line, len(self.lines[line - 1])
+        return line, int(column)
+
+    def offset(self, index):
+        line, column = self.position(index)
+        return sum(len(text) + 1 for text in self.lines[:line - 1]) + column
+
+    def index(self, index):
+        return '%d.%d' % self.position(index)
+
+    def get(self, start, end):
+        return self.text()[self.offset(start):self.offset(end)]
+
+    def tag_config(self, tag, **options):
+        self.tags.setdefault(tag, set())
+
+    def tag_add(self, tag, *indices):
+        tagged = self.tags.setdefault(tag, set())
+        for start, end in zip(indices[::2], indices[1::2]):
+            tagged.update(range(self.offset(start), self.offset(end)))
+
+    def tag_remove(self, tag, start, end):
+        tagged = self.tags.setdefault(tag, set())
+        tagged.difference_update(range(self.offset(start), self.offset(end)))
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def after_cancel(self, callback):
+        self.callbacks.remove(callback)
+
+    def run_callbacks(self):
+        # Run what was scheduled with after until nothing is left, ignoring
+        # the delays
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+    def edit(self, start, end, text):
+        # Replace the text between two (line, column) positions, then report
+        # the edit the way the text proxy does
+        whole = self.text()
+        low, high = (self.offset('%d.%d' % position) for position in (start, end))
+        self.lines = (whole[:low] + text + whole[high:]).split('\n')
+        # Tags move with the text after the edit, as in Tk
+        shift = len(text) - (high - low)
+        for tag, tagged in self.tags.items():
+            self.tags[tag] = {offset if offset < low else offset + shift
+                              for offset in tagged if not low <= offset < high}
+        return start, end, text
+
+def make_highlighter(text, language='javascript'):
+    text_area = FakeText(text)
+    lexers = {}
+
+    def get_lexer(language):
+        if language not in lexers:
+            lexers[language] = Lexer(KEYWORDS[language])
+        return lexers[language]
+
+    master = SimpleNamespace(
+        get_lexer=get_lexer, get_style=lambda: {'tags': {}, 'fg': '#000000'},
+        highlight_pool=SimpleNamespace(submit=submit), token_cache=SimpleNamespace(store=lambda tab: None),
+    )
+    tab = SimpleNamespace(master=master, text_area=text_area, current_language=language, highlight_listeners=[])
+    tab.highlighter = SyntaxHighlighter(tab)
+    return tab.highlighter
+
+def submit(function, *args):
+    # The worker pool, run on the calling thread
+    future = Future()
+    future.set_result(function(*args))
+    return future
+
+def tagged(highlighter, tag):
+    # Line numbers with at least one character carrying tag
+    text_area = highlighter.text_area
+    starts = [0]
+    for line in text_area.lines:
+        starts.append(starts[-1] + len(line) + 1)
+    return {line for line in range(1, len(starts))
+            if any(offset in text_area.tags.get(tag, ()) for offset in range(starts[line - 1], starts[line] - 1))}
+
+def source(line_count):
+    return ''.join(f"var value{row} = {row} + count;\n" for row in range(1, line_count))
+
+# Fragments that open and close comments and strings across lines
+FRAGMENTS = {
+    'javascript': ['/*', '*/', '"', "'", '`', '//', '\\', '\n', 'x', ' ', 'if', '1'],
+    'python': ['"""', "'''", '"', "'", '#', '\\', '\n', 'x', ' ', 'def', '1'],
+}
+
+def scatter(rng, highlighter, count):
+    # Make count edits at random places, as a burst of typing would
+    text_area = highlighter.text_area
+    fragments = FRAGMENTS[highlighter.tab.current_language]
+    for _ in range(count):
+        line = rng.randint(1, len(text_area.lines))
+        column = rng.randint(0, len(text_area.lines[line - 1]))
+        end = (line, column)
+        if rng.random() < 0.3:
+            end_line = min(len(text_area.lines), line + rng.randint(0, 2))
+            low = column if end_line == line else 0
+            end = (end_line, rng.randint(low, max(low, len(text_area.lines[end_line - 1]))))
+        text = ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 3)))
+        highlighter.on_edit(*text_area.edit((line, column), end, text))
+
+class HighlightTest(unittest.TestCase):
+
+    def edit(self, highlighter, start, end, text):
+        highlighter.on_edit(*highlighter.text_area.edit(start, end, text))
+
+    def assertMatchesFullLex(self, highlighter):
+        fresh = make_highlighter(highlighter.text_area.text(), highlighter.tab.current_language)
+        self.assertTrue(fresh.highlight_dirty())
+        self.assertEqual(highlighter.line_states, fresh.line_states)
+        # Newlines are left out: a run never tags the one after its last line,
+        # so whether they carry a tag depends on where runs were cut
+        text = highlighter.text_area.text()
+        newlines = {offset for offset, char in enumerate(text) if char == '\n'}
+        for tag in set(fresh.text_area.tags) | set(highlighter.text_area.tags):
+            self.assertEqual(highlighter.text_area.tags.get(tag, set()) - newlines,
+                             fresh.text_area.tags.get(tag, set()) - newlines, tag)
+
+    def test_two_dirty_regions_in_one_chunk(self):
+        highlighter = make_highlighter(source(200))
+        self.assertTrue(highlighter.highlight_dirty())
+        # A harmless edit at line 10 used to settle the whole run, so the
+        # comment opened at line 50 stopped at the end of the chunk
+        self.edit(highlighter, (10, 4), (10, 9), 'other')
+        self.edit(highlighter, (50, 0), (50, 0), '/* open')
+        self.assertTrue(highlighter.highlight_dirty())
+        comment = tagged(highlighter, 'comment')
+        self.assertIn(60, comment)
+        self.assertIn(150, comment)
+        self.assertNotIn(10, comment)
+        self.assertMatchesFullLex(highlighter)
+
+    def test_scattered_edits_match_a_full_lex(self):
+        for language, seed in (('javascript', 1), ('python', 2)):
+            rng = random.Random(seed)
+            highlighter = make_highlighter(source(300), language)
+            self.assertTrue(highlighter.highlight_dirty())
+            for _ in range(40):
+                scatter(rng, highlighter, rng.randint(1, 6))
+                self.assertTrue(highlighter.highlight_dirty())
+                self.assertMatchesFullLex(highlighter)
+
+    def test_passes_cut_short_match_a_full_lex(self):
+        rng = random.Random(3)
+        highlighter = make_highlighter(source(300))
+        self.assertTrue(highlighter.highlight_dirty())
+        for _ in range(20):
+            scatter(rng, highlighter, rng.randint(1, 6))
+            while not highlighter.highlight_dirty(max_lines=40):
+                pass
+            self.assertMatchesFullLex(highlighter)
+
+    def test_scheduler_rounds_match_a_full_lex(self):
+        # Small rounds and slices, so that dirty regions span several of each
+        rng = random.Random(4)
+        highlighter = make_highlighter(source(300))
+        scheduler = HighlightScheduler(highlighter.tab)
+        scheduler.SYNC_LINES = 0
+        scheduler.ROUND_LINES = 100
+        scheduler.SLICE_LINES = 16
+        text_area = highlighter.text_area
+        scheduler.run()
+        text_area.run_callbacks()
+        for _ in range(20):
+            scatter(rng, highlighter, rng.randint(1, 6))
+            scheduler.schedule()
+            text_area.run_callbacks()
+            self.assertIsNone(highlighter.dirty_first)
+            self.assertMatchesFullLex(highlighter)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Tests for search_files, the Find in Files worker.
+
+Run with python -m pytest or python -m unittest from the repository root;
+no display is needed.
+"""
+import codecs
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nobu
+from nobu import search_files, search_source, search_flags
+
+def write(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+class SearchFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sizes = nobu.SEARCH_WHOLE_BYTES, nobu.SEARCH_WINDOW_BYTES
+
+    def tearDown(self):
+        nobu.SEARCH_WHOLE_BYTES, nobu.SEARCH_WINDOW_BYTES = self.sizes
+        self.directory.cleanup()
+
+    def search(self, paths, pattern, regex=False, case_sensitive=True, whole_word=False, **options):
+        source = search_source(pattern, regex, whole_word)
+        return search_files(paths, source, search_flags(case_sensitive), **options)
+
+    def test_matches_as_in_the_editor(self):
+        path = write(self.directory.name, 'a.py', 'größe = 1\r\nnaïve = GRÖßE\r\n# naïvety\r\n'.encode('utf-8'))
+        self.assertEqual(self.search([path], 'größe', case_sensitive=False),
+                         [(path, 1, 0, 'größe = 1'), (path, 2, 8, 'naïve = GRÖßE')])
+        self.assertEqual(self.search([path], 'naïve', whole_word=True), [(path, 2, 0, 'naïve = GRÖßE')])
+        self.assertEqual(self.search([path], r'\N{DIGIT ONE}$', regex=True), [(path, 1, 8, 'größe = 1')])
+
+    def test_skips_binary_and_empty_files(self):
+        binary = write(self.directory.name, 'b.bin', b'abc\0abc')
+        empty = write(self.directory.name, 'c.txt', b'')
+        self.assertEqual(self.search([binary, empty], 'abc'), [])
+
+    def test_mapped_files_match_files_read_whole(self):
+        lines = [f"line {row} {'naïve ' * (row % 7)}end" for row in range(3000)]
+        text = '\r\n'.join(lines) + '\r\n'
+        paths = [
+            write(self.directory.name, 'utf8.txt', text.encode('utf-8')),
+            write(self.directory.name, 'bom.txt', codecs.BOM_UTF8 + text.encode('utf-8')),
+            write(self.directory.name, 'utf16.txt', text.encode('utf-16')),
+        ]
+        cases = [('naïve end', False), (r'^line \d+5 ', True), (r'end$', True)]
+        expected = [self.search(paths, pattern, regex, max_matches=10000) for pattern, regex in cases]
+        self.assertTrue(all(expected))
+        nobu.SEARCH_WHOLE_BYTES = 0
+        nobu.SEARCH_WINDOW_BYTES = 1000
+        for (pattern, regex), results in zip(cases, expected):
+            self.assertEqual(self.search(paths, pattern, regex, max_matches=10000), results, pattern)
+
+    def test_lines_longer_than_a_window(self):
+        # Cut between windows, but columns still count from the line start
+        path = write(self.directory.name, 'long.txt', b'a\n' + b'x' * 2500 + b'mark' + b'y' * 2500 + b'\nmark\n')
+        nobu.SEARCH_WHOLE_BYTES = 0
+        nobu.SEARCH_WINDOW_BYTES = 1000
+        results = self.search([path], 'mark')
+        self.assertEqual([(line, column) for _, line, column, _ in results], [(2, 2500), (3, 0)])
+
+    def test_max_matches(self):
+        path = write(self.directory.name, 'd.txt', b'a\n' * 100)
+        self.assertEqual(len(self.search([path], 'a', max_matches=7)), 7)
+        nobu.SEARCH_WHOLE_BYTES = 0
+        nobu.SEARCH_WINDOW_BYTES = 16
+        self.assertEqual(len(self.search([path], 'a', max_matches=7)), 7)
+
+if __name__ == '__main__':
+    unittest.main()